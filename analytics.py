@@ -0,0 +1,233 @@
+"""Statistics over the papers found, from columns of numpy arrays.
+    python3 analytics.py /path/to/NExT_papers/my_prefix_
+"""
+import sys
+import numpy as np
+import tools
+import next_papers
+
+# stand ins for missing values in integer columns
+MISSING = -1
+PAPER_COLUMNS = ["keys", "eprints", "year", "month", "journal_codes",
+                 "last_update", "detected", "is_next"]
+
+
+def author_name(name):
+    """Names in the "I. Last" form KnownAuthors uses,
+    whether they are written "First Last" or "Last, First" """
+    if ',' in name:
+        last, first = name.split(',', 1)
+        name = first + " " + last
+    return next_papers.KnownAuthors.normalise(name)
+
+
+def _encode(value, codes):
+    """Number values in the order they are first seen"""
+    return codes.setdefault(value, len(codes))
+
+
+class PaperTable:
+    """The papers of one or more Bibliography as columns,
+    one row per paper;
+        keys, eprints    str arrays
+        year, month      ints, MISSING if not known
+        journal_codes    index into journals, MISSING if there is none
+        last_update      datetime64[s], NaT if not known
+        detected         datetime64[s] of when the paper was found, NaT if not known
+        is_next          bool
+    and authors as a paper x author incidence matrix, in compressed sparse rows;
+    the authors of paper i are author_names[author_indices[author_ptr[i]:author_ptr[i+1]]]
+    """
+    def __init__(self, columns, journals, author_names, author_ptr,
+                 author_indices, author_membership=None):
+        for name in PAPER_COLUMNS:
+            setattr(self, name, columns[name])
+        self.journals = journals
+        self.author_names = author_names
+        self.author_ptr = author_ptr
+        self.author_indices = author_indices
+        if author_membership is None:
+            author_membership = np.full(len(author_names), "", dtype=str)
+        # "yes", "no", "maybe" or "" for authors not in the authors file
+        self.author_membership = author_membership
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_bibliographies(cls, bibliographies, is_next=None,
+                            known_authors=None):
+        """One table of the papers in a list of Bibliography.
+        is_next gives a bool for each Bibliography, default all True.
+        If a KnownAuthors is given, author_membership is filled in"""
+        if is_next is None:
+            is_next = [True]*len(bibliographies)
+        rows = {name: [] for name in PAPER_COLUMNS}
+        journal_codes, author_codes = {}, {}
+        author_ptr, author_indices = [0], []
+        for bibliography, in_next in zip(bibliographies, is_next):
+            for key, entry in bibliography.items():
+                fields = entry.fields
+                rows["keys"].append(key)
+                rows["eprints"].append(fields.get("eprint", ""))
+                rows["year"].append(_to_int(fields.get("year")))
+                rows["month"].append(_to_month(fields.get("month")))
+                journal = fields.get("journal")
+                rows["journal_codes"].append(
+                    MISSING if journal is None else _encode(journal, journal_codes))
+                rows["last_update"].append(fields.get("last_update", "NaT"))
+                rows["detected"].append(fields.get("detected", "NaT"))
+                rows["is_next"].append(in_next)
+                names = [name.strip() for name in fields.get("author", "").split(" and ")]
+                # dict as an ordered set, authors are sometimes repeated
+                codes = dict.fromkeys(_encode(author_name(name), author_codes)
+                                      for name in names if name)
+                author_indices += codes
+                author_ptr.append(len(author_indices))
+        columns = {"keys": np.array(rows["keys"], dtype=str),
+                   "eprints": np.array(rows["eprints"], dtype=str),
+                   "year": np.array(rows["year"], dtype=np.int32),
+                   "month": np.array(rows["month"], dtype=np.int8),
+                   "journal_codes": np.array(rows["journal_codes"], dtype=np.int32),
+                   "last_update": np.array(rows["last_update"], dtype="datetime64[s]"),
+                   "detected": np.array(rows["detected"], dtype="datetime64[s]"),
+                   "is_next": np.array(rows["is_next"], dtype=bool)}
+        author_names = np.array(list(author_codes), dtype=str)
+        author_membership = None
+        if known_authors is not None:
+            membership = {**dict.fromkeys(known_authors.maybe_next, "maybe"),
+                          **dict.fromkeys(known_authors.not_next, "no"),
+                          **dict.fromkeys(known_authors.is_next, "yes")}
+            author_membership = np.array([membership.get(name, "")
+                                          for name in author_codes], dtype=str)
+        return cls(columns, np.array(list(journal_codes), dtype=str),
+                   author_names, np.array(author_ptr, dtype=np.int64),
+                   np.array(author_indices, dtype=np.int32), author_membership)
+
+    @classmethod
+    def from_known(cls, known_papers, known_authors=None):
+        """Both the NExT and not NExT papers of a KnownPapers"""
+        return cls.from_bibliographies([known_papers.is_next,
+                                        known_papers.not_next],
+                                       [True, False], known_authors)
+
+    def save(self, file_path):
+        """Write every column to a numpy .npz file"""
+        np.savez_compressed(file_path, journals=self.journals,
+                            author_names=self.author_names,
+                            author_ptr=self.author_ptr,
+                            author_indices=self.author_indices,
+                            author_membership=self.author_membership,
+                            **{name: getattr(self, name) for name in PAPER_COLUMNS})
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            columns = {name: data[name] for name in PAPER_COLUMNS}
+            return cls(columns, data["journals"], data["author_names"],
+                       data["author_ptr"], data["author_indices"],
+                       data["author_membership"])
+
+    # reports ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # each takes a bool mask over the papers, by default the NExT papers
+
+    def _mask(self, mask):
+        return self.is_next if mask is None else mask
+
+    def papers_per_year(self, mask=None):
+        """Returns years and the number of papers in each"""
+        years = self.year[self._mask(mask)]
+        return np.unique(years[years != MISSING], return_counts=True)
+
+    def papers_per_month(self, mask=None):
+        """Returns years, months and the number of papers in each"""
+        mask = self._mask(mask) & (self.year != MISSING) & (self.month != MISSING)
+        months, counts = np.unique(self.year[mask]*12 + self.month[mask] - 1,
+                                   return_counts=True)
+        return months // 12, months % 12 + 1, counts
+
+    def papers_per_journal(self, mask=None):
+        """Returns journals and the number of papers in each, most first"""
+        codes = self.journal_codes[self._mask(mask)]
+        counts = np.bincount(codes[codes != MISSING], minlength=len(self.journals))
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+        return self.journals[order], counts[order]
+
+    def papers_per_author(self, mask=None, top=None):
+        """Returns author names and the number of papers by each, most first"""
+        row_lengths = np.diff(self.author_ptr)
+        # repeat each paper's mask for each of its authors
+        in_mask = np.repeat(self._mask(mask), row_lengths)
+        counts = np.bincount(self.author_indices[in_mask],
+                             minlength=len(self.author_names))
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0][:top]
+        return self.author_names[order], counts[order]
+
+    def authors_per_paper(self):
+        return np.diff(self.author_ptr)
+
+    def detection_delay(self, mask=None):
+        """Days from the version found being posted to arXiv to it being
+        found, for papers where both are known.
+        Papers revised since they were found are left out,
+        as their last_update is after they were detected"""
+        mask = self._mask(mask) & ~np.isnat(self.detected) & \
+            ~np.isnat(self.last_update)
+        delay = self.detected[mask] - self.last_update[mask]
+        delay = delay / np.timedelta64(1, 'D')
+        return delay[delay >= 0]
+
+
+def _to_int(value):
+    try:
+        return int(tools.strip_formating(value, whitespace=True))
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def _to_month(value):
+    try:
+        return int(tools.month_to_numeric(value))
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def report(table, top=10, out=sys.stdout):
+    """Print the reports for the NExT papers in a PaperTable"""
+    print(f"{table.is_next.sum()} NExT papers, {len(table)} in total", file=out)
+    print("Papers per year;", file=out)
+    for year, count in zip(*table.papers_per_year()):
+        print(f"    {year}: {count}", file=out)
+    print(f"Top {top} authors;", file=out)
+    for name, count in zip(*table.papers_per_author(top=top)):
+        print(f"    {name}: {count}", file=out)
+    print(f"Top {top} journals;", file=out)
+    for journal, count in list(zip(*table.papers_per_journal()))[:top]:
+        print(f"    {journal}: {count}", file=out)
+    delay = table.detection_delay()
+    if len(delay):
+        print(f"Days to detection; median {np.median(delay):.1f}, " +
+              f"max {delay.max():.1f}", file=out)
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("prefix")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--save", default=None, help="Write the columns to a .npz file")
+    args = parser.parse_args(args)
+    known_papers = next_papers.KnownPapers(args.prefix + "is_NExT.bib",
+                                           args.prefix + "not_NExT.bib")
+    known_authors = next_papers.KnownAuthors(args.prefix + "authors.txt")
+    table = PaperTable.from_known(known_papers, known_authors)
+    report(table, args.top)
+    if args.save is not None:
+        table.save(args.save)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import os
+import json
+import logging
+from datetime import datetime
+from tools import LOGLEVEL
+
+
+class AuthorHistory:
+    """What each search for an author cost and found,
+    saved so the cost of the next crawl can be planned"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # key is author, value is dict of totals over every scan;
+        # "scans", "pages", "new_papers", "found_next", "days",
+        # and "last_scan", the isoformat time of the last scan
+        self.items = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file_obj:
+                self.items = json.load(file_obj)
+        logging.log(LOGLEVEL, f"In {file_path} found the history of {len(self.items)} authors")
+
+    def __contains__(self, author):
+        return author in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, author):
+        return self.items.get(author)
+
+    def record(self, author, pages, new_papers, found_next, start_date,
+               now=None):
+        """One completed scan of an author, back to start_date.
+        pages is the number of search pages fetched, new_papers the
+        number of papers not seen before, so downloaded"""
+        if now is None:
+            now = datetime.now()
+        item = self.items.setdefault(author, {"scans": 0, "pages": 0,
+                                              "new_papers": 0,
+                                              "found_next": 0, "days": 0})
+        item["scans"] += 1
+        item["pages"] += pages
+        item["new_papers"] += new_papers
+        item["found_next"] += found_next
+        # only papers since the previous scan can be new
+        since = start_date
+        if "last_scan" in item:
+            since = max(since, datetime.fromisoformat(item["last_scan"]))
+        item["days"] += max((now - since).total_seconds() / 86400, 0)
+        item["last_scan"] = now.isoformat(timespec="seconds")
+
+    def save(self):
+        with open(self.file_path, 'w') as file_obj:
+            json.dump(self.items, file_obj, indent=1)
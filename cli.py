@@ -0,0 +1,168 @@
+"""Command line interface to the paper hunter.
+    python3 cli.py crawl /path/to/NExT_papers/my_prefix_
+    python3 cli.py sort-citations paper.tex references.bib
+    python3 cli.py merge combined.bib first.bib second.bib
+    python3 cli.py reclassify /path/to/NExT_papers/my_prefix_ --rules rules.json
+    python3 cli.py daemon /path/to/NExT_papers/my_prefix_ --port 8765
+    python3 cli.py stats /path/to/NExT_papers/my_prefix_
+    python3 cli.py plan /path/to/NExT_papers/my_prefix_ --hours 8
+Each command imports only what it needs, so short jobs start quickly.
+"""
+import sys
+import argparse
+
+
+def run_crawl(args):
+    if len(args.prefixes) > 1:
+        import groups
+        groups.check_for_groups(args.prefixes, record_metrics=not args.no_metrics,
+                                workers=args.workers)
+        return
+    import next_papers
+    authors = None
+    if args.authors is not None:
+        with open(args.authors, 'r') as file_obj:
+            authors = [line.strip() for line in file_obj if line.strip()]
+    next_papers.check_for_papers(args.prefixes[0],
+                                 record_metrics=not args.no_metrics,
+                                 authors=authors, workers=args.workers)
+
+
+def run_sort_citations(args):
+    import sort_citations
+    written = sort_citations.sort_project(args.main_tex, args.bib, args.aux,
+                                          args.in_place, args.cache,
+                                          args.workers)
+    for file_name in written:
+        print(f"Updated cites in {file_name}")
+
+
+def run_merge(args):
+    """Combine bib files, an entry in a later file replaces
+    one with the same key in an earlier file"""
+    import latex_bib
+    import tools
+    bibliography = latex_bib.Bibliography()
+    for bib_file in args.bibs:
+        bibliography.add_file(bib_file)
+    if args.normalise:
+        report = latex_bib.normalise_bibliography(bibliography)
+        for row in zip(*report.values()):
+            print("{}: {} {} {}".format(*row))
+    tools.write_atomic(args.output, bibliography.to_string())
+    print(f"Written {len(bibliography)} entries to {args.output}")
+
+
+def run_reclassify(args):
+    import next_papers
+    rule_set = None
+    if args.rules is not None:
+        import institutes
+        rule_set = institutes.load_rules(args.rules)
+    next_papers.reclassify(args.prefix, args.workers, rule_set)
+
+
+def run_daemon(args):
+    import daemon
+    daemon.serve(args.prefix, args.categories, args.interval, args.port,
+                 args.workers)
+
+
+def run_stats(args):
+    import analytics
+    analytics.main([args.prefix, "--top", str(args.top)] +
+                   ([] if args.save is None else ["--save", args.save]))
+
+
+def run_plan(args):
+    import planner
+    planner.plan(args.prefix, args.hours, args.out)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("crawl", help="Search arXiv for new NExT papers")
+    command.add_argument("prefixes", nargs="+",
+                         help="Prefix of the authors and bib files, " +
+                         "more than one to search for several groups at once")
+    command.add_argument("--no-metrics", action="store_true",
+                         help="Don't write prefix + metrics.prom/json")
+    command.add_argument("--authors", default=None,
+                         help="File of the authors to search, one per line, " +
+                         "as written by plan --out")
+    command.add_argument("--workers", type=int, default=None,
+                         help="Processes to read large bib files with")
+    command.set_defaults(function=run_crawl)
+
+    command = commands.add_parser("sort-citations",
+                                  help="Use INSPIRE keys and cite order in a bib")
+    command.add_argument("main_tex")
+    command.add_argument("bib")
+    command.add_argument("--aux", default=None,
+                         help="Defaults to main_tex with the ending .aux")
+    command.add_argument("--in-place", action="store_true",
+                         help="Overwrite files rather than writing .sorted files")
+    command.add_argument("--cache", default=None,
+                         help="JSON file to keep INSPIRE results in between runs")
+    command.add_argument("--workers", type=int, default=4)
+    command.set_defaults(function=run_sort_citations)
+
+    command = commands.add_parser("merge", help="Combine bib files into one")
+    command.add_argument("output")
+    command.add_argument("bibs", nargs="+")
+    command.add_argument("--normalise", action="store_true",
+                         help="Clean the entries and print the problems found")
+    command.set_defaults(function=run_merge)
+
+    command = commands.add_parser("reclassify",
+                                  help="Judge the saved text of papers again")
+    command.add_argument("prefix")
+    command.add_argument("--workers", type=int, default=None)
+    command.add_argument("--rules", default=None,
+                         help="JSON file of rules, as institutes.load_rules " +
+                         "reads, with a NExT institute to judge by")
+    command.set_defaults(function=run_reclassify)
+
+    command = commands.add_parser("daemon",
+                                  help="Keep polling arXiv for new submissions")
+    command.add_argument("prefix")
+    command.add_argument("--categories", nargs="+", default=None,
+                         help="Defaults to daemon.CATEGORIES")
+    command.add_argument("--interval", type=float, default=None,
+                         help="Seconds between polls, defaults to half an hour")
+    command.add_argument("--port", type=int, default=None,
+                         help="Port for a local JSON status endpoint")
+    command.add_argument("--workers", type=int, default=None,
+                         help="Processes to read large bib files with")
+    command.set_defaults(function=run_daemon)
+
+    command = commands.add_parser("stats",
+                                  help="Count the papers found by year, author and journal")
+    command.add_argument("prefix")
+    command.add_argument("--top", type=int, default=10)
+    command.add_argument("--save", default=None,
+                         help="Write the paper table to a .npz file")
+    command.set_defaults(function=run_stats)
+
+    command = commands.add_parser("plan",
+                                  help="Estimate the cost of the next crawl, " +
+                                  "without sending any requests")
+    command.add_argument("prefix")
+    command.add_argument("--hours", type=float, default=None,
+                         help="Choose the authors that fit in this many hours")
+    command.add_argument("--out", default=None,
+                         help="Write the chosen authors to this file, for crawl --authors")
+    command.set_defaults(function=run_plan)
+    return parser
+
+
+def main(args=None):
+    args = make_parser().parse_args(args)
+    args.function(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
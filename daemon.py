@@ -0,0 +1,267 @@
+"""Keep watching arXiv for new NExT papers.
+The known papers and authors are read once and kept in memory,
+then the newest submissions in each category are fetched on a schedule,
+and only papers with a known author are downloaded and checked.
+    python3 daemon.py /path/to/NExT_papers/my_prefix_ --port 8765
+    curl http://127.0.0.1:8765/status
+"""
+import os
+import sys
+import json
+import logging
+import threading
+import http.server
+import xml.etree.ElementTree
+from datetime import datetime, timedelta
+import tools
+import next_papers
+import text_corpus
+from tools import LOGLEVEL
+from events import EVENTS
+
+CATEGORIES = ["hep-ph", "hep-ex", "hep-th", "hep-lat"]
+# new submissions are announced once a day, so this is plenty
+POLL_INTERVAL = 30 * 60
+# results asked for in each request for a category listing
+LISTING_SIZE = 100
+# never page further than this in one poll,
+# the rest of the listing is left for the next
+MAX_LISTING_PAGES = 10
+# arXiv takes submission dates to the minute
+DATE_FORMAT = "%Y%m%d%H%M"
+# papers can be announced days after they are submitted, held for
+# moderation or sent in over a weekend, so each poll looks back this far
+# before the newest submission seen, papers already known aren't downloaded
+LATE_ANNOUNCEMENT = timedelta(days=4)
+
+
+def published_date(xml_entry):
+    for part in xml_entry:
+        if part.tag.endswith("published"):
+            return datetime.fromisoformat(part.text.rstrip("Z"))
+    return None
+
+
+class Daemon:
+    """Polls the newest submissions in each category,
+    and checks the papers written by potential NExT authors.
+    The newest submission date seen in each category is kept
+    in prefix + "daemon_state.json" so a restart carries on from there,
+    each poll looks back LATE_ANNOUNCEMENT before it for late papers.
+    workers is the number of processes reading large bib files"""
+    def __init__(self, prefix, categories=None, interval=None, workers=None):
+        self.prefix = prefix
+        self.categories = CATEGORIES if categories is None else categories
+        self.interval = POLL_INTERVAL if interval is None else interval
+        self.state_file = prefix + "daemon_state.json"
+        self.known_papers, self.known_authors = next_papers.load_known(
+            prefix, workers=workers)
+        # key is category, value is isoformat date of the newest submission seen
+        self.last_seen = {}
+        # categories whose last listing was cut short, which carry on
+        # from last_seen without looking back, so they can't get stuck
+        self.cut_short = set()
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as state_f:
+                state = json.load(state_f)
+            self.last_seen = state["last_seen"]
+            self.cut_short = set(state.get("cut_short", []))
+        self._first_date = next_papers.read_last_run(prefix)
+        self._stop = threading.Event()
+        self.stats = {"started": datetime.now().isoformat(timespec="seconds"),
+                      "polls": 0, "last_poll": None, "next_poll": None,
+                      "listed": 0, "matched": 0, "found_next": 0,
+                      "last_error": None}
+
+    def listing_url(self, category, since, start):
+        """Submissions to category from since onwards, oldest first"""
+        dates = f"[{since.strftime(DATE_FORMAT)}+TO+209912312359]"
+        return (f"{next_papers.ARXIV_API_URL}?search_query=cat:{category}" +
+                f"+AND+submittedDate:{dates}" +
+                "&sortBy=submittedDate&sortOrder=ascending" +
+                f"&start={start}&max_results={LISTING_SIZE}")
+
+    def new_entries(self, category):
+        """The xml entries submitted to category since the last poll,
+        less LATE_ANNOUNCEMENT, oldest first.
+        If there are too many to list in one poll the oldest are returned,
+        and the next poll carries on after them, so none are missed"""
+        since = self.last_seen.get(category)
+        if since is None:
+            since = self._first_date
+        elif category in self.cut_short:
+            since = datetime.fromisoformat(since)
+        else:
+            since = datetime.fromisoformat(since) - LATE_ANNOUNCEMENT
+        self.cut_short.discard(category)
+        entries = []
+        for page in range(MAX_LISTING_PAGES):
+            xml_string = tools.request_url(
+                self.listing_url(category, since, page * LISTING_SIZE))
+            xml_tree = xml.etree.ElementTree.fromstring(xml_string)
+            page_entries = [part for part in xml_tree
+                            if part.tag.endswith("entry")]
+            # the search is to the minute, the last one seen may be repeated
+            entries += [entry for entry in page_entries
+                        if published_date(entry) >= since]
+            if len(page_entries) < LISTING_SIZE:
+                break
+        else:
+            logging.warning(f"More than {len(entries)} new papers in " +
+                            f"{category}, the rest are left for the next poll")
+            self.cut_short.add(category)
+        return entries
+
+    def poll(self):
+        """Check each category once,
+        returns the arxiv ids of new NExT papers"""
+        found = []
+        seen = set()  # papers are often cross listed
+        for category in self.categories:
+            entries = self.new_entries(category)
+            logging.log(LOGLEVEL, f"{len(entries)} new papers in {category}")
+            # made once per category, not for every paper
+            potential = self.known_authors.pottential_next
+            for entry in entries:
+                bib_entry, _, authors = next_papers.xml_entry_to_bib(entry)
+                if bib_entry.fields["eprint"] in seen:
+                    continue
+                seen.add(bib_entry.fields["eprint"])
+                arxiv_id, _ = text_corpus.split_arxiv_version(
+                    bib_entry.fields["eprint"])
+                # the look back lists papers from earlier polls again,
+                # they are only passed on for any new version
+                is_new = not self.known_papers.is_known(arxiv_id)
+                self.stats["listed"] += is_new
+                if not any(self.known_authors.normalise(name) in potential
+                           for name in authors):
+                    continue
+                self.stats["matched"] += is_new
+                # add_paper is also True for a NExT paper already known
+                if self.known_papers.add_paper(bib_entry) and is_new:
+                    self.stats["found_next"] += 1
+                    found.append(bib_entry.fields["eprint"])
+                    for name in authors:
+                        self.known_authors.add_author(name)
+                    potential = self.known_authors.pottential_next
+            if entries:
+                # the newest processed, which is where a
+                # listing cut short should carry on from
+                self.last_seen[category] = \
+                    published_date(entries[-1]).isoformat()
+                self.checkpoint()
+        for arxiv_id, _, now_next in self.known_papers.reclassify_revised():
+            if now_next:
+                found.append(arxiv_id)
+                next_papers.add_paper_authors(self.known_papers,
+                                              self.known_authors, arxiv_id)
+        self.checkpoint()
+        self.stats["polls"] += 1
+        self.stats["last_poll"] = datetime.now().isoformat(timespec="seconds")
+        return found
+
+    def checkpoint(self):
+        next_papers.checkpoint(self.known_papers, self.known_authors)
+        tools.write_atomic(self.state_file,
+                           json.dumps({"last_seen": self.last_seen,
+                                       "cut_short": sorted(self.cut_short)},
+                                      indent=1))
+
+    def run(self):
+        """Poll until stop is called"""
+        EVENTS.open(self.prefix + "events.jsonl")
+        while not self._stop.is_set():
+            try:
+                found = self.poll()
+                if found:
+                    logging.log(LOGLEVEL, f"Found NExT papers {found}")
+            except Exception as error:
+                if not tools.is_transient(error):
+                    raise
+                logging.warning(f"Poll failed, {error}")
+                self.stats["last_error"] = f"{error}"
+            next_poll = datetime.now() + timedelta(seconds=self.interval)
+            self.stats["next_poll"] = next_poll.isoformat(timespec="seconds")
+            self._stop.wait(self.interval)
+        EVENTS.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """Called from the status server's thread while a poll may be
+        running, so this only takes lengths and copies"""
+        return {**self.stats,
+                "categories": dict(self.last_seen),
+                "is_next": len(self.known_papers.ids_is_next),
+                "not_next": len(self.known_papers.ids_not_next),
+                "potential_authors": len(self.known_authors.is_next) +
+                len(self.known_authors.maybe_next)}
+
+
+class StatusServer(http.server.ThreadingHTTPServer):
+    """Answers GET /status with the status of a Daemon as JSON,
+    only listening on the local machine"""
+    daemon_threads = True
+
+    def __init__(self, daemon, port=0):
+        self.daemon = daemon
+        super().__init__(("127.0.0.1", port), StatusHandler)
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/status"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.daemon.status(), indent=1).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(prefix, categories=None, interval=None, port=None, workers=None):
+    """Run a Daemon until interrupted,
+    with a status endpoint if a port is given"""
+    log_file = prefix + "daemon.log"
+    logging.basicConfig(filename=log_file, level=LOGLEVEL)
+    daemon = Daemon(prefix, categories, interval, workers)
+    server = None
+    if port is not None:
+        server = StatusServer(daemon, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Status at http://127.0.0.1:{server.server_port}/status")
+    print(f"Logging to {log_file}")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.checkpoint()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("prefix")
+    parser.add_argument("--categories", nargs="+", default=CATEGORIES)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help="Seconds between polls")
+    parser.add_argument("--port", type=int, default=None,
+                        help="Port for the status endpoint")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to read large bib files with")
+    args = parser.parse_args(args)
+    serve(args.prefix, args.categories, args.interval, args.port, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
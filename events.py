@@ -0,0 +1,209 @@
+"""Structured record of what a crawl does, one JSON object per line.
+To follow a run as it goes;
+    python3 events.py follow /path/to/NExT_papers/my_prefix_events.jsonl
+and afterwards, to see where the time went;
+    python3 events.py summary /path/to/NExT_papers/my_prefix_events.jsonl
+"""
+import os
+import sys
+import time
+import json
+import threading
+import collections
+
+
+class EventLog:
+    """Buffered, append only, JSON lines log of events.
+    With no file_path, events are dropped"""
+    def __init__(self, file_path=None, flush_every=100, flush_seconds=10.):
+        self.file_path = file_path
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        if self.file_path is None:
+            return
+        record = {"time": round(time.time(), 3), "event": event, **fields}
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            due = len(self._buffer) >= self.flush_every or \
+                time.monotonic() - self._last_flush > self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if lines and self.file_path is not None:
+            with open(self.file_path, 'a') as log_file:
+                log_file.write('\n'.join(lines) + '\n')
+
+    def open(self, file_path):
+        """Start writing to file_path, appending to any earlier runs"""
+        self.flush()
+        self.file_path = file_path
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file_path = None
+
+
+# shared by everything in a run, check_for_papers opens it
+EVENTS = EventLog()
+
+
+class Progress:
+    """Running totals for a stream of events,
+    only the last run in the stream is counted"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.run_start = None
+        self.last_time = None
+        self.finished = False
+        self.frontier = 0
+        self.authors_done = 0
+        self.papers = 0
+        self.next_papers = 0
+        self.requests = 0
+        self.limiter_wait = 0.
+        self.pages = 0
+        # per author totals, key is author
+        self.author_time = collections.Counter()
+        self.author_requests = collections.Counter()
+        self._author_started = {}
+        self._current_author = None
+
+    def update(self, record):
+        event = record["event"]
+        now = record["time"]
+        if event == "run_start":
+            self.reset()
+            self.run_start = now
+            self.frontier = record.get("frontier", 0)
+        self.last_time = now
+        if event == "author_start":
+            self._current_author = record["author"]
+            self._author_started[record["author"]] = now
+            self.frontier = record.get("frontier", self.frontier)
+        elif event == "author_end":
+            started = self._author_started.pop(record["author"], now)
+            self.author_time[record["author"]] += now - started
+            self.authors_done += 1
+            self._current_author = None
+        elif event in ("request", "request_failed"):
+            self.requests += 1
+            self.limiter_wait += record.get("wait", 0.)
+            if self._current_author is not None:
+                self.author_requests[self._current_author] += 1
+        elif event == "page_fetched":
+            self.pages += 1
+        elif event == "paper_classified":
+            self.papers += 1
+            self.next_papers += bool(record.get("is_next"))
+        elif event == "run_end":
+            self.finished = True
+
+    @property
+    def elapsed(self):
+        if self.run_start is None:
+            return 0.
+        return self.last_time - self.run_start
+
+    def papers_per_hour(self):
+        if self.elapsed <= 0:
+            return 0.
+        return 3600 * self.papers / self.elapsed
+
+    def eta(self):
+        """Seconds left, guessing the authors still to do take
+        as long as the ones done so far.
+        None if there is nothing to go on"""
+        if self.authors_done == 0:
+            return None
+        return self.frontier * self.elapsed / self.authors_done
+
+    def status(self):
+        eta = self.eta()
+        eta = "unknown" if eta is None else f"{eta/3600:.1f}h"
+        return (f"{self.elapsed/3600:.2f}h elapsed, " +
+                f"{self.authors_done} authors done, {self.frontier} to go, " +
+                f"{self.papers} papers ({self.next_papers} NExT, " +
+                f"{self.papers_per_hour():.1f}/h), " +
+                f"{self.requests} requests ({self.limiter_wait/3600:.2f}h " +
+                f"waiting on the limiter), ETA {eta}")
+
+
+def read_events(file_path, position=0):
+    """Read the complete lines after position,
+    returns the records and the new position"""
+    records = []
+    with open(file_path, 'r') as log_file:
+        log_file.seek(position)
+        for line in log_file:
+            if not line.endswith('\n'):
+                break  # still being written
+            position += len(line.encode())
+            records.append(json.loads(line))
+    return records, position
+
+
+def follow(file_path, interval=5., forever=False, out=sys.stdout):
+    """Print the progress of a run as events are written,
+    until the run ends.
+    Can be started before the run, it waits for the file to appear"""
+    progress = Progress()
+    position = 0
+    if not os.path.exists(file_path):
+        print(f"Waiting for {file_path}", file=out, flush=True)
+    while True:
+        if not os.path.exists(file_path):
+            time.sleep(interval)
+            continue
+        records, position = read_events(file_path, position)
+        for record in records:
+            progress.update(record)
+        if records:
+            print(progress.status(), file=out, flush=True)
+        if progress.finished and not forever:
+            return progress
+        time.sleep(interval)
+
+
+def summarise(file_path, top=10, out=sys.stdout):
+    """Print the totals for the last run,
+    and the authors that cost the most"""
+    progress = Progress()
+    records, _ = read_events(file_path)
+    for record in records:
+        progress.update(record)
+    print(progress.status(), file=out)
+    print("Authors taking the longest:", file=out)
+    for author, seconds in progress.author_time.most_common(top):
+        print(f"    {author}: {seconds/60:.1f} minutes, " +
+              f"{progress.author_requests[author]} requests", file=out)
+    return progress
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("action", choices=["follow", "summary"])
+    parser.add_argument("events_file")
+    parser.add_argument("--interval", type=float, default=5.)
+    args = parser.parse_args(args)
+    if args.action == "follow":
+        follow(args.events_file, args.interval)
+    else:
+        summarise(args.events_file)
+
+
+if __name__ == "__main__":
+    main()
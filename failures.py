@@ -0,0 +1,95 @@
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+import tools
+from tools import LOGLEVEL
+
+# a paper that fails this many times is given up on
+MAX_ATTEMPTS = 5
+# how long to leave a paper that is known to be broken
+NEGATIVE_EXPIRY = timedelta(days=30)
+
+
+def describe(error):
+    return f"{type(error).__name__}: {error}"
+
+
+class RetryQueue:
+    """Papers that failed for reasons that might go away,
+    saved so they are tried again at the end of this run or the next"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # key is arxiv id, value is dict with
+        # "entry", "attempts", "error" and "not_before"
+        self.items = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file_obj:
+                self.items = json.load(file_obj)
+        logging.log(LOGLEVEL, f"In {file_path} found {len(self.items)} papers to retry")
+
+    def __contains__(self, arxiv_id):
+        return arxiv_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, arxiv_id, bib_entry, error):
+        """Record a failure, returns the number of attempts so far"""
+        item = self.items.setdefault(arxiv_id, {"attempts": 0})
+        item["attempts"] += 1
+        item["entry"] = str(bib_entry)
+        item["error"] = describe(error)
+        not_before = datetime.now() + \
+            timedelta(seconds=tools.backoff_delay(error, item["attempts"] - 1))
+        item["not_before"] = not_before.isoformat()
+        return item["attempts"]
+
+    def discard(self, arxiv_id):
+        self.items.pop(arxiv_id, None)
+
+    def due(self, now=None):
+        """The arxiv ids and bib strings ready to be tried again"""
+        if now is None:
+            now = datetime.now()
+        return [(arxiv_id, item["entry"]) for arxiv_id, item in self.items.items()
+                if datetime.fromisoformat(item["not_before"]) <= now]
+
+    def save(self):
+        with open(self.file_path, 'w') as file_obj:
+            json.dump(self.items, file_obj, indent=1)
+
+
+class NegativeCache:
+    """Papers known to fail, so they are not requested again until
+    the entry expires"""
+    def __init__(self, file_path, expiry=NEGATIVE_EXPIRY):
+        self.file_path = file_path
+        self.expiry = expiry
+        # key is arxiv id, value is dict with "error" and "expires"
+        self.items = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file_obj:
+                self.items = json.load(file_obj)
+        now = datetime.now()
+        self.items = {arxiv_id: item for arxiv_id, item in self.items.items()
+                      if datetime.fromisoformat(item["expires"]) > now}
+        logging.log(LOGLEVEL, f"In {file_path} found {len(self.items)} broken papers")
+
+    def __contains__(self, arxiv_id):
+        item = self.items.get(arxiv_id)
+        if item is None:
+            return False
+        return datetime.fromisoformat(item["expires"]) > datetime.now()
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, arxiv_id, error):
+        expires = datetime.now() + self.expiry
+        self.items[arxiv_id] = {"error": describe(error),
+                                "expires": expires.isoformat()}
+
+    def save(self):
+        with open(self.file_path, 'w') as file_obj:
+            json.dump(self.items, file_obj, indent=1)
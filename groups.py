@@ -0,0 +1,239 @@
+"""Search for the papers of several groups in one process.
+Each group has its own prefix, with its own authors file, bib files,
+and (optionally) institute rules in prefix + "rules.json".
+Every URL is fetched once, every PDF is read once and judged for all
+the groups at the same time, and all requests share one rate limit.
+    python3 groups.py /path/to/NExT_papers/next_ /path/to/other_papers/other_
+"""
+import os
+import sys
+import zlib
+import logging
+import threading
+import collections
+from datetime import datetime
+import tools
+import institutes
+import next_papers
+import text_corpus
+from tools import LOGLEVEL
+from metrics import METRICS
+from events import EVENTS
+
+# results kept for groups that haven't asked for a paper yet,
+# the least recently used are dropped after this
+MAX_SHARED_RESULTS = 1000
+
+
+def load_group_rules(prefix):
+    """The RuleSet in prefix + "rules.json", or the NExT rules"""
+    rules_file = prefix + "rules.json"
+    if os.path.exists(rules_file):
+        return institutes.load_rules(rules_file)
+    return institutes.RuleSet()
+
+
+class SharedClassifier:
+    """Downloads and scans each paper once, for the institutes of every group.
+    The scanned text is kept, compressed, until every group has asked
+    for the paper, or it is one of the least recently used
+    after max_results"""
+    def __init__(self, rule_set, n_groups=1, max_results=MAX_SHARED_RESULTS):
+        self.rule_set = rule_set
+        self.n_groups = n_groups
+        self.max_results = max_results
+        # key is (arxiv_id, version), value is
+        # (verdicts, compressed scanned text), least recently used first
+        self.results = collections.OrderedDict()
+        # key is (arxiv_id, version), value is the set of groups given it
+        self._given = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def classify(self, arxiv_id, corpus=None, version=None, group=None,
+                 rule_set=None):
+        """Returns a dict of institutes.Verdict and the acknowledgement hash.
+        group is any name for the group asking, and rule_set its own
+        rules, which the hash is made with, so it matches the hash
+        next_papers.check_paper would give with those rules alone"""
+        key = (arxiv_id, version)
+        with self._lock:
+            result = self.results.get(key)
+            if result is not None:
+                self.results.move_to_end(key)
+        if result is None:
+            scanned_pages = []
+            pdf_id = arxiv_id if version is None else f"{arxiv_id}v{version}"
+            with next_papers.get_paper_pdf(pdf_id) as pdf_object:
+                page_texts = next_papers.iter_page_texts(
+                    pdf_object, next_papers.MAX_PDF_PAGES)
+                verdicts = next_papers.check_pages_for_institutes(
+                    page_texts, self.rule_set, scanned_pages)
+                next_papers.read_rest_of_paper(page_texts, scanned_pages)
+            page_sep = text_corpus.TextCorpus.page_sep
+            text = page_sep.join(page.replace(page_sep, ' ')
+                                 for page in scanned_pages)
+            result = (verdicts, zlib.compress(text.encode()))
+            with self._lock:
+                self.results[key] = result
+                while len(self.results) > self.max_results:
+                    dropped, _ = self.results.popitem(last=False)
+                    self._given.pop(dropped, None)
+        else:
+            METRICS.count("papers_shared")
+        verdicts, compressed = result
+        pages = zlib.decompress(compressed).decode().split(
+            text_corpus.TextCorpus.page_sep)
+        if corpus is not None and key not in corpus.index:
+            corpus.add(arxiv_id, pages, version)
+        # the combined scan may have read past where this group's
+        # rules would stop, and the hash covers the pages read
+        if rule_set is None:
+            rule_set = self.rule_set
+        ack_hash = next_papers.acknowledgement_hash(
+            next_papers.pages_before_verdict(pages, rule_set), rule_set)
+        with self._lock:
+            given = self._given[key]
+            given.add(group)
+            if len(given) >= self.n_groups:
+                # every group has it, so it won't be asked for again
+                self.results.pop(key, None)
+                del self._given[key]
+        return verdicts, ack_hash
+
+    def for_group(self, names, rule_set=None):
+        """A classify function for KnownPapers, for a group whose
+        institutes have the given names in the combined RuleSet,
+        and whose own RuleSet is rule_set"""
+        group = tuple(names)
+
+        def classify(arxiv_id, corpus=None, version=None):
+            verdicts, ack_hash = self.classify(arxiv_id, corpus, version,
+                                               group, rule_set)
+            return any(verdicts[name].is_member for name in names), ack_hash
+        return classify
+
+
+class Group:
+    """The authors and papers of one prefix"""
+    def __init__(self, prefix, classify, workers=None):
+        self.prefix = prefix
+        self.start_date = next_papers.read_last_run(prefix)
+        self.known_papers, self.known_authors = \
+            next_papers.load_known(prefix, classify, workers)
+        if len(self.known_authors.pottential_next) == 0:
+            raise ValueError(f"No authors in {self.known_authors.file_path}")
+        # the authors known at the start, not yet checked
+        self.to_check = set(self.known_authors.pottential_next)
+
+    def take_waiting(self):
+        """Remove and return the authors waiting to be checked"""
+        waiting = self.to_check | self.known_authors.new
+        self.to_check = set()
+        self.known_authors.new.clear()
+        return waiting
+
+    def retry(self):
+        """Papers that failed, then papers with new versions.
+        The authors of any found are added"""
+        found = self.known_papers.retry_failed()
+        found += [arxiv_id for arxiv_id, _, now_in
+                  in self.known_papers.reclassify_revised() if now_in]
+        for arxiv_id in found:
+            next_papers.add_paper_authors(self.known_papers,
+                                          self.known_authors, arxiv_id)
+
+    def checkpoint(self):
+        next_papers.checkpoint(self.known_papers, self.known_authors)
+
+
+def _crawl(groups, save_interval=5):
+    checked = 0
+    retried = False
+    while True:
+        # key is author, value is the groups they are waiting in,
+        # so each author is searched for once however many groups have them
+        waiting = {}
+        for group in groups:
+            for author in sorted(group.take_waiting()):
+                waiting.setdefault(author, []).append(group)
+        if not waiting:
+            if retried:
+                return
+            # the retry queues are drained once, and any new authors
+            # from the papers retried are checked after
+            retried = True
+            for group in groups:
+                group.retry()
+            continue
+        logging.log(LOGLEVEL, f"Checking {len(waiting)} authors")
+        for n, (author, author_groups) in enumerate(waiting.items()):
+            for group in author_groups:
+                logging.log(LOGLEVEL, f"Checking author {author} for {group.prefix}")
+                next_papers.try_author_name(group.known_papers,
+                                            group.known_authors, author,
+                                            group.start_date,
+                                            len(waiting) - n - 1)
+            checked += 1
+            if checked % save_interval == 0:
+                for group in groups:
+                    group.checkpoint()
+
+
+# entry point!
+def check_for_groups(prefixes, record_metrics=True, workers=None):
+    """Search for new papers for every group, each given by a prefix
+    as in next_papers.check_for_papers.
+    The log, events and metrics go to the first prefix.
+    workers is the number of processes reading large bib files"""
+    if record_metrics:
+        METRICS.enable()
+        METRICS.reset()
+    log_file = prefixes[0] + str(datetime.today().date()) + ".log"
+    logging.basicConfig(filename=log_file, level=LOGLEVEL)
+    print("To follow progress do \n" +
+          f" >> tail -f {log_file}")
+
+    rule_sets = [load_group_rules(prefix) for prefix in prefixes]
+    combined, names = institutes.combine_rules(rule_sets)
+    classifier = SharedClassifier(combined, len(prefixes))
+    groups = [Group(prefix, classifier.for_group(group_names, rule_set),
+                    workers)
+              for prefix, group_names, rule_set in zip(prefixes, names,
+                                                       rule_sets)]
+
+    EVENTS.open(prefixes[0] + "events.jsonl")
+    EVENTS.emit("run_start", groups=prefixes,
+                frontier=len(set().union(*(group.to_check for group in groups))))
+    original_cache = tools.RESPONSE_CACHE
+    tools.RESPONSE_CACHE = tools.ResponseCache()
+    try:
+        _crawl(groups)
+    finally:
+        logging.log(LOGLEVEL, f"{tools.RESPONSE_CACHE.hits} requests shared")
+        tools.RESPONSE_CACHE = original_cache
+
+    for group in groups:
+        with open(group.prefix + "last_run.txt", 'w') as date_f:
+            date_f.write(str(datetime.today().date()))
+        group.checkpoint()
+    if record_metrics:
+        METRICS.write(prefixes[0])
+    EVENTS.emit("run_end")
+    EVENTS.close()
+    logging.log(LOGLEVEL, "Done")
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("prefixes", nargs="+")
+    parser.add_argument("--no-metrics", action="store_true")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to read large bib files with")
+    args = parser.parse_args(args)
+    check_for_groups(args.prefixes, not args.no_metrics, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import json
+import collections
+
+# where acknowledgments might start, in order of preference
+DEFAULT_ANCHORS = ["cknowledgement", "cknowledgment", "thank", "Thank"]
+
+# patterns are searched for in the clean text,
+# compact patterns are searched for ignoring spacing,
+# and are used when no acknowledgments can be found
+NEXT_RULES = {"NExT": {"patterns": ["NExT"],
+                       "compact_patterns": ["NExTInstitute"]}}
+
+Verdict = collections.namedtuple("Verdict", ["is_member", "evidence"])
+
+
+class Automaton:
+    """Aho-Corasick automaton,
+    finds every occurrence of a set of words in one pass over a text"""
+    def __init__(self, words):
+        self.words = list(dict.fromkeys(words))
+        self.goto = [{}]
+        self.fail = [0]
+        # for each state, the index of every word ending there
+        self.output = [[]]
+        for word_n, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(word_n)
+        # breadth first, so the fail state is always done first
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                self.fail[child] = self.step(self.fail[state], char)
+                self.output[child] = self.output[child] + \
+                    self.output[self.fail[child]]
+        self.max_len = max((len(word) for word in self.words), default=0)
+
+    def step(self, state, char):
+        """Move from state on reading char"""
+        goto, fail = self.goto, self.fail
+        while char not in goto[state]:
+            if state == 0:
+                return 0
+            state = fail[state]
+        return goto[state][char]
+
+    def find_all(self, text):
+        """Yield (start, word) for every occurrence of every word"""
+        state = 0
+        for i, char in enumerate(text):
+            state = self.step(state, char)
+            for word_n in self.output[state]:
+                word = self.words[word_n]
+                yield i - len(word) + 1, word
+
+
+class RuleSet:
+    """Patterns for a number of institutes, and the words that
+    mark the start of the acknowledgments, compiled so that
+    all of them can be checked in one pass over a text"""
+    def __init__(self, institutes=None, anchors=None):
+        if institutes is None:
+            institutes = NEXT_RULES
+        if anchors is None:
+            anchors = DEFAULT_ANCHORS
+        self.institutes = list(institutes)
+        self.anchors = list(anchors)
+        self.rules = {name: dict(rules) for name, rules in institutes.items()}
+        # for each word, which institutes it belongs to
+        self.pattern_owners = collections.defaultdict(set)
+        self.compact_owners = collections.defaultdict(set)
+        for name, rules in institutes.items():
+            for pattern in rules.get("patterns", []):
+                self.pattern_owners[pattern].add(name)
+            for pattern in rules.get("compact_patterns", []):
+                pattern = pattern.replace(" ", "")
+                self.compact_owners[pattern].add(name)
+        self.spaced = Automaton(list(self.anchors) + list(self.pattern_owners))
+        self.compact = Automaton(self.compact_owners)
+
+    def scanner(self):
+        return BackwardScanner(self)
+
+    def classify(self, clean_text):
+        """Get a Verdict for each institute on one block of text"""
+        scanner = self.scanner()
+        scanner.add_block(clean_text)
+        return scanner.verdicts()
+
+    def acknowledgements(self, clean_text):
+        """The acknowledgments in one block of text, or "" """
+        scanner = self.scanner()
+        scanner.add_block(clean_text)
+        return scanner.acknowledgements()
+
+
+def load_rules(file_path):
+    """Read a RuleSet from a json file like
+    {"anchors": ["cknowledgement", ...],
+     "institutes": {"NExT": {"patterns": ["NExT"],
+                             "compact_patterns": ["NExT Institute"]}}}
+    """
+    with open(file_path, 'r') as rules_file:
+        rules = json.load(rules_file)
+    return RuleSet(rules["institutes"], rules.get("anchors"))
+
+
+def combine_rules(rule_sets):
+    """One RuleSet checking the institutes of several at once.
+    Institutes are renamed "<n>:<name>", where n is the position of their
+    RuleSet, and the anchors of all the RuleSets are used.
+    Returns the RuleSet, and a list of the new names from each RuleSet"""
+    combined, names, anchors = {}, [], {}  # dict as an ordered set
+    for n, rule_set in enumerate(rule_sets):
+        names.append([])
+        for name, rules in rule_set.rules.items():
+            combined[f"{n}:{name}"] = rules
+            names[-1].append(f"{n}:{name}")
+        anchors.update(dict.fromkeys(rule_set.anchors))
+    return RuleSet(combined, list(anchors)), names
+
+
+class BackwardScanner:
+    """Scan a document a page at a time, from the back to the front,
+    only looking at each new page (and a little overlap) once"""
+    snippet_before = 20
+    snippet_after = 30
+
+    def __init__(self, rule_set):
+        self.rule_set = rule_set
+        self.text = ""
+        # positions are stored as distance from the end of the text,
+        # because that doesn't change as pages are put in front
+        # for each anchor, the earliest start
+        self.anchor_starts = {}
+        # for each pattern, the latest start and a snippet of text there
+        self.pattern_starts = {}
+        self.compact_starts = {}
+
+    def prepend(self, page_text):
+        """Add a page in front of the text scanned so far"""
+        self.add_block(page_text + " ")
+
+    def add_block(self, block):
+        old_text = self.text
+        rule_set = self.rule_set
+        spaced, compact = rule_set.spaced, rule_set.compact
+        # matches may run over the join, so include the
+        # start of the old text, enough for the longest word
+        overlap = non_space = 0
+        while overlap < len(old_text) and \
+                (overlap < spaced.max_len - 1 or
+                 non_space < compact.max_len - 1):
+            if old_text[overlap] != " ":
+                non_space += 1
+            overlap += 1
+        window = block + old_text[:overlap]
+        self.text = block + old_text
+        total_len = len(self.text)
+        limit = len(block)  # matches starting after this have been seen
+        anchors = set(rule_set.anchors)
+        spaced_state = compact_state = 0
+        # the location of recent non space charicters
+        recent = collections.deque(maxlen=max(compact.max_len, 1))
+        spaced_found, compact_found = [], []
+        for i, char in enumerate(window):
+            spaced_state = spaced.step(spaced_state, char)
+            for word_n in spaced.output[spaced_state]:
+                start = i - len(spaced.words[word_n]) + 1
+                if start < limit:
+                    spaced_found.append((start, spaced.words[word_n]))
+            if char == " ":
+                continue
+            recent.append(i)
+            compact_state = compact.step(compact_state, char)
+            for word_n in compact.output[compact_state]:
+                start = recent[-len(compact.words[word_n])]
+                if start < limit:
+                    compact_found.append((start, compact.words[word_n]))
+        # the new block is in front of everything seen before,
+        # so its anchors are always earlier, and its patterns
+        # are only needed if they have not been seen yet
+        block_anchors, block_patterns, block_compact = {}, {}, {}
+        for start, word in spaced_found:
+            if word in anchors:
+                block_anchors.setdefault(word, start)  # first is earliest
+            if word in rule_set.pattern_owners:
+                block_patterns[word] = start  # last is latest
+        for start, word in compact_found:
+            block_compact[word] = start
+        for word, start in block_anchors.items():
+            self.anchor_starts[word] = total_len - start
+        for word, start in block_patterns.items():
+            if word not in self.pattern_starts:
+                self.pattern_starts[word] = (total_len - start,
+                                             self._snippet(start))
+        for word, start in block_compact.items():
+            if word not in self.compact_starts:
+                self.compact_starts[word] = (total_len - start,
+                                             self._snippet(start))
+
+    def _snippet(self, start):
+        return self.text[max(start - self.snippet_before, 0):
+                         start + self.snippet_after]
+
+    def _anchor(self):
+        """Distance from the end of the text to the start of the
+        acknowledgments, using the most preferred anchor found"""
+        return next((self.anchor_starts[word] for word in self.rule_set.anchors
+                     if word in self.anchor_starts), None)
+
+    def acknowledgements(self):
+        """The text from the start of the acknowledgments to the end,
+        or "" if they haven't been found"""
+        anchor = self._anchor()
+        if anchor is None:
+            return ""
+        return self.text[len(self.text) - anchor:]
+
+    def verdicts(self):
+        """A Verdict for each institute on the text so far"""
+        rule_set = self.rule_set
+        anchor = self._anchor()
+        verdicts = {name: Verdict(False, None) for name in rule_set.institutes}
+        for name in rule_set.institutes:
+            present = [self.pattern_starts[word]
+                       for word, owners in rule_set.pattern_owners.items()
+                       if name in owners and word in self.pattern_starts]
+            if not present:
+                continue
+            if anchor is not None:
+                # the pattern must be in the acknowledgments
+                evidence = [snippet for from_end, snippet in present
+                            if from_end <= anchor]
+            else:
+                # no idea where the acknowledgments start,
+                # require full string, but ignore spacing
+                evidence = [self.compact_starts[word][1]
+                            for word, owners in rule_set.compact_owners.items()
+                            if name in owners and word in self.compact_starts]
+            if evidence:
+                verdicts[name] = Verdict(True, evidence[0])
+        return verdicts
@@ -1,10 +1,19 @@
 import tools
-from ipdb import set_trace as st
-import numpy as np
 import os
+import re
+import mmap
+import functools
+import concurrent.futures
 from tools import LOGLEVEL
 import logging
 
+# files smaller than this are read by one process even when workers are given
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+# chunks made for each worker, so an uneven chunk doesn't hold up the rest
+CHUNKS_PER_WORKER = 4
+# an entry starting on a new line, which is where chunks may begin
+ENTRY_START = re.compile(rb"\n@[A-Za-z]+\s*\{")
+
 
 def get_initial_last(name):
     name = name.replace('.', ' ')
@@ -35,11 +44,54 @@ def split_bib(bib_string):
         entry_type, entry_key, fields, end =\
             read_bib_entry(bib_string[next_start:])
         next_start = bib_string.find(start_key, next_start + end)
-        bib_entries.append(BibEntry(fields, key=entry_key,
-                                    entry_type=entry_type))
+        entry = BibEntry(fields, key=entry_key, entry_type=entry_type)
+        bib_entries.append(entry)
     return bib_entries
 
 
+def bib_chunks(file_path, n_chunks):
+    """Cut a bib file into about n_chunks byte ranges, as a list of
+    (start, end), with every range but the first beginning at an entry.
+    A line starting with @ inside a field's braces is not an entry,
+    so a boundary is only taken where the braces since the last one balance"""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    starts = [0]
+    with open(file_path, 'rb') as bib_file:
+        with mmap.mmap(bib_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # brace depth at position, counted from the last boundary
+            position, depth = 0, 0
+            for i in range(1, n_chunks):
+                search_from = max(size * i // n_chunks, starts[-1])
+                while True:
+                    match = ENTRY_START.search(mapped, search_from)
+                    if match is None:
+                        break
+                    segment = mapped[position:match.start()]
+                    depth += segment.count(b'{') - segment.count(b'}')
+                    position = match.start()
+                    if depth == 0:
+                        break
+                    search_from = match.end()
+                if match is None:
+                    break
+                starts.append(match.start() + 1)  # after the newline
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def read_bib_chunk(file_path, start, end):
+    """The entries in a byte range of a bib file,
+    as (entry_type, key, fields), which are cheap to pickle"""
+    with open(file_path, 'rb') as bib_file:
+        bib_file.seek(start)
+        data = bib_file.read(end - start)
+    # as reading the file in text mode would
+    text = data.decode().replace("\r\n", "\n").replace("\r", "\n")
+    return [(entry.entry_type, entry.key, entry.fields)
+            for entry in split_bib(text)]
+
+
 def get_bib_entry_key(bib_string):
     try:
         key_string = bib_string.split('{', 1)[1].split(',', 1)[0]
@@ -109,11 +161,11 @@ def read_bib_entry(entry_string):
 
 
 class Bibliography:
-    def __init__(self, bib_file=None):
+    def __init__(self, bib_file=None, workers=None):
         # key = bibkey, value = BibEntry
         self._entries = {}
         if bib_file is not None:
-            self.add_file(bib_file)
+            self.add_file(bib_file, workers)
 
     def __getitem__(self, key):
         return self._entries[key]
@@ -151,10 +203,26 @@ class Bibliography:
         del self[old_key]
         self[new_key] = entry
 
-    def add_file(self, file_path):
-        with open(file_path, 'r') as bib_file:
-            bib_string = bib_file.read()
-        self.add_file_string(bib_string)
+    def add_file(self, file_path, workers=None):
+        """Add the entries in a .bib file, a later entry replacing
+        an earlier one with the same key.
+        If workers is given, a large file is cut into chunks at the
+        start of entries, which are read in parallel then added in order"""
+        if workers is None or workers < 2 or \
+                os.path.getsize(file_path) < PARALLEL_MIN_BYTES:
+            with open(file_path, 'r') as bib_file:
+                bib_string = bib_file.read()
+            self.add_file_string(bib_string)
+            return
+        chunks = bib_chunks(file_path, workers * CHUNKS_PER_WORKER)
+        logging.log(LOGLEVEL, f"Reading {file_path} in {len(chunks)} chunks")
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = executor.map(read_bib_chunk, [file_path]*len(chunks),
+                                   *zip(*chunks))
+            for chunk_entries in results:
+                for entry_type, key, fields in chunk_entries:
+                    self.add_entry(BibEntry(fields, key=key,
+                                            entry_type=entry_type))
 
     def add_file_string(self, file_string):
         for entry in split_bib(file_string):
@@ -172,11 +240,7 @@ class Bibliography:
             cite_order = sorted(self.keys())
         else:
             # check for dups
-            no_dups = []
-            for key in cite_order:
-                if key not in no_dups:
-                    no_dups.append(key)
-            cite_order = no_dups
+            cite_order = list(dict.fromkeys(cite_order))
         ordered_cites = [str(self[key]) for key in cite_order]
         cite_sep = os.linesep + os.linesep
         text = cite_sep.join(ordered_cites)
@@ -208,31 +272,49 @@ class BibEntry:
             self.key = make_bib_key(self)
         if self.entry_type is None:
             self.entry_type = "Article"
-
-    def __str__(self):
-        text = "@" + self.entry_type.capitalize() + "{"
-        text += " " + self.key + ",\n"
-        longest_field_key = np.max([len(key) for key in self.fields])
-        for key in self.fields:
-            text += "    " + key.ljust(longest_field_key) + " = "
-            field = self.fields[key]
-            missmatch = tools.check_braces_match(field)
-            # stick braces on the end or beginning to force a match
+        self.balance_fields()
+
+    def balance_fields(self):
+        """Make the braces of every field match.
+        Done once, as the entry is made, or by normalise_bibliography,
+        not each time the entry is written.
+        Anything changing fields after that should call it again"""
+        for key, value in self.fields.items():
+            field, missmatch = balance_braces(value)
             if missmatch > 0:
-                # space prevents escaping the new braces
-                field += " " + "}"*missmatch
                 message = f"In bib entry {self.key}, field {key} " +\
                           f"was missing {missmatch} closing braces"
                 logging.log(LOGLEVEL, message)
             elif missmatch < 0:
-                field = "{"*abs(missmatch) + field
                 message = f"In bib entry {self.key}, field {key} " +\
                           f"was missing {missmatch} opening braces"
                 logging.log(LOGLEVEL, message)
-            text += "{" + self.fields[key] + "},\n"
+            if missmatch:
+                self.fields[key] = field
+
+    def __str__(self):
+        text = "@" + self.entry_type.capitalize() + "{"
+        text += " " + self.key + ",\n"
+        longest_field_key = max(len(key) for key in self.fields)
+        for key, field in self.fields.items():
+            text += "    " + key.ljust(longest_field_key) + " = "
+            text += "{" + field + "},\n"
         text += "}"
         return text
-            
+
+
+def balance_braces(field):
+    """Returns the field with braces stuck on the end or beginning
+    to force a match, and the number that were missing"""
+    missmatch = tools.check_braces_match(field)
+    if missmatch > 0:
+        # space prevents escaping the new braces
+        field += " " + "}"*missmatch
+    elif missmatch < 0:
+        field = "{"*abs(missmatch) + field
+    return field, missmatch
+
+
 # functions to check a bib entry ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 
@@ -247,3 +329,88 @@ def bib_missing_fields(entry_type, fields):
     not_found = [field for field in required_fields if field not in fields]
     return not_found
 
+
+# functions to clean a whole bibliography ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# names repeat a lot across a bibliography, but not without limit
+@functools.lru_cache(maxsize=2**16)
+def normalise_name(name, author_form="last_first"):
+    """Tidy the spacing in one name, and if author_form is
+    "last_first" put it in the form "Last, First" """
+    name = ' '.join(name.split())
+    if author_form != "last_first" or ',' in name:
+        return name
+    if name.startswith('{') and name.endswith('}'):
+        return name  # protected, like {ATLAS Collaboration}
+    *first, last = name.split(' ')
+    if not first:
+        return name
+    return last + ", " + ' '.join(first)
+
+
+def normalise_authors(authors, author_form="last_first"):
+    names = [normalise_name(name, author_form)
+             for name in ' '.join(authors.split()).split(" and ")]
+    return " and ".join(name for name in names if name)
+
+
+def normalise_entry(key, entry_type, fields, author_form="last_first"):
+    """Clean the fields of one entry.
+    Returns the new fields, and a list of problems found
+    as (key, field, problem, detail)"""
+    problems = []
+    fields = dict(fields)
+    if "month" in fields:
+        try:
+            fields["month"] = tools.month_to_numeric(fields["month"])
+        except (ValueError, TypeError) as e:
+            problems.append((key, "month", "bad_month", str(e)))
+    if "author" in fields and author_form is not None:
+        fields["author"] = normalise_authors(fields["author"], author_form)
+    for name, field in fields.items():
+        field, missmatch = balance_braces(field)
+        if missmatch:
+            fields[name] = field
+            problem = "missing_closing_braces" if missmatch > 0 \
+                else "missing_opening_braces"
+            problems.append((key, name, problem, str(abs(missmatch))))
+    for name in bib_missing_fields(entry_type, fields):
+        problems.append((key, name, "missing_field", ""))
+    return fields, problems
+
+
+def _normalise_chunk(chunk, author_form):
+    return [normalise_entry(key, entry_type, fields, author_form)
+            for key, entry_type, fields in chunk]
+
+
+def normalise_bibliography(bibliography, author_form="last_first",
+                           workers=None, chunk_size=5000):
+    """Clean every entry of a Bibliography in one pass;
+    months become numbers, author names take one form,
+    braces are balanced and required fields are checked.
+    If workers is given, chunks of entries are done in parallel.
+    Returns a report of the problems found, as a dict of
+    numpy arrays with the columns key, field, problem and detail"""
+    import numpy as np  # slow to import, and only needed here
+    entries = [(key, entry.entry_type, entry.fields)
+               for key, entry in bibliography.items()]
+    chunks = [entries[start:start + chunk_size]
+              for start in range(0, len(entries), chunk_size)]
+    if workers is None or len(chunks) < 2:
+        results = [_normalise_chunk(chunk, author_form) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_normalise_chunk, chunks,
+                                        [author_form]*len(chunks)))
+    problems = []
+    for chunk, chunk_results in zip(chunks, results):
+        for (key, _, _), (fields, entry_problems) in zip(chunk, chunk_results):
+            bibliography[key].fields = fields
+            problems += entry_problems
+    columns = ["key", "field", "problem", "detail"]
+    report = {column: np.array([problem[i] for problem in problems], dtype=str)
+              for i, column in enumerate(columns)}
+    logging.log(LOGLEVEL, f"Normalised {len(entries)} entries, " +
+                f"found {len(problems)} problems")
+    return report
@@ -0,0 +1,121 @@
+import time
+import json
+import functools
+import contextlib
+import collections
+
+# all metric names are given this prefix when exported
+NAMESPACE = "next_papers"
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Metrics:
+    """Timers and counters for the stages of a run.
+    While disabled, which is the default, recording does nothing"""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self.counters = collections.defaultdict(float)
+        # key is name, value is [count, total, max]
+        self.summaries = collections.defaultdict(lambda: [0, 0., 0.])
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        self.started = time.time()
+        self.counters.clear()
+        self.summaries.clear()
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        """Record one value of something that varies, like
+        the number of pages read from a paper"""
+        if self.enabled:
+            summary = self.summaries[name]
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def add_time(self, name, seconds):
+        self.observe(name + "_seconds", seconds)
+
+    def timer(self, name):
+        """Context manager timing the block inside it"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        summaries = {name: {"count": count, "total": total,
+                            "mean": total/count if count else 0.,
+                            "max": largest}
+                     for name, (count, total, largest)
+                     in sorted(self.summaries.items())}
+        return {"started": self.started,
+                "elapsed_seconds": time.time() - self.started,
+                "counters": dict(sorted(self.counters.items())),
+                "summaries": summaries}
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{NAMESPACE}_{_clean(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+        for name, (count, total, largest) in sorted(self.summaries.items()):
+            metric = f"{NAMESPACE}_{_clean(name)}"
+            lines += [f"# TYPE {metric} summary",
+                      f"{metric}_count {count}",
+                      f"{metric}_sum {total:.6f}",
+                      f"# TYPE {metric}_max gauge",
+                      f"{metric}_max {largest:.6f}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix):
+        """Write prefix + "metrics.prom" and prefix + "metrics.json" """
+        with open(prefix + "metrics.prom", 'w') as prom_file:
+            prom_file.write(self.to_prometheus())
+        with open(prefix + "metrics.json", 'w') as json_file:
+            json.dump(self.summary(), json_file, indent=1)
+
+
+def _clean(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+# shared by everything in a run
+METRICS = Metrics()
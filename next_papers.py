@@ -1,80 +1,212 @@
 import logging
-from ipdb import set_trace as st
 from datetime import datetime
 import os
-import io
-import xml
-import pdfplumber
+import sys
+import time
+import hashlib
+import xml.etree.ElementTree
+import mmap
+import tempfile
+import contextlib
 import latex_bib
+import failures
+import revisions
+import author_history
+import institutes
+import text_corpus
 import tools
 from tools import LOGLEVEL
-
-
-def get_paper_pdf(arxiv_id):
-    url = f"https://arxiv.org/pdf/{arxiv_id}.pdf"
-    data = tools.request_url(url)
-    io_bytes = io.BytesIO(data)
-    pdf_object = pdfplumber.open(io_bytes)
-    return pdf_object
-
-
-def check_pdf_for_next(pdf_object):
+from metrics import METRICS
+from events import EVENTS
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+ARXIV_PDF_URL = "https://arxiv.org/pdf/"
+# the rules used to recognise NExT papers
+NEXT_RULE_SET = institutes.RuleSet(institutes.NEXT_RULES)
+
+
+# downloads bigger than this are spooled to disk and memory mapped
+PDF_SPOOL_BYTES = 4 * 1024 * 1024
+# budget for each paper, None for no limit
+MAX_PDF_BYTES = 100 * 1024 * 1024
+MAX_PDF_PAGES = None
+
+
+@contextlib.contextmanager
+def get_paper_pdf(arxiv_id, max_bytes=None):
+    """Download a paper and open it with pdfplumber.
+    Use as a context manager, so the PDF is closed
+    and any temporary file removed afterwards;
+        with get_paper_pdf(arxiv_id) as pdf_object:
+    """
+    if max_bytes is None:
+        max_bytes = MAX_PDF_BYTES
+    import pdfplumber  # slow to import, so only loaded for a crawl
+    url = f"{ARXIV_PDF_URL}{arxiv_id}.pdf"
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES) as spool:
+        with METRICS.timer("pdf_download"):
+            size = tools.request_url(url, out_file=spool, max_bytes=max_bytes)
+        if size > PDF_SPOOL_BYTES:  # it has been rolled over to disk
+            spool.flush()
+            with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with pdfplumber.open(mapped) as pdf_object:
+                    yield pdf_object
+        else:
+            spool.seek(0)
+            with pdfplumber.open(spool) as pdf_object:
+                yield pdf_object
+
+
+def iter_page_texts(pdf_object, max_pages=None):
+    """Yield the text of each page from the back to the front,
+    freeing the layout cached for each page after it is read"""
+    pages = pdf_object.pages[::-1]
+    if max_pages is not None:
+        pages = pages[:max_pages]
+    for page in pages:
+        try:
+            with METRICS.timer("pdf_page_extract"):
+                text = page.extract_text()
+            METRICS.count("pdf_pages_scanned")
+            yield text
+        finally:
+            page.close()
+
+
+@METRICS.timed("check_pdf_for_next")
+def check_pdf_for_next(pdf_object, scanned_pages=None, max_pages=None):
     # acknowldgments are normally at the end so work backwards
-    text = ""
-    for page in pdf_object.pages[::-1]:
-        previous_page = page.extract_text()
-        if previous_page is None:
+    if max_pages is None:
+        max_pages = MAX_PDF_PAGES
+    page_texts = iter_page_texts(pdf_object, max_pages)
+    return check_pages_for_next(page_texts, scanned_pages)
+
+
+def check_pages_for_next(page_texts, scanned_pages=None):
+    """Check pages of text, ordered back to front, for NExT.
+    If scanned_pages is a list the text of each page checked,
+    as extracted, is appended to it"""
+    verdicts = check_pages_for_institutes(page_texts, NEXT_RULE_SET,
+                                          scanned_pages)
+    return verdicts["NExT"].is_member
+
+
+def check_pages_for_institutes(page_texts, rule_set, scanned_pages=None):
+    """Check pages of text, ordered back to front, for every
+    institute in an institutes.RuleSet, in a single pass.
+    Stops early if every institute has been found.
+    If scanned_pages is a list the text of each page checked,
+    as extracted, is appended to it.
+    Returns a dict of institutes.Verdict, keyed by institute"""
+    scanner = rule_set.scanner()
+    verdicts = scanner.verdicts()
+    n_pages = 0
+    for page_text in page_texts:
+        n_pages += 1
+        if page_text is None:
             continue
-        previous_page = tools.alpha_only(page.extract_text())
-        text = previous_page + " " + text
-        if check_text_is_next(text):
-            return True
-    if len(text.strip()) == 0:
+        if scanned_pages is not None:
+            scanned_pages.append(page_text)
+        page_text = tools.alpha_only(page_text)
+        with METRICS.timer("acknowledgement_search"):
+            scanner.prepend(page_text)
+            verdicts = scanner.verdicts()
+        if all(verdict.is_member for verdict in verdicts.values()):
+            break
+    METRICS.observe("pages_before_verdict", n_pages)
+    if len(scanner.text.strip()) == 0:
         logging.warning("PDF appears empty")
-    return False
+    log_verdicts(verdicts)
+    return verdicts
+
+
+def pages_before_verdict(page_texts, rule_set):
+    """The pages, ordered back to front, that check_pages_for_institutes
+    would have read with rule_set before stopping.
+    So text scanned with other rules can be hashed as if it hadn't been"""
+    scanner = rule_set.scanner()
+    pages = []
+    for page_text in page_texts:
+        if page_text is None:
+            continue
+        pages.append(page_text)
+        scanner.prepend(tools.alpha_only(page_text))
+        if all(verdict.is_member for verdict in scanner.verdicts().values()):
+            break
+    return pages
+
+
+def log_verdicts(verdicts):
+    for name, verdict in verdicts.items():
+        if verdict.is_member:
+            logging.log(LOGLEVEL, f'Classified as {name} due to; "{verdict.evidence}"')
 
 
 def check_text_is_next(clean_text):
     """Check if a given string represents
     the text of a NExT collaboration paper"""
-    next_string = "NExT"
-    if next_string not in clean_text:
-        return False
-    start_acknowldgments = clean_text.find("cknowledgement")
-    if start_acknowldgments == -1:
-        start_acknowldgments = clean_text.find("cknowledgment")
-    if start_acknowldgments == -1:
-        start_acknowldgments = clean_text.find("thank")
-    if start_acknowldgments == -1:
-        start_acknowldgments = clean_text.find("Thank")
-    if start_acknowldgments == -1:
-        # no idea where the acknowldgments start,
-        # require full string
-        # but ignore spacing
-        institute_string = "NExTInstitute"
-        clean_text = clean_text.replace(" ", "")
-        next_string = institute_string
-        start_acknowldgments = 0
-    is_next = next_string in clean_text[start_acknowldgments:]
-    if is_next:
-        location = clean_text.find(next_string)
-        context = clean_text[max(location - 20, 0): location + 30]
-        logging.log(LOGLEVEL, f'Classified as NExT due to; "{context}"')
-    return is_next
-
-
-def check_is_next(arxiv_id):
-    """Check if an arXiv id refers to a paper from NExT"""
-    pdf_object = get_paper_pdf(arxiv_id)
-    return check_pdf_for_next(pdf_object)
+    verdicts = NEXT_RULE_SET.classify(clean_text)
+    log_verdicts(verdicts)
+    return verdicts["NExT"].is_member
+
+
+def acknowledgement_hash(scanned_pages, rule_set=None):
+    """A short hash of the acknowledgments in pages of text,
+    ordered back to front, to tell if a new version changed them.
+    The acknowledgments are found with the anchors of rule_set,
+    which defaults to NEXT_RULE_SET. Without an anchor the verdict
+    comes from the compact patterns, searched over all the text,
+    so all the text, ignoring spacing, is hashed"""
+    if rule_set is None:
+        rule_set = NEXT_RULE_SET
+    clean_text = ' '.join(tools.alpha_only(page) for page in scanned_pages[::-1])
+    acknowledgements = rule_set.acknowledgements(clean_text)
+    if not acknowledgements:
+        acknowledgements = ''.join(clean_text.split())
+    return hashlib.sha1(acknowledgements.encode()).hexdigest()[:16]
+
+
+def check_paper(arxiv_id, corpus=None, version=None):
+    """Check if an arXiv id refers to a paper from NExT,
+    looking at the given version, or the latest if version is None.
+    If a TextCorpus is given the text of the paper is saved in it,
+    see read_rest_of_paper.
+    Returns if it is NExT, and the acknowledgement_hash"""
+    scanned_pages = []
+    pdf_id = arxiv_id if version is None else f"{arxiv_id}v{version}"
+    with get_paper_pdf(pdf_id) as pdf_object:
+        page_texts = iter_page_texts(pdf_object, MAX_PDF_PAGES)
+        with METRICS.timer("check_pdf_for_next"):
+            is_next = check_pages_for_next(page_texts, scanned_pages)
+        ack_hash = acknowledgement_hash(scanned_pages)
+        if corpus is not None:
+            read_rest_of_paper(page_texts, scanned_pages)
+            corpus.add(arxiv_id, scanned_pages, version)
+    return is_next, ack_hash
+
+
+def read_rest_of_paper(page_texts, scanned_pages):
+    """The scan stops once a paper is judged, so add the pages it
+    didn't reach, so the corpus holds every page (up to MAX_PDF_PAGES),
+    back to front and as extracted, digits and all,
+    for whatever rules are used later"""
+    scanned_pages.extend(text for text in page_texts if text is not None)
+
+
+def check_is_next(arxiv_id, corpus=None, version=None):
+    """Check if an arXiv id refers to a paper from NExT.
+    If a TextCorpus is given the text scanned is saved in it"""
+    return check_paper(arxiv_id, corpus, version)[0]
 
 
 class KnownAuthors:
     """Keep track of authors we have seen"""
     field_sep = "#"
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, history=None):
         self.file_path = file_path
+        # an author_history.AuthorHistory, to record the cost of each search
+        self.history = history
         self.is_next = set()
         self.not_next = set()
         self.maybe_next = set()
@@ -107,6 +239,7 @@ class KnownAuthors:
                     f"{len(self.maybe_next)} possible NExT authors, " +
                     f"{len(self.not_next)} non-NExT authors, ")
 
+    @METRICS.timed("known_authors_save")
     def save(self):
         """Write the authors to disk """
         text = ""
@@ -121,14 +254,21 @@ class KnownAuthors:
             text += name + maybe_suffix
         with open(self.file_path, 'w') as file_obj:
             file_obj.write(text)
+        if self.history is not None:
+            self.history.save()
         logging.log(LOGLEVEL, f"Written authors to {self.file_path}")
 
+    @staticmethod
+    def normalise(name):
+        """The form names are kept in, "I. Last" """
+        initial, last = latex_bib.get_initial_last(name)
+        return f"{initial}. {last}" if initial is not None else last
+
     def add_author(self, name, membership="maybe", new=True):
         """We only use a name becuase no other field is garenteed to be consistant
         Overscanning shouldn't be too much of an issue"""
         membership = membership.lower()
-        initial, last = latex_bib.get_initial_last(name)
-        name = f"{initial}. {last}" if initial is not None else last
+        name = self.normalise(name)
         # remove it from maybe
         if "no" in membership:
             self.not_next.add(name)
@@ -156,6 +296,7 @@ class KnownAuthors:
         return self.is_next.union(self.maybe_next)
 
 
+@METRICS.timed("xml_entry_to_bib")
 def xml_entry_to_bib(xml_entry):
     bib_fields = {"archivePrefix": "arXiv"}
     authors = []
@@ -190,13 +331,30 @@ def xml_entry_to_bib(xml_entry):
             # journal, pages and volume
             bib_fields["journal"] = part.text
     bib_fields["author"] = ' and '.join(authors)
+    # titles and abstracts can be unbalanced, BibEntry balances them
     bib_entry = latex_bib.BibEntry(bib_fields, entry_type="article")
     return bib_entry, last_update, authors
 
 
 class KnownPapers:
     """Keep track of papers we have found """
-    def __init__(self, file_is_next, file_not_next):
+    def __init__(self, file_is_next, file_not_next, corpus=None,
+                 retry_queue=None, negative_cache=None, revision_queue=None,
+                 classify=None, workers=None):
+        # processes to read large bib files with
+        self.workers = workers
+        # if given, used in place of check_paper to judge new papers,
+        # called with (arxiv_id, corpus, version)
+        self.classify = classify
+        # if given, a TextCorpus to keep the text of new papers in
+        self.corpus = corpus
+        # if given, failures.RetryQueue and failures.NegativeCache
+        # to record papers that couldn't be checked
+        self.retry_queue = retry_queue
+        self.negative_cache = negative_cache
+        # if given, a revisions.RevisionQueue of papers
+        # to check again because they have a new version
+        self.revision_queue = revision_queue
         self.file_is_next, self.is_next, self.ids_is_next = \
             self.__setup(file_is_next)
         logging.log(LOGLEVEL, f"In {file_is_next} found {len(self.is_next)} items")
@@ -209,10 +367,11 @@ class KnownPapers:
                 f"Expected a '.bib' file, found {file_path}"
         ids = {}  # key is arxiv id, value is bib key
         if os.path.exists(file_path):
-            bib_data = latex_bib.Bibliography(file_path)
+            bib_data = latex_bib.Bibliography(file_path, self.workers)
             for key, entry in bib_data.items():
                 try:
-                    arxiv_id = entry.fields['eprint'].split('v')[0]
+                    arxiv_id, _ = text_corpus.split_arxiv_version(
+                        entry.fields['eprint'])
                 except KeyError as err:
                     msg = f"Couldn't find 'eprint' in entry {key}\n" + \
                           f"Has fields;\n{entry.fields.keys()}"
@@ -222,9 +381,16 @@ class KnownPapers:
             bib_data = latex_bib.Bibliography()
         return file_path, bib_data, ids
 
+    @METRICS.timed("known_papers_save")
     def save(self):
         self.is_next.save(self.file_is_next)
         self.not_next.save(self.file_not_next)
+        if self.retry_queue is not None:
+            self.retry_queue.save()
+        if self.negative_cache is not None:
+            self.negative_cache.save()
+        if self.revision_queue is not None:
+            self.revision_queue.save()
         logging.log(LOGLEVEL, f"Written bibs to {self.file_is_next} and {self.file_not_next}")
 
     def update_paper(self, arxiv_id, new_entry, in_next):
@@ -241,11 +407,25 @@ class KnownPapers:
         new_date = datetime.fromisoformat(new_date)
         if new_date > existing_date:
             logging.log(LOGLEVEL, f"Found update for {arxiv_id}")
+            existing = bib_object[key].fields
+            _, old_version = text_corpus.split_arxiv_version(existing["eprint"])
+            _, new_version = text_corpus.split_arxiv_version(
+                new_entry.fields["eprint"])
+            # the hash is for the text of the version last checked
+            for field in ("ack_hash", "detected"):
+                if field in existing:
+                    new_entry.fields[field] = existing[field]
             new_entry.key = key  # don't change the key
             bib_object[key] = new_entry
+            if self.revision_queue is not None and new_version is not None \
+                    and (old_version is None or new_version > old_version):
+                logging.log(LOGLEVEL, f"{arxiv_id} is now v{new_version}, " +
+                            "it will be checked again")
+                self.revision_queue.add(arxiv_id, new_version)
 
     def add_paper(self, bib_entry):
-        arxiv_id = bib_entry.fields['eprint'].split('v')[0]
+        arxiv_id, version = text_corpus.split_arxiv_version(
+            bib_entry.fields['eprint'])
         # check if we have it
         if arxiv_id in self.ids_is_next:
             next_paper = True
@@ -254,15 +434,32 @@ class KnownPapers:
             next_paper = False
             self.update_paper(arxiv_id, bib_entry, next_paper)
         else:  # new entry
-            try:
-                next_paper = check_is_next(arxiv_id)
-            except pdfplumber.pdfminer.pdfparser.PDFSyntaxError:
-                logging.warning(f"Failed to get PDF for {arxiv_id}")
+            if self.negative_cache is not None and \
+                    arxiv_id in self.negative_cache:
+                logging.log(LOGLEVEL, f"{arxiv_id} is known to fail, skipping")
                 return False
+            started = time.monotonic()
+            try:
+                next_paper, ack_hash = self._classify(arxiv_id, version)
             except Exception as e:
-                logging.warning(f"Unknown error in PDF {arxiv_id}")
-                logging.warning(str(e))
+                # pdfminer is only loaded if a PDF was opened,
+                # and can only have raised if it was
+                pdfparser = sys.modules.get("pdfminer.pdfparser")
+                if pdfparser is not None and \
+                        isinstance(e, pdfparser.PDFSyntaxError):
+                    logging.warning(f"Failed to get PDF for {arxiv_id}")
+                else:
+                    logging.warning(f"Unknown error in PDF {arxiv_id}")
+                    logging.warning(str(e))
+                self.record_failure(arxiv_id, bib_entry, e)
                 return False
+            EVENTS.emit("paper_classified", arxiv_id=arxiv_id,
+                        is_next=next_paper,
+                        seconds=round(time.monotonic() - started, 3))
+            if self.retry_queue is not None:
+                self.retry_queue.discard(arxiv_id)
+            bib_entry.fields["ack_hash"] = ack_hash
+            bib_entry.fields["detected"] = datetime.now().isoformat(timespec="seconds")
             if next_paper:
                 logging.log(LOGLEVEL, f"Added {arxiv_id} as NExT")
                 self.ids_is_next[arxiv_id] = bib_entry.key
@@ -273,84 +470,327 @@ class KnownPapers:
                 self.not_next.add_entry(bib_entry)
         return next_paper
 
+    def record_failure(self, arxiv_id, bib_entry, error):
+        """Put a paper that couldn't be checked in the retry queue
+        if the problem might go away, otherwise in the negative cache"""
+        if tools.is_transient(error) and self.retry_queue is not None:
+            attempts = self.retry_queue.add(arxiv_id, bib_entry, error)
+            if attempts < failures.MAX_ATTEMPTS:
+                logging.log(LOGLEVEL, f"Will retry {arxiv_id}")
+                return
+            self.retry_queue.discard(arxiv_id)
+        if self.negative_cache is not None:
+            logging.log(LOGLEVEL, f"Giving up on {arxiv_id} for now")
+            self.negative_cache.add(arxiv_id, error)
+
+    def _classify(self, arxiv_id, version):
+        classify = check_paper if self.classify is None else self.classify
+        return classify(arxiv_id, self.corpus, version)
+
+    def move_paper(self, arxiv_id, to_next):
+        """Move a paper from one bib to the other, keeping its key"""
+        if to_next:
+            key = self.ids_not_next.pop(arxiv_id)
+            self.ids_is_next[arxiv_id] = key
+            self.is_next.add_entry(self.not_next[key])
+            del self.not_next[key]
+        else:
+            key = self.ids_is_next.pop(arxiv_id)
+            self.ids_not_next[arxiv_id] = key
+            self.not_next.add_entry(self.is_next[key])
+            del self.is_next[key]
+
+    def reclassify_revised(self, budget=None):
+        """Download and check again papers in the revision queue,
+        at most budget of them, moving any whose verdict changes.
+        Returns a list of (arxiv_id, was_next, now_next) for the moves"""
+        if self.revision_queue is None:
+            return []
+        if budget is None:
+            budget = revisions.RECLASSIFY_BUDGET
+        changes = []
+        for arxiv_id, version in self.revision_queue.take(budget):
+            if arxiv_id in self.ids_is_next:
+                was_next, entry = True, self.is_next[self.ids_is_next[arxiv_id]]
+            elif arxiv_id in self.ids_not_next:
+                was_next, entry = False, self.not_next[self.ids_not_next[arxiv_id]]
+            else:
+                continue
+            try:
+                now_next, ack_hash = self._classify(arxiv_id, version)
+            except Exception as e:
+                logging.warning(f"Couldn't check {arxiv_id}v{version} again, {e}")
+                if tools.is_transient(e):
+                    self.revision_queue.add(arxiv_id, version)
+                continue
+            EVENTS.emit("paper_reclassified", arxiv_id=arxiv_id, version=version,
+                        was_next=was_next, is_next=now_next)
+            if ack_hash == entry.fields.get("ack_hash"):
+                logging.log(LOGLEVEL, f"Acknowledgments of {arxiv_id} unchanged")
+                continue
+            entry.fields["ack_hash"] = ack_hash
+            if now_next != was_next:
+                logging.log(LOGLEVEL, f"{arxiv_id}v{version} moved, " +
+                            f"{'now' if now_next else 'no longer'} NExT")
+                self.move_paper(arxiv_id, now_next)
+                changes.append((arxiv_id, was_next, now_next))
+        return changes
+
+    def is_known(self, arxiv_id):
+        return arxiv_id in self.ids_is_next or arxiv_id in self.ids_not_next
+
+    def retry_failed(self):
+        """Try again all the papers in the retry queue that are due.
+        Returns a list of the arxiv ids found to be NExT"""
+        if self.retry_queue is None:
+            return []
+        due = self.retry_queue.due()
+        logging.log(LOGLEVEL, f"Retrying {len(due)} papers")
+        found = []
+        for arxiv_id, entry_string in due:
+            if self.add_paper(latex_bib.BibEntry(entry_string)):
+                found.append(arxiv_id)
+        return found
+
 
 def check_author_name(known_papers, known_authors, author, start_date):
     # author names tend to be given "first last"
     # for a search string we need last,&first
     initial, last = latex_bib.get_initial_last(author)
-    author = f"{last},&{initial}" if initial is not None else last
-    query = f"http://export.arxiv.org/api/query?search_query=au:{author}&sortBy=lastUpdatedDate&sortOrder=descending&start="
+    search_name = f"{last},&{initial}" if initial is not None else last
+    query = f"{ARXIV_API_URL}?search_query=au:{search_name}&sortBy=lastUpdatedDate&sortOrder=descending&start="
     page = 0
     # willing to check 3 pages of results before giving up on this author
     patience = 3
     page_without_next = 0
-    while page_without_next < patience:
+    # for the author history
+    pages = 0
+    new_papers = 0
+    found_next = 0
+    reached_start = False
+    while page_without_next < patience and not reached_start:
         xml_string = tools.request_url(query + str(page))
         xml_tree = xml.etree.ElementTree.fromstring(xml_string)
+        EVENTS.emit("page_fetched", author=search_name, page=page)
+        pages += 1
         page_without_next += 1
         has_entry = False
         for part in xml_tree:
             if part.tag.endswith("entry"):
                 has_entry = True
                 bib_entry, last_update, paper_authors = xml_entry_to_bib(part)
+                arxiv_id, _ = text_corpus.split_arxiv_version(
+                    bib_entry.fields['eprint'])
+                is_new = not known_papers.is_known(arxiv_id)
+                new_papers += is_new
                 is_next = known_papers.add_paper(bib_entry)
                 if is_next:
+                    found_next += is_new
                     page_without_next = 0
                     for paper_author in paper_authors:
                         known_authors.add_author(paper_author)
                 if last_update < start_date:
-                    return
+                    reached_start = True
+                    break
         if not has_entry:
             break  # if there was nothing on this page stop checking
         page += 1
+    if known_authors.history is not None:
+        known_authors.history.record(author, pages, new_papers,
+                                     found_next, start_date)
+
+
+def try_author_name(known_papers, known_authors, author, start_date,
+                    frontier=None):
+    """Like check_author_name, but if the requests keep failing
+    for reasons that might go away the author is just skipped.
+    frontier is the number of authors still waiting after this one,
+    it's only used for the event log"""
+    if frontier is None:
+        frontier = len(known_authors.new)
+    EVENTS.emit("author_start", author=author, frontier=frontier)
+    try:
+        check_author_name(known_papers, known_authors, author, start_date)
+    except Exception as error:
+        if not tools.is_transient(error):
+            raise
+        logging.warning(f"Skipping author {author} this time, {error}")
+        EVENTS.emit("author_end", author=author, skipped=True)
+        return
+    EVENTS.emit("author_end", author=author, skipped=False)
+
+
+def read_last_run(prefix, default="2021-04-01"):
+    """The date in prefix + "last_run.txt", as a datetime"""
+    date_file = prefix + "last_run.txt"
+    if os.path.exists(date_file):
+        with open(date_file, 'r') as date_f:
+            return datetime.fromisoformat(date_f.read().strip())
+    return datetime.fromisoformat(default)
+
+
+def load_known(prefix, classify=None, workers=None):
+    """Read the papers and authors found in earlier runs,
+    returns KnownPapers and KnownAuthors.
+    classify and workers are passed on to KnownPapers"""
+    history = author_history.AuthorHistory(prefix + "author_history.json")
+    known_authors = KnownAuthors(prefix + "authors.txt", history)
+    is_next_bib_file = prefix + "is_NExT.bib"
+    not_next_bib_file = prefix + "not_NExT.bib"
+    corpus = text_corpus.TextCorpus(prefix + "text_corpus")
+    retry_queue = failures.RetryQueue(prefix + "retry_queue.json")
+    negative_cache = failures.NegativeCache(prefix + "failed_papers.json")
+    revision_queue = revisions.RevisionQueue(prefix + "revision_queue.json")
+    known_papers = KnownPapers(is_next_bib_file, not_next_bib_file, corpus,
+                               retry_queue, negative_cache, revision_queue,
+                               classify, workers)
+    return known_papers, known_authors
 
 
 # entry point!
-def check_for_papers(prefix="./"):
+def check_for_papers(prefix="./", record_metrics=True, authors=None,
+                     workers=None):
+    """Search for new NExT papers, starting from the authors
+    in prefix + "authors.txt".
+    If record_metrics, timings and counts for each stage are written to
+    prefix + "metrics.prom" and prefix + "metrics.json" at the end.
+    If authors is given, only those of the known authors are searched
+    (and any new authors found), and the date of the last run is left
+    alone, so the others are searched from the same date next time.
+    workers is the number of processes reading large bib files"""
+    if record_metrics:
+        METRICS.enable()
+        METRICS.reset()
     log_file = prefix + str(datetime.today().date()) + ".log"
     logging.basicConfig(filename=log_file, level=LOGLEVEL)
     print("To follow progress do \n" +
-          f" >> tail -f {log_file}")
+          f" >> tail -f {log_file}\n" +
+          "or for a summary with an ETA \n" +
+          f" >> python3 events.py follow {prefix}events.jsonl")
 
     date_file = prefix + "last_run.txt"
-    if os.path.exists(date_file):
-        with open(date_file, 'r') as date_f:
-            start_date = date_f.read().strip()
-    else:
-        start_date = "2021-04-01"
+    start_date = read_last_run(prefix)
     logging.log(LOGLEVEL, f"Checking back to date={start_date}")
-    start_date = datetime.fromisoformat(start_date)
 
-    authors_file = prefix + "authors.txt"
-    known_authors = KnownAuthors(authors_file)
+    known_papers, known_authors = load_known(prefix, workers=workers)
     if len(known_authors.pottential_next) == 0:
-        raise ValueError(f"No NExT authors in {authors_file}")
-
-    is_next_bib_file = prefix + "is_NExT.bib"
-    not_next_bib_file = prefix + "not_NExT.bib"
-    known_papers = KnownPapers(is_next_bib_file, not_next_bib_file)
+        raise ValueError(f"No NExT authors in {known_authors.file_path}")
+
+    existing = known_authors.pottential_next
+    if authors is not None:
+        authors = {KnownAuthors.normalise(author) for author in authors}
+        unknown = authors - existing
+        existing = existing.intersection(authors)
+        if not existing:
+            raise ValueError("None of the authors given are potential NExT " +
+                             f"authors in {known_authors.file_path}")
+        if unknown:
+            logging.warning(f"Skipping {len(unknown)} authors that aren't " +
+                            f"potential NExT authors; {sorted(unknown)}")
+
+    EVENTS.open(prefix + "events.jsonl")
+    EVENTS.emit("run_start", start_date=start_date.date(),
+                frontier=len(existing), papers=len(known_papers.ids_is_next) +
+                len(known_papers.ids_not_next))
 
     logging.log(LOGLEVEL, "Checking existing authors")
     save_interval = 5
-    for i, author in enumerate(known_authors.pottential_next):
+    checked = 0
+    for author in existing:
         logging.log(LOGLEVEL, f"Checking author {author}")
-        check_author_name(known_papers, known_authors, author, start_date)
-        if i % save_interval == 0:
-            known_papers.save()
-            known_authors.save()
-    logging.log(LOGLEVEL, f"Checking {len(known_authors.new)} new authors")
-    while known_authors.new:
-        author = known_authors.new.pop()
-        logging.log(LOGLEVEL, f"Checking new author {author}")
-        check_author_name(known_papers, known_authors, author, start_date)
-        i += 1
-        if i % save_interval == 0:
-            known_papers.save()
-            known_authors.save()
+        frontier = len(existing) - checked - 1 + len(known_authors.new)
+        try_author_name(known_papers, known_authors, author, start_date,
+                        frontier)
+        if checked % save_interval == 0:
+            checkpoint(known_papers, known_authors)
+        checked += 1
+    # the retry queue is drained once, and any new authors
+    # from the papers retried are checked after it
+    retried = False
+    while known_authors.new or not retried:
+        logging.log(LOGLEVEL, f"Checking {len(known_authors.new)} new authors")
+        while known_authors.new:
+            author = known_authors.new.pop()
+            logging.log(LOGLEVEL, f"Checking new author {author}")
+            try_author_name(known_papers, known_authors, author, start_date)
+            checked += 1
+            if checked % save_interval == 0:
+                checkpoint(known_papers, known_authors)
+        if not retried:
+            retried = True
+            found = known_papers.retry_failed()
+            # papers with a new version get a limited budget each run
+            found += [arxiv_id for arxiv_id, _, now_next
+                      in known_papers.reclassify_revised() if now_next]
+            for arxiv_id in found:
+                add_paper_authors(known_papers, known_authors, arxiv_id)
+
+    if authors is None:
+        with open(date_file, 'w') as date_f:
+            date_f.write(str(datetime.today().date()))
+    checkpoint(known_papers, known_authors)
+    if record_metrics:
+        METRICS.write(prefix)
+    EVENTS.emit("run_end")
+    EVENTS.close()
+    logging.log(LOGLEVEL, "Done")
+
 
-    with open(date_file, 'w') as date_f:
-        date_f.write(str(datetime.today().date()))
+def add_paper_authors(known_papers, known_authors, arxiv_id):
+    """Add the authors of a NExT paper as potential NExT authors"""
+    key = known_papers.ids_is_next[arxiv_id]
+    paper_authors = known_papers.is_next[key].fields["author"]
+    for paper_author in paper_authors.split(" and "):
+        known_authors.add_author(paper_author)
+
+
+def checkpoint(known_papers, known_authors):
     known_papers.save()
     known_authors.save()
-    logging.log(LOGLEVEL, "Done")
-
+    EVENTS.emit("checkpoint", is_next=len(known_papers.ids_is_next),
+                not_next=len(known_papers.ids_not_next),
+                authors=len(known_authors.pottential_next))
+    EVENTS.flush()
+
+
+def _reclassify_record(record):
+    data_path, rule_set, arxiv_id, version, offset, length = record
+    pages = text_corpus.read_record(data_path, offset, length)
+    verdicts = check_pages_for_institutes(pages, rule_set)
+    return arxiv_id, version, verdicts["NExT"].is_member
+
+
+def reclassify(prefix="./", workers=None, rule_set=None):
+    """Run the classification rules again over the saved text
+    of every paper, without downloading anything.
+    rule_set is the institutes.RuleSet to use, by default NEXT_RULE_SET.
+    Returns a list of (arxiv_id, was_next, now_next)
+    for each paper whose verdict has changed"""
+    if rule_set is None:
+        rule_set = NEXT_RULE_SET
+    corpus = text_corpus.TextCorpus(prefix + "text_corpus")
+    is_next_bib_file = prefix + "is_NExT.bib"
+    not_next_bib_file = prefix + "not_NExT.bib"
+    known_papers = KnownPapers(is_next_bib_file, not_next_bib_file)
+    records = [(corpus.data_path, rule_set, *record)
+               for record in corpus.records()]
+    logging.log(LOGLEVEL, f"Reclassifying {len(records)} papers")
+    import multiprocessing
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap(_reclassify_record, records, chunksize=16)
+        changes = []
+        for arxiv_id, version, now_next in results:
+            if arxiv_id in known_papers.ids_is_next:
+                was_next = True
+            elif arxiv_id in known_papers.ids_not_next:
+                was_next = False
+            else:
+                was_next = None  # text saved but paper never recorded
+            if was_next != now_next:
+                changes.append((arxiv_id, was_next, now_next))
+    for arxiv_id, was_next, now_next in changes:
+        message = f"{arxiv_id} was NExT={was_next}, now NExT={now_next}"
+        logging.log(LOGLEVEL, message)
+        print(message)
+    print(f"{len(changes)} of {len(records)} verdicts changed")
+    return changes
@@ -0,0 +1,146 @@
+"""Estimate the cost of the next crawl without sending any requests.
+Uses the history of each author's past searches, in prefix + "author_history.json".
+    python3 planner.py /path/to/NExT_papers/my_prefix_ --hours 8
+"""
+import sys
+import collections
+from datetime import datetime
+import tools
+import next_papers
+import author_history
+
+# guesses for authors never searched, when there is no history at all
+DEFAULT_PAGES = 3  # the patience in check_author_name
+DEFAULT_NEW_PER_DAY = 0.02
+DEFAULT_NEXT_PER_DAY = 0.005
+
+Estimate = collections.namedtuple("Estimate", ["author", "api_requests",
+                                               "pdf_requests", "found_next",
+                                               "seconds", "last_scan"])
+
+
+def rates(item):
+    """Pages per search, new papers per day and new NExT papers per day
+    from the totals of one author's history"""
+    days = max(item["days"], 1.)
+    return (item["pages"] / item["scans"], item["new_papers"] / days,
+            item["found_next"] / days)
+
+
+def default_rates(history):
+    """Rates for authors with no history of their own,
+    pooled over every author that has one"""
+    items = [item for item in history.items.values() if item["scans"]]
+    if not items:
+        return DEFAULT_PAGES, DEFAULT_NEW_PER_DAY, DEFAULT_NEXT_PER_DAY
+    totals = {field: sum(item[field] for item in items)
+              for field in ["scans", "pages", "new_papers", "found_next", "days"]}
+    return rates(totals)
+
+
+def estimate_author(author, history, start_date, now=None, defaults=None,
+                    period=None):
+    """The requests one author will take, back to start_date.
+    Only papers since the author was last searched need downloading"""
+    if now is None:
+        now = datetime.now()
+    if period is None:
+        # the api and the pdfs share the arxiv.org limit
+        period = tools.RATE_LIMITER.period("arxiv.org")
+    item = history.get(author)
+    last_scan = None
+    if item is None or not item["scans"]:
+        pages, new_per_day, next_per_day = \
+            default_rates(history) if defaults is None else defaults
+        since = start_date
+    else:
+        pages, new_per_day, next_per_day = rates(item)
+        last_scan = datetime.fromisoformat(item["last_scan"])
+        since = max(start_date, last_scan)
+    days = max((now - since).total_seconds() / 86400, 0)
+    api_requests = max(round(pages), 1)
+    pdf_requests = new_per_day * days
+    return Estimate(author, api_requests, pdf_requests, next_per_day * days,
+                    (api_requests + pdf_requests) * period, last_scan)
+
+
+def estimate(known_authors, start_date, now=None, period=None):
+    """An Estimate for each author waiting to be searched"""
+    history = known_authors.history
+    defaults = default_rates(history)
+    return [estimate_author(author, history, start_date, now, defaults, period)
+            for author in sorted(known_authors.pottential_next)]
+
+
+def choose_authors(estimates, seconds):
+    """Greedily pick the authors expected to find the most NExT papers
+    for their time, until the window is full.
+    Ties go to the author searched longest ago, never searched first"""
+    def priority(estimate):
+        value = estimate.found_next / max(estimate.seconds, 1.)
+        last_scan = estimate.last_scan.timestamp() \
+            if estimate.last_scan is not None else float("-inf")
+        return (-value, last_scan)
+    chosen = []
+    used = 0.
+    for estimate in sorted(estimates, key=priority):
+        if used + estimate.seconds <= seconds:
+            chosen.append(estimate)
+            used += estimate.seconds
+    return chosen
+
+
+def total(estimates):
+    """Sums of the api requests, pdf requests, NExT papers and seconds"""
+    return (sum(e.api_requests for e in estimates),
+            sum(e.pdf_requests for e in estimates),
+            sum(e.found_next for e in estimates),
+            sum(e.seconds for e in estimates))
+
+
+def report(estimates, label, out=sys.stdout):
+    api, pdf, found, seconds = total(estimates)
+    print(f"{label}: {len(estimates)} authors, {api} api requests, " +
+          f"about {pdf:.0f} pdfs, {seconds/3600:.1f} hours, " +
+          f"about {found:.1f} new NExT papers", file=out)
+
+
+def plan(prefix, hours=None, out_file=None, out=sys.stdout):
+    """Print the estimated cost of crawling from prefix.
+    If hours is given, choose the authors that fit in that time,
+    and write their names to out_file if given.
+    Authors found along the way add to the real cost"""
+    start_date = next_papers.read_last_run(prefix)
+    history = author_history.AuthorHistory(prefix + "author_history.json")
+    known_authors = next_papers.KnownAuthors(prefix + "authors.txt", history)
+    estimates = estimate(known_authors, start_date)
+    unseen = sum(e.last_scan is None for e in estimates)
+    print(f"Checking back to {start_date.date()}, " +
+          f"{unseen} authors have no history", file=out)
+    report(estimates, "All authors", out)
+    if hours is None:
+        return estimates
+    chosen = choose_authors(estimates, hours * 3600)
+    report(chosen, f"Within {hours} hours", out)
+    if out_file is not None:
+        with open(out_file, 'w') as file_obj:
+            file_obj.write(''.join(e.author + '\n' for e in chosen))
+        print(f"Written the authors to {out_file}", file=out)
+    return chosen
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("prefix")
+    parser.add_argument("--hours", type=float, default=None,
+                        help="Choose the authors that fit in this many hours")
+    parser.add_argument("--out", default=None,
+                        help="Write the chosen authors to this file")
+    args = parser.parse_args(args)
+    plan(args.prefix, args.hours, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import json
+import logging
+from datetime import datetime
+from tools import LOGLEVEL
+
+# papers waiting beyond this are dropped, oldest first
+MAX_QUEUED = 1000
+# papers re-fetched in each run, so a burst of revisions
+# doesn't swamp the crawl
+RECLASSIFY_BUDGET = 20
+
+
+class RevisionQueue:
+    """Papers with a new version on arXiv, waiting to be
+    downloaded and classified again.
+    Saved, so whatever doesn't fit in this run's budget is done in the next"""
+    def __init__(self, file_path, max_queued=MAX_QUEUED):
+        self.file_path = file_path
+        self.max_queued = max_queued
+        # key is arxiv id, value is dict with "version" and "queued",
+        # in the order they were added
+        self.items = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file_obj:
+                self.items = json.load(file_obj)
+        logging.log(LOGLEVEL, f"In {file_path} found {len(self.items)} revised papers")
+
+    def __contains__(self, arxiv_id):
+        return arxiv_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, arxiv_id, version):
+        # a later version replaces an earlier one, keeping its place
+        item = self.items.setdefault(arxiv_id,
+                                     {"queued": datetime.now().isoformat()})
+        item["version"] = version
+        while len(self.items) > self.max_queued:
+            dropped = next(iter(self.items))
+            logging.warning(f"Too many revised papers, dropping {dropped}")
+            del self.items[dropped]
+
+    def take(self, budget):
+        """Remove and return up to budget (arxiv id, version),
+        oldest first"""
+        taken = list(self.items.items())[:budget]
+        for arxiv_id, _ in taken:
+            del self.items[arxiv_id]
+        return [(arxiv_id, item["version"]) for arxiv_id, item in taken]
+
+    def save(self):
+        with open(self.file_path, 'w') as file_obj:
+            json.dump(self.items, file_obj, indent=1)
@@ -0,0 +1,355 @@
+"""Simulate a crawl against a local stand in for arXiv.
+Rate limit sleeps are counted on a virtual clock rather than waited out,
+so a crawl that would take hours runs in seconds, and changes to paging,
+batching or caching can be judged by the crawl time they would save.
+    python3 simulate.py --authors 50 --papers 400
+"""
+import os
+import time
+import json
+import logging
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+import collections
+import http.server
+import urllib.parse
+from datetime import datetime, timedelta
+import tools
+import metrics
+import latex_bib
+import next_papers
+
+# arXiv returns 10 results when max_results isn't given
+PAGE_SIZE = 10
+
+
+class VirtualClock:
+    """A clock for tools.RateLimiter where sleeping takes no time,
+    the time slept is added on to the time reported instead"""
+    def __init__(self):
+        self.slept = 0.
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        with self._lock:
+            return time.monotonic() + self.slept
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.slept += seconds
+
+
+Paper = collections.namedtuple("Paper", ["arxiv_id", "title", "authors",
+                                         "published", "updated", "is_next"])
+
+
+def make_graph(n_authors=30, n_papers=200, next_fraction=0.3,
+               authors_per_paper=4, seed=0, end_date=None):
+    """Synthetic authors and papers.
+    Returns a list of author names, and a list of Paper.
+    The papers are spread over the two years before end_date"""
+    rng = random.Random(seed)
+    if end_date is None:
+        end_date = datetime(2021, 6, 1)
+    authors = [f"{chr(ord('A') + i % 26)}. Author{i:04d}"
+               for i in range(n_authors)]
+    papers = []
+    for i in range(n_papers):
+        published = end_date - timedelta(days=rng.uniform(0, 730))
+        updated = published + timedelta(days=rng.uniform(0, 30))
+        n_paper_authors = min(authors_per_paper, n_authors)
+        papers.append(Paper(f"2101.{i:05d}v1", f"Synthetic paper {i}",
+                            rng.sample(authors, n_paper_authors),
+                            published, min(updated, end_date),
+                            rng.random() < next_fraction))
+    return authors, papers
+
+
+def make_pdf(pages):
+    """The bytes of a minimal PDF with a line of text on each page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2*i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2*len(pages)
+    for i, text in enumerate(pages):
+        text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] " +
+                       f"/Contents {4 + 2*i} 0 R " +
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        stream = f"BT /F1 10 Tf 20 700 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(data))
+        data += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode()
+    xref_start = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode()
+    data += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n" +
+             f"startxref\n{xref_start}\n%%EOF\n").encode()
+    return data
+
+
+def make_atom_page(papers):
+    text = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+        '<feed xmlns="http://www.w3.org/2005/Atom" ' + \
+        'xmlns:arxiv="http://arxiv.org/schemas/atom">\n'
+    for paper in papers:
+        authors = ''.join(f"<author><name>{name}</name></author>"
+                          for name in paper.authors)
+        text += f"<entry><id>http://arxiv.org/abs/{paper.arxiv_id}</id>" + \
+            f"<updated>{paper.updated.isoformat(timespec='seconds')}Z</updated>" + \
+            f"<published>{paper.published.isoformat(timespec='seconds')}Z</published>" + \
+            f"<title>{paper.title}</title><summary>Synthetic</summary>" + \
+            f"{authors}</entry>\n"
+    return text + "</feed>\n"
+
+
+class ArxivStandIn(http.server.ThreadingHTTPServer):
+    """Serves Atom pages for author searches and PDFs for papers,
+    from a synthetic graph, or from recorded responses.
+    Recorded responses are files in recorded_dir named by the
+    sha1 of the request path, as written by recording"""
+    daemon_threads = True
+
+    def __init__(self, papers, recorded_dir=None, port=0):
+        self.papers = {}
+        self.by_author = collections.defaultdict(list)
+        self.by_published = []
+        self.announce(papers)
+        self.recorded_dir = recorded_dir
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        super().__init__(("127.0.0.1", port), StandInHandler)
+
+    def announce(self, papers):
+        """Add papers to those served, as arXiv announces papers
+        that may have been submitted some time before"""
+        for paper in papers:
+            self.papers[paper.arxiv_id.split('v')[0]] = paper
+            for name in paper.authors:
+                _, last = latex_bib.get_initial_last(name)
+                self.by_author[last.lower()].append(paper)
+            self.by_published.append(paper)
+        for author_papers in self.by_author.values():
+            author_papers.sort(key=lambda paper: paper.updated, reverse=True)
+        self.by_published.sort(key=lambda paper: paper.published, reverse=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def listing(self, search, query):
+        """The papers for a category search, which may limit
+        the submission dates like submittedDate:[YYYYMMDDHHMM TO YYYYMMDDHHMM],
+        newest first unless sortOrder is ascending"""
+        found = self.by_published
+        if "submittedDate:[" in search:
+            dates = search.split("submittedDate:[", 1)[1].split("]")[0]
+            first, last = (datetime.strptime(date.strip(), "%Y%m%d%H%M")
+                           for date in dates.split(" TO "))
+            found = [paper for paper in found if first <=
+                     paper.published.replace(second=0, microsecond=0) <= last]
+        if query.get("sortOrder", ["descending"])[0] == "ascending":
+            found = found[::-1]
+        return found
+
+    def respond(self, path):
+        """Returns (status, content type, body) for a request path"""
+        parts = urllib.parse.urlsplit(path)
+        if self.recorded_dir is not None:
+            recorded = os.path.join(self.recorded_dir, recorded_name(path))
+            if os.path.exists(recorded):
+                self.requests["api" if parts.path.startswith("/api/query")
+                              else "pdf"] += 1
+                with open(recorded, 'rb') as recorded_file:
+                    return 200, "application/octet-stream", recorded_file.read()
+        if parts.path.startswith("/api/query"):
+            self.requests["api"] += 1
+            query = urllib.parse.parse_qs(parts.query)
+            search = query.get("search_query", [""])[0]
+            start = int(query.get("start", ["0"])[0])
+            max_results = int(query.get("max_results", [str(PAGE_SIZE)])[0])
+            if search.startswith("cat:"):
+                # every paper is in every category
+                return 200, "application/atom+xml", make_atom_page(
+                    self.listing(search, query)[start:start + max_results]).encode()
+            # the crawler asks for au:Last,&Initial
+            # so only the last name reaches the search
+            last = search.split("au:", 1)[-1].strip(" ,").lower()
+            found = self.by_author.get(last, [])[start:start + max_results]
+            return 200, "application/atom+xml", make_atom_page(found).encode()
+        if parts.path.startswith("/pdf/"):
+            self.requests["pdf"] += 1
+            arxiv_id = parts.path[len("/pdf/"):-len(".pdf")].split('v')[0]
+            paper = self.papers.get(arxiv_id)
+            if paper is None:
+                return 404, "text/plain", b"Not found"
+            thanks = "the NExT Institute" if paper.is_next else "our referees"
+            pages = [paper.title, "Some physics",
+                     f"Acknowledgements We thank {thanks}"]
+            return 200, "application/pdf", make_pdf(pages)
+        return 404, "text/plain", b"Not found"
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep alive
+    # headers and body go in separate writes, so don't wait to merge them
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        status, content_type, body = self.server.respond(self.path)
+        self.server.bytes_sent += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def recorded_name(url):
+    """The file a response is recorded in, the sha1 of the path
+    and query, which is what reaches the stand in"""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    return hashlib.sha1(path.encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def recording(recorded_dir):
+    """Save every response the crawler gets into recorded_dir,
+    for an ArxivStandIn to serve again;
+        with recording("responses"):
+            next_papers.check_for_papers(prefix)
+    """
+    original = tools.request_url
+
+    def request_url(url, out_file=None, max_bytes=None, retries=None):
+        data = original(url, max_bytes=max_bytes, retries=retries)
+        with open(os.path.join(recorded_dir, recorded_name(url)), 'wb') as saved:
+            saved.write(data)
+        if out_file is None:
+            return data
+        out_file.write(data)
+        return len(data)
+    tools.request_url = request_url
+    try:
+        yield
+    finally:
+        tools.request_url = original
+
+
+@contextlib.contextmanager
+def kept_state():
+    """The crawler sets up logging and metrics for itself,
+    put back those of the process it runs in when it is done"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    METRICS = metrics.METRICS
+    enabled, started = METRICS.enabled, METRICS.started
+    counters = dict(METRICS.counters)
+    summaries = {name: list(value) for name, value in METRICS.summaries.items()}
+    try:
+        yield
+    finally:
+        for handler in root.handlers[:]:
+            if handler not in handlers:
+                root.removeHandler(handler)
+                handler.close()
+        root.setLevel(level)
+        METRICS.enabled, METRICS.started = enabled, started
+        METRICS.counters.clear()
+        METRICS.counters.update(counters)
+        METRICS.summaries.clear()
+        METRICS.summaries.update(summaries)
+
+
+@contextlib.contextmanager
+def stand_in(papers, recorded_dir=None, clock=None):
+    """Serve papers from an ArxivStandIn, and point the crawler at it
+    with a rate limiter on a VirtualClock, until the block ends;
+        with stand_in(papers) as server:
+    """
+    server = ArxivStandIn(papers, recorded_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original = (tools.RATE_LIMITER, next_papers.ARXIV_API_URL,
+                next_papers.ARXIV_PDF_URL)
+    tools.RATE_LIMITER = tools.RateLimiter(clock=clock or VirtualClock())
+    next_papers.ARXIV_API_URL = server.base_url + "api/query"
+    next_papers.ARXIV_PDF_URL = server.base_url + "pdf/"
+    try:
+        yield server
+    finally:
+        tools.RATE_LIMITER, next_papers.ARXIV_API_URL, \
+            next_papers.ARXIV_PDF_URL = original
+        server.shutdown()
+        server.server_close()
+
+
+def simulate(n_authors=30, n_papers=200, next_fraction=0.3, n_seed_authors=3,
+             seed=0, recorded_dir=None, output_dir=None):
+    """Run check_for_papers against a stand in for arXiv,
+    starting from a few of the authors of NExT papers.
+    Returns a report as a dict"""
+    authors, papers = make_graph(n_authors, n_papers, next_fraction, seed=seed)
+    start_date = min(paper.updated for paper in papers) - timedelta(days=1)
+    next_authors = [name for paper in papers if paper.is_next
+                    for name in paper.authors]
+    seeds = list(dict.fromkeys(next_authors))[:n_seed_authors]
+    clock = VirtualClock()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        prefix = os.path.join(output_dir or temp_dir, "sim_")
+        with open(prefix + "authors.txt", 'w') as authors_file:
+            authors_file.write(''.join(f"{name} # yes\n" for name in seeds))
+        with open(prefix + "last_run.txt", 'w') as date_file:
+            date_file.write(str(start_date.date()))
+        cpu_start = time.process_time()
+        real_start = time.monotonic()
+        with kept_state():
+            with stand_in(papers, recorded_dir, clock) as server:
+                next_papers.check_for_papers(prefix)
+            real_time = time.monotonic() - real_start
+            summary = metrics.METRICS.summary()
+        found = latex_bib.Bibliography(prefix + "is_NExT.bib")
+    report = {"simulated_wall_time": real_time + clock.slept,
+              "rate_limit_sleep": clock.slept,
+              "real_time": real_time,
+              "cpu_time": time.process_time() - cpu_start,
+              "api_requests": server.requests["api"],
+              "pdf_requests": server.requests["pdf"],
+              "bytes_sent": server.bytes_sent,
+              "papers_found": len(found),
+              "next_papers_reachable": sum(paper.is_next for paper in papers),
+              "metrics": summary}
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("--authors", type=int, default=30)
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--next-fraction", type=float, default=0.3)
+    parser.add_argument("--seed-authors", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recorded", default=None,
+                        help="Directory of recorded responses")
+    args = parser.parse_args(args)
+    report = simulate(args.authors, args.papers, args.next_fraction,
+                      args.seed_authors, args.seed, args.recorded)
+    print(json.dumps(report, indent=1))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,230 @@
+import os
+import re
 import json
+import logging
+import threading
+import collections
+import concurrent.futures
+from datetime import datetime, timedelta
 import tools
 import latex_bib
+from tools import LOGLEVEL
+
+# identifiers asked for in each batched INSPIRE search,
+# the page size is set to match, as INSPIRE only sends 10 records by default
+BATCH_SIZE = 25
 
 # functions for reading latex files ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+# any natbib or biblatex cite command, like \cite, \citep*, \autocite,
+# \textcite or the capitalised \Cite and \Textcite, with up to two
+# optional arguments, then the keys
+CITE_PATTERN = r"(?P<command>\\[a-zA-Z]*[Cc]ite[a-zA-Z]*\*?" + \
+    r"(?:\s*\[[^\]]*\]){0,2}\s*\{)(?P<keys>[^}]*)\}"
+# biblatex multicite commands, like \cites[p.~4]{a,b}{c} or \parencites(see)(){a}{b},
+# have a group of keys for each cite, so must be matched before CITE_PATTERN
+MULTICITE_NAME = re.compile(r"\\[a-zA-Z]*[Cc]ites\*?")
+MULTICITE_PATTERN = r"(?P<multicite>" + MULTICITE_NAME.pattern + \
+    r"(?:\s*\([^)]*\)){0,2}(?:(?:\s*\[[^\]]*\]){0,2}\s*\{[^}]*\})+)"
+# each optional argument, or each group of keys, in a multicite
+MULTICITE_PART = re.compile(r"\([^)]*\)|\[[^\]]*\]|\{(?P<keys>[^}]*)\}")
+INPUT_PATTERN = r"\\(?:input|include|subfile)\s*\{(?P<file>[^}]*)\}"
+# the rest of a line after an unescaped %, so commented out
+# cites are left alone and commented out inputs aren't followed
+COMMENT_PATTERN = r"(?P<comment>(?<!\\)%[^\n]*)"
+TEX_PATTERN = re.compile("|".join([COMMENT_PATTERN, MULTICITE_PATTERN,
+                                   CITE_PATTERN, INPUT_PATTERN]))
+# biblatex writes \abx@aux@cite{key}, or \abx@aux@cite{refsection}{key}
+# bibtex writes \citation{key1,key2}, included files have their own aux
+AUX_PATTERN = re.compile(r"\\abx@aux@cite(?:\{\d+\})?\{(?P<biblatex>[^}]*)\}" +
+                         r"|\\citation\{(?P<bibtex>[^}]*)\}" +
+                         r"|\\@input\{(?P<file>[^}]*)\}")
+
+
 def get_ordered_citations(aux_path):
+    """The citation keys in an aux file, and the aux files of
+    any included files, in the order they are first cited"""
+    cites = {}  # dict as an ordered set
+    _read_aux(aux_path, cites, set())
+    return list(cites)
+
+
+def _read_aux(aux_path, cites, seen):
+    seen.add(os.path.abspath(aux_path))
     with open(aux_path, 'r') as aux_file:
         text = aux_file.read()
-    cite_start = "\\abx@aux@cite"
-    cites = []
-    untrimmed_cites = text.split(cite_start)[1:]
-    for untrimmed in untrimmed_cites:
-        end = tools.locate_closing_brace(untrimmed, 0)
-        if end == -1:
-            raise ValueError(f"No end to citation key {untrimmed} found")
-        cite = untrimmed[1: end]
-        if cite not in cites:
-            cites.append(cite)
-    return cites
+    for match in AUX_PATTERN.finditer(text):
+        if match.group("biblatex") is not None:
+            cites[match.group("biblatex").strip()] = None
+        elif match.group("bibtex") is not None:
+            for cite in match.group("bibtex").split(','):
+                cites[cite.strip()] = None
+        else:
+            included = os.path.join(os.path.dirname(aux_path),
+                                    match.group("file"))
+            if os.path.abspath(included) not in seen and \
+                    os.path.exists(included):
+                _read_aux(included, cites, seen)
 
 
 # functions for talking to inspires ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def get_inspire_key(bib_item, other_fields=None):
-    errors = {}
-    if isinstance(bib_item, dict):
-        bib_fields = bib_item
-    else:
-        bib_fields = bib_item.fields
+class InspireCache:
+    """Results of INSPIRE searches, kept on disk between runs.
+    Misses are kept too, for less time, as records get added"""
+    hit_ttl = timedelta(days=180)
+    miss_ttl = timedelta(days=14)
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        # key is like "doi:10.1103/...", value is dict with
+        # "key" (None for a miss), "other", "error" and "time"
+        self.items = {}
+        self._lock = threading.Lock()
+        if file_path is not None and os.path.exists(file_path):
+            with open(file_path, 'r') as cache_file:
+                self.items = json.load(cache_file)
+
+    def get(self, cache_key, other_fields=None):
+        """Returns the cached item, or None if it is unknown or stale"""
+        with self._lock:
+            item = self.items.get(cache_key)
+        if item is None:
+            return None
+        ttl = self.miss_ttl if item["key"] is None else self.hit_ttl
+        if datetime.fromisoformat(item["time"]) + ttl < datetime.now():
+            return None
+        if item["key"] is not None and \
+                any(field not in item["other"] for field in other_fields or []):
+            return None  # need to ask for more
+        return item
+
+    def put_hit(self, cache_key, inspire_key, other):
+        with self._lock:
+            self.items[cache_key] = {"key": inspire_key, "other": other,
+                                     "time": datetime.now().isoformat()}
+
+    def put_miss(self, cache_key, error):
+        with self._lock:
+            self.items[cache_key] = {"key": None, "error": str(error),
+                                     "time": datetime.now().isoformat()}
+
+    def save(self):
+        if self.file_path is None:
+            return
+        with self._lock:
+            text = json.dumps(self.items, indent=1)
+        with open(self.file_path, 'w') as cache_file:
+            cache_file.write(text)
+
+
+def normalise_title(title):
+    return ' '.join(tools.alpha_only(title).lower().split())
+
+
+def inspire_searches(bib_fields):
+    """The searches to try for an entry, most specific first,
+    as a list of (name, cache_key, search)"""
+    searches = []
     if "doi" in bib_fields:
         # can have more than 1 doi
         string = bib_fields["doi"].split(',', 1)[0]
         string = tools.strip_formating(string, whitespace=True)
-        search = f'find doi "{string}"'
-        try:
-            return _get_inspire_key(search, other_fields)
-        except ValueError as e:
-            errors["doi"] = e
+        searches.append(("doi", "doi:" + string.lower(),
+                         f'find doi "{string}"'))
         # sometimes this is actually an arXiv number
-        search = f'find eprint arxiv:{string}'
-        try:
-            return _get_inspire_key(search, other_fields)
-        except ValueError as e:
-            errors["arxiv"] = e
+        searches.append(("arxiv", "doi-arxiv:" + string.lower(),
+                         f'find eprint arxiv:{string}'))
     if "eprint" in bib_fields:
         string = bib_fields["eprint"].split(',', 1)[0]
         string = tools.strip_formating(string, whitespace=True)
-        search = f'find eprint "{string}"'
-        try:
-            return _get_inspire_key(search, other_fields)
-        except ValueError as e:
-            errors["eprint"] = e
+        searches.append(("eprint", "eprint:" + string.lower(),
+                         f'find eprint "{string}"'))
     if "title" in bib_fields:
         string = bib_fields["title"]
         string = tools.strip_formating(string, whitespace_to_space=True)
-        search = f'find title "{string}"'
-        try:
-            return _get_inspire_key(search, other_fields)
-        except ValueError as e:
-            errors["title"] = e
+        searches.append(("title", "title:" + normalise_title(string),
+                         f'find title "{string}"'))
     if "author" in bib_fields:
         string = bib_fields["author"]
         string = tools.strip_formating(string, whitespace_to_space=True,
                                        comma=True, dot=True)
         string = string.replace('and', '')
-        search = f'find author "{string}"'
+        searches.append(("author", "author:" + ' '.join(string.split()),
+                         f'find author "{string}"'))
+    return searches
+
+
+def get_inspire_key(bib_item, other_fields=None, cache=None):
+    """Try each search for an entry in turn, returns the
+    (key, other) of the first that finds a unique record.
+    If an InspireCache is given, searches already made are not repeated"""
+    errors = {}
+    if isinstance(bib_item, dict):
+        bib_fields = bib_item
+    else:
+        bib_fields = bib_item.fields
+    for name, cache_key, search in inspire_searches(bib_fields):
+        item = None if cache is None else cache.get(cache_key, other_fields)
+        if item is not None:
+            if item["key"] is None:
+                errors[name] = ValueError(item["error"])
+                continue
+            other = {field: item["other"][field]
+                     for field in other_fields or []}
+            return item["key"], other
         try:
-            return _get_inspire_key(search, other_fields)
+            key, other = _get_inspire_key(search, other_fields)
         except ValueError as e:
-            errors["author"] = e
+            errors[name] = e
+            if cache is not None:
+                cache.put_miss(cache_key, e)
+            continue
+        if cache is not None:
+            cache.put_hit(cache_key, key, other)
+        return key, other
     raise ValueError(str(errors))
 
 
+def resolve_inspire_keys(biblography, cache=None, workers=4, other_fields=None):
+    """Find the INSPIRE key of every entry in a Bibliography.
+    Entries already in the cache are done straight away, the rest
+    are shared between worker threads, which all wait on the rate limit.
+    Returns a dict with bib keys as keys, and (key, other) as values,
+    or the ValueError for entries that could not be found"""
+    if cache is None:
+        cache = InspireCache()
+    resolved = {}
+
+    def resolve(entry):
+        try:
+            return get_inspire_key(entry, other_fields, cache)
+        except ValueError as e:
+            return e
+    to_search = []
+    for key, entry in biblography.items():
+        searches = inspire_searches(entry.fields)
+        cached = [cache.get(cache_key, other_fields)
+                  for _, cache_key, _ in searches]
+        # if anything is unknown before the first hit, we must ask
+        for item in cached:
+            if item is None:
+                to_search.append(key)
+                break
+            if item["key"] is not None:
+                resolved[key] = resolve(entry)
+                break
+        else:
+            resolved[key] = resolve(entry)
+    if to_search:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            results = executor.map(resolve, [biblography[key] for key in to_search])
+            for key, result in zip(to_search, results):
+                resolved[key] = result
+    cache.save()
+    return resolved
+
+
 def _get_inspire_key(search, other_fields=None):
     if other_fields is None:
         other_fields = []
@@ -82,7 +235,13 @@ def _get_inspire_key(search, other_fields=None):
         raise ValueError("Not enough unique info")
     if len(data) == 0:
         raise ValueError(f"No match found for {search}")
-    key_list = data[0][key_tag]
+    key = record_inspire_key(data[0])
+    other = {field: data[0][field] for field in other_fields}
+    return key, other
+
+
+def record_inspire_key(record):
+    key_list = record["system_control_number"]
     if isinstance(key_list, dict):
         key_list = [key_list]
     try:
@@ -91,14 +250,98 @@ def _get_inspire_key(search, other_fields=None):
                    or k['institute'] == 'INSPIRETeX')
     except StopIteration:
         raise ValueError(f"No Inspires key in {key_list}")
-    other = {field: data[0][field] for field in other_fields}
-    return key, other
+    return key
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
 
 
-def query_inspire(search_pattern, out_tags=None):
+def normalise_eprint(eprint):
+    eprint = eprint.strip().lower()
+    if eprint.startswith("arxiv:"):
+        eprint = eprint[len("arxiv:"):]
+    arxiv_id, sep, version = eprint.rpartition('v')
+    if sep and version.isdigit() and arxiv_id:
+        eprint = arxiv_id
+    return eprint
+
+
+def batch_resolve(biblography, cache=None, workers=4, other_fields=None,
+                  batch_size=BATCH_SIZE):
+    """Find the INSPIRE key of every entry in a Bibliography,
+    searching for many DOIs and eprints at once with OR combined searches.
+    What is left is found by resolve_inspire_keys, one entry at a time.
+    Returns the same as resolve_inspire_keys"""
+    if cache is None:
+        cache = InspireCache()
+    if other_fields is None:
+        other_fields = []
+    import http.client  # slow to import, so only loaded for requests
+    # each identifier term, with the cache keys it answers
+    terms = {}
+    for key, entry in biblography.items():
+        searches = inspire_searches(entry.fields)
+        if any(cache.get(cache_key, other_fields) is not None
+               for _, cache_key, _ in searches):
+            continue  # this one was looked at before
+        for name, cache_key, _ in searches:
+            identifier = cache_key.split(':', 1)[1]
+            if name == "doi" or (name == "arxiv" and
+                                 identifier.startswith("10.")):
+                # a real DOI won't be found as an eprint
+                terms.setdefault(("doi", identifier), []).append(cache_key)
+            elif name in ("arxiv", "eprint"):
+                identifier = normalise_eprint(identifier)
+                terms.setdefault(("eprint", identifier), []).append(cache_key)
+    terms = list(terms.items())
+    out_tags = ["system_control_number", "doi", "primary_report_number",
+                *other_fields]
+    for start in range(0, len(terms), batch_size):
+        batch = terms[start:start + batch_size]
+        search = "find " + " or ".join(f'{kind} "{identifier}"'
+                                       for (kind, identifier), _ in batch)
+        try:
+            # room for a term to match more than one record, so it can be seen
+            data = query_inspire(search, out_tags, records=2*len(batch))
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            # request errors, or a response that isn't JSON
+            logging.log(LOGLEVEL, f"Batch search failed, {e}")
+            continue
+        # work out which identifier each record belongs to
+        matches = collections.defaultdict(list)
+        for record in data:
+            for doi in _as_list(record.get("doi")):
+                matches[("doi", str(doi).lower())].append(record)
+            for report in _as_list(record.get("primary_report_number")):
+                matches[("eprint", normalise_eprint(str(report)))].append(record)
+        for term, cache_keys in batch:
+            records = matches.get(term, [])
+            if len(records) != 1:
+                # not found, or not unique, so the single searches
+                # will have to decide, nothing is cached
+                continue
+            try:
+                inspire_key = record_inspire_key(records[0])
+            except (KeyError, ValueError):
+                continue
+            other = {field: records[0].get(field) for field in other_fields}
+            for cache_key in cache_keys:
+                cache.put_hit(cache_key, inspire_key, other)
+    return resolve_inspire_keys(biblography, cache, workers, other_fields)
+
+
+def query_inspire(search_pattern, out_tags=None, records=None):
+    """Records is the most records to send back, INSPIRE's default is 10"""
     search_pattern = search_pattern.replace(' ', '+').replace("/", "%2F")
     url = "http://old.inspirehep.net/search?p=" + search_pattern
     url += "&of=recjson"
+    if records is not None:
+        url += f"&rg={records}"
     if out_tags is not None:
         if isinstance(out_tags, str):
             out_tags = [out_tags]
@@ -110,49 +353,113 @@ def query_inspire(search_pattern, out_tags=None):
 
 # functions for writing latex files ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def update_entries_in_bib(biblography, cite_order):
+def update_entries_in_bib(biblography, cite_order, cache=None, workers=4):
     updated_key_dict = {}
+    report = latex_bib.normalise_bibliography(biblography, author_form=None)
+    for row in zip(*report.values()):
+        logging.log(LOGLEVEL, "In bib entry {}, field {}: {} {}".format(*row))
+    found = batch_resolve(biblography, cache, workers)
     for key, entry in biblography.items():
-        month = entry.fields["month"]
-        entry.fields["month"] = tools.month_to_numeric(month)
-        try:
-            new_key, _ = get_inspire_key(entry)
-        except ValueError:
+        if isinstance(found[key], ValueError):
             print(f"Didn't find {entry.fields['title']} in INSPIRES")
             new_key = latex_bib.make_bib_key(entry)
+        else:
+            new_key, _ = found[key]
         updated_key_dict[key] = new_key
     for old_key, new_key in updated_key_dict.items():
         biblography.change_key(old_key, new_key)
     # make sure there are no duplicates in the new cite order
-    new_cite_order = []
-    for key in cite_order:
-        new_key = updated_key_dict[key]
-        if new_key not in new_cite_order:
-            new_cite_order.append(new_key)
+    new_cite_order = list(dict.fromkeys(updated_key_dict[key]
+                                        for key in cite_order))
     return biblography, new_cite_order, updated_key_dict
 
 
-def update_bib_keys_in_tex(tex_file_name, updated_dict):
+def update_bib_keys_in_tex(tex_file_name, updated_dict, in_place=False):
+    """Replace the keys in every cite command in a tex file.
+    The result is written to tex_file_name + ".sorted",
+    or over the original if in_place.
+    Anything after a % on a line is left alone.
+    Returns the files named in \\input and \\include commands"""
     with open(tex_file_name, 'r') as tex_file:
         text = tex_file.read()
-    cite_str = "\\cite{"
-    cite_len = len(cite_str)
-    cite_end = 0
-    cite_start = text.find(cite_str)
-    new_text = ""
-    while cite_start > -1:
-        # add the previous segment
-        new_text += text[cite_end: cite_start + cite_len]
-        # get the new cites
-        cite_end = text.find('}', cite_start)
-        cites = text[cite_start + cite_len:cite_end].split(',')
-        new_cites = [updated_dict.get(c.strip(), c) for c in cites]
-        # add the new cites
-        new_text += ','.join(new_cites)
-        cite_start = text.find(cite_str, cite_end)
-    # add the last segment
-    new_text += text[cite_end:]
-    new_name = tex_file_name + ".sorted"
-    with open(new_name, 'w') as new_file:
-        new_file.write(new_text)
+    included = []
+
+    def replace_keys(keys):
+        new_cites = []
+        for cite in keys.split(','):
+            key = cite.strip()
+            # keep the spacing around each key
+            new_cites.append(cite.replace(key, updated_dict.get(key, key), 1)
+                             if key else cite)
+        return ','.join(new_cites)
+
+    def replace_part(match):
+        if match.group("keys") is None:
+            return match.group(0)
+        return "{" + replace_keys(match.group("keys")) + "}"
+
+    def replace(match):
+        if match.group("comment") is not None:
+            return match.group(0)
+        if match.group("file") is not None:
+            included.append(match.group("file").strip())
+            return match.group(0)
+        if match.group("multicite") is not None:
+            command = match.group("multicite")
+            # the command name is left alone, the parts after it are changed
+            name_end = MULTICITE_NAME.match(command).end()
+            return command[:name_end] + \
+                MULTICITE_PART.sub(replace_part, command[name_end:])
+        return match.group("command") + replace_keys(match.group("keys")) + "}"
+    new_text = TEX_PATTERN.sub(replace, text)
+    new_name = tex_file_name if in_place else tex_file_name + ".sorted"
+    tools.write_atomic(new_name, new_text)
+    return included
+
+
+def update_bib_keys_in_project(main_tex_name, updated_dict, in_place=False):
+    """Replace the keys in the cite commands of a tex file,
+    and every file it pulls in with \\input or \\include.
+    Returns the list of files rewritten"""
+    # latex looks for included files relative to the main file
+    root = os.path.dirname(main_tex_name)
+    to_do = [main_tex_name]
+    done = {}  # dict as an ordered set
+    while to_do:
+        tex_file_name = to_do.pop()
+        if os.path.abspath(tex_file_name) in done:
+            continue
+        done[os.path.abspath(tex_file_name)] = None
+        included = update_bib_keys_in_tex(tex_file_name, updated_dict,
+                                          in_place)
+        for name in reversed(included):
+            path = os.path.join(root, name)
+            if not os.path.exists(path) and os.path.exists(path + ".tex"):
+                path += ".tex"
+            if os.path.exists(path):
+                to_do.append(path)
+    return list(done)
+
 
+def sort_project(main_tex_name, bib_file, aux_path=None, in_place=False,
+                 cache_file=None, workers=4):
+    """Give every entry of bib_file its INSPIRE key, order the bibliography
+    by first citation, and change the cite commands of the project to match.
+    The aux file defaults to main_tex_name with the ending .aux.
+    Unless in_place, the bib and tex files are written with ".sorted" on the end"""
+    if aux_path is None:
+        aux_path = os.path.splitext(main_tex_name)[0] + ".aux"
+    cite_order = get_ordered_citations(aux_path)
+    biblography = latex_bib.Bibliography(bib_file)
+    # cites that aren't in the bib can't be sorted
+    cite_order = [key for key in cite_order if key in biblography.keys()]
+    cache = InspireCache(cache_file)
+    biblography, new_cite_order, updated_dict = \
+        update_entries_in_bib(biblography, cite_order, cache, workers)
+    cache.save()
+    # uncited entries go at the end
+    cited = set(new_cite_order)
+    new_cite_order += [key for key in biblography.keys() if key not in cited]
+    new_bib = bib_file if in_place else bib_file + ".sorted"
+    tools.write_atomic(new_bib, biblography.to_string(new_cite_order))
+    return update_bib_keys_in_project(main_tex_name, updated_dict, in_place)
@@ -0,0 +1,208 @@
+"""Micro benchmarks for the hot paths.
+To time them and save the results as a baseline;
+    python3 test/benchmarks.py record
+then later, to check for anything that got slower;
+    python3 test/benchmarks.py compare
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import xml.etree.ElementTree
+# so this can be run as a script from anywhere
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tools
+import latex_bib
+import next_papers
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "bench_baseline.json")
+# a benchmark more than this fraction slower than the baseline is flagged
+THRESHOLD = 0.2
+SIZES = [1000, 10000]
+
+WORDS = ["jet", "boson", "higgs", "search", "collider", "hadronic",
+         "clustering", "algorithm", "final", "state", "physics", "new",
+         "model", "standard", "beyond", "neutrino", "dark", "matter"]
+NAMES = ["Samwise Gamgee", "Frodo Baggins", "Meriadoc Brandybuck",
+         "Peregrin Took", "Gandalf", "Aragorn Elessar", "Legolas Greenleaf"]
+
+
+# generators for synthetic data ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def make_bib_entries(n_entries, seed=0):
+    """Field dicts for n_entries plausible articles,
+    the same every time for the same seed"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(n_entries):
+        fields = {"title": ' '.join(rng.choice(WORDS) for _ in range(8)),
+                  "author": ' and '.join(rng.sample(NAMES, 3)),
+                  "year": str(rng.randint(2000, 2021)),
+                  "month": str(rng.randint(1, 12)),
+                  "eprint": f"{rng.randint(1000, 2112)}.{i:05d}v1",
+                  "journal": "{Physical Review {D}}",
+                  "abstract": ' '.join(rng.choice(WORDS) for _ in range(60)),
+                  "last_update": f"2021-0{rng.randint(1, 9)}-01T00:00:00"}
+        entries.append(fields)
+    return entries
+
+
+def make_bib_string(n_entries, seed=0):
+    """The text of a .bib file with n_entries"""
+    entries = [str(latex_bib.BibEntry(fields, key=f"Entry{i}:{fields['year']}"))
+               for i, fields in enumerate(make_bib_entries(n_entries, seed))]
+    return "\n\n".join(entries)
+
+
+def make_atom_feed(n_entries, seed=0):
+    """An arXiv API response with n_entries"""
+    text = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+        '<feed xmlns="http://www.w3.org/2005/Atom" ' + \
+        'xmlns:arxiv="http://arxiv.org/schemas/atom">\n'
+    for fields in make_bib_entries(n_entries, seed):
+        authors = ''.join(f"<author><name>{name}</name></author>"
+                          for name in fields["author"].split(" and "))
+        date = f"{fields['year']}-{int(fields['month']):02d}-01T00:00:00Z"
+        text += f"<entry><id>http://arxiv.org/abs/{fields['eprint']}</id>" + \
+            f"<updated>{date}</updated><published>{date}</published>" + \
+            f"<title>{fields['title']}</title>" + \
+            f"<summary>{fields['abstract']}</summary>{authors}" + \
+            f"<arxiv:doi>10.1103/{fields['eprint']}</arxiv:doi>" + \
+            "<arxiv:journal_ref>Phys. Rev. D 1 (2021)</arxiv:journal_ref>" + \
+            "</entry>\n"
+    return text + "</feed>\n"
+
+
+def make_paper_pages(n_pages, seed=0, is_next=True, words_per_page=500):
+    """Pages of text, front to back, with acknowledgments
+    on the last page that mention NExT if is_next"""
+    rng = random.Random(seed)
+    pages = [' '.join(rng.choice(WORDS) for _ in range(words_per_page))
+             for _ in range(n_pages)]
+    thanks = "Acknowledgments We thank the "
+    thanks += "NExT Institute" if is_next else "referee"
+    pages[-1] += " " + thanks + " and STFC for support."
+    return pages
+
+
+# the benchmarks ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# each takes a size, does any setup, and returns the function to time
+
+def bench_split_bib(size):
+    bib_string = make_bib_string(size)
+    return lambda: latex_bib.split_bib(bib_string)
+
+
+def bench_read_bib_entry(size):
+    entry_strings = make_bib_string(size).split("\n\n")
+    return lambda: [latex_bib.read_bib_entry(s) for s in entry_strings]
+
+
+def bench_bib_entry_str(size):
+    entries = [latex_bib.BibEntry(fields, key=f"Entry{i}")
+               for i, fields in enumerate(make_bib_entries(size))]
+    return lambda: [str(entry) for entry in entries]
+
+
+def bench_to_string(size):
+    bibliography = latex_bib.Bibliography()
+    bibliography.add_file_string(make_bib_string(size))
+    cite_order = list(bibliography.keys()) * 2
+    return lambda: bibliography.to_string(cite_order)
+
+
+def bench_locate_closing_brace(size):
+    text = "{" + "{a}b" * size + "}"
+    return lambda: tools.locate_closing_brace(text, 0)
+
+
+def bench_alpha_only(size):
+    text = ' '.join(make_paper_pages(size // 100 + 1)[0] for _ in range(10))
+    return lambda: tools.alpha_only(text)
+
+
+def bench_check_pages_for_next(size):
+    pages = [tools.alpha_only(page)
+             for page in make_paper_pages(size // 100 + 1, is_next=False)]
+    return lambda: next_papers.check_pages_for_next(pages[::-1])
+
+
+def bench_xml_entry_to_bib(size):
+    tree = xml.etree.ElementTree.fromstring(make_atom_feed(size))
+    entries = [part for part in tree if part.tag.endswith("entry")]
+    return lambda: [next_papers.xml_entry_to_bib(entry) for entry in entries]
+
+
+BENCHMARKS = {name[len("bench_"):]: function
+              for name, function in list(globals().items())
+              if name.startswith("bench_")}
+
+
+def time_function(function, repeats=3):
+    """Best of repeats, in seconds"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(names=None, sizes=None, repeats=3):
+    """Returns a dict with keys like "split_bib/1000" and times as values"""
+    if names is None:
+        names = list(BENCHMARKS)
+    if sizes is None:
+        sizes = SIZES
+    results = {}
+    for name in names:
+        for size in sizes:
+            function = BENCHMARKS[name](size)
+            results[f"{name}/{size}"] = time_function(function, repeats)
+            print(f"{name}/{size}: {results[f'{name}/{size}']:.4f}s")
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Returns a list of (name, baseline, now) for each
+    result more than threshold slower than the baseline"""
+    slower = []
+    for name, now in results.items():
+        if name not in baseline:
+            continue
+        if now > baseline[name] * (1 + threshold):
+            slower.append((name, baseline[name], now))
+    return slower
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument("action", choices=["run", "record", "compare"])
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(args)
+    results = run(args.only, args.sizes, args.repeats)
+    if args.action == "record":
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+        print(f"Written baseline to {args.baseline}")
+    elif args.action == "compare":
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        slower = compare(results, baseline, args.threshold)
+        for name, before, now in slower:
+            print(f"REGRESSION {name}: {before:.4f}s -> {now:.4f}s")
+        if slower:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
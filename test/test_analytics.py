@@ -0,0 +1,50 @@
+import analytics
+import latex_bib
+import numpy as np
+import os
+
+
+def make_bib(entries):
+    bibliography = latex_bib.Bibliography()
+    for key, fields in entries.items():
+        bibliography.add_entry(latex_bib.BibEntry(fields, key=key,
+                                                  entry_type="article"))
+    return bibliography
+
+
+def test_PaperTable():
+    is_next = make_bib({
+        "a": {"author": "Gamgee, Samwise and Frodo Baggins", "year": "2020",
+              "month": "Jul", "journal": "Shire Letters", "eprint": "2001.00001",
+              "last_update": "2020-07-01T00:00:00",
+              "detected": "2020-07-03T12:00:00"},
+        "b": {"author": "S. Gamgee", "year": "2021", "month": "1",
+              "eprint": "2101.00001"}})
+    not_next = make_bib({
+        "c": {"author": "Peregrin Took and Samwise Gamgee", "year": "2021",
+              "journal": "Shire Letters", "eprint": "2101.00002"}})
+    table = analytics.PaperTable.from_bibliographies([is_next, not_next],
+                                                     [True, False])
+    assert len(table) == 3
+    assert list(table.is_next) == [True, True, False]
+    years, counts = table.papers_per_year()
+    assert list(years) == [2020, 2021] and list(counts) == [1, 1]
+    years, months, counts = table.papers_per_month()
+    assert list(months) == [7, 1]
+    names, counts = table.papers_per_author()
+    assert names[0] == "S. Gamgee" and counts[0] == 2
+    names, counts = table.papers_per_author(np.ones(3, dtype=bool))
+    assert dict(zip(names, counts)) == {"S. Gamgee": 3, "F. Baggins": 1,
+                                        "P. Took": 1}
+    journals, counts = table.papers_per_journal(np.ones(3, dtype=bool))
+    assert list(journals) == ["Shire Letters"] and list(counts) == [2]
+    assert list(table.detection_delay()) == [2.5]
+    assert list(table.authors_per_paper()) == [2, 1, 2]
+
+    file_name = "temp_table.npz"
+    table.save(file_name)
+    loaded = analytics.PaperTable.load(file_name)
+    assert list(loaded.keys) == ["a", "b", "c"]
+    assert np.array_equal(loaded.author_indices, table.author_indices)
+    assert list(loaded.detection_delay()) == [2.5]
+    os.remove(file_name)  # clean up
@@ -0,0 +1,29 @@
+import benchmarks
+import latex_bib
+import next_papers
+import xml.etree.ElementTree
+
+
+def test_generators():
+    # the same every time
+    assert benchmarks.make_bib_string(5) == benchmarks.make_bib_string(5)
+    assert benchmarks.make_bib_string(5, 1) != benchmarks.make_bib_string(5)
+    assert len(latex_bib.split_bib(benchmarks.make_bib_string(20))) == 20
+    tree = xml.etree.ElementTree.fromstring(benchmarks.make_atom_feed(3))
+    entries = [part for part in tree if part.tag.endswith("entry")]
+    assert len(entries) == 3
+    bib_entry, _, authors = next_papers.xml_entry_to_bib(entries[0])
+    assert len(authors) == 3
+    assert bib_entry.fields["doi"].startswith("10.1103/")
+    pages = benchmarks.make_paper_pages(5)
+    assert next_papers.check_pages_for_next(pages[::-1])
+    pages = benchmarks.make_paper_pages(5, is_next=False)
+    assert not next_papers.check_pages_for_next(pages[::-1])
+
+
+def test_compare():
+    baseline = {"a/10": 1.0, "b/10": 1.0}
+    results = {"a/10": 1.1, "b/10": 1.5, "c/10": 9.0}
+    assert benchmarks.compare(results, baseline, 0.2) == [("b/10", 1.0, 1.5)]
+    assert benchmarks.main(["run", "--sizes", "10", "--repeats", "1",
+                            "--only", "alpha_only"]) == 0
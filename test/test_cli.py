@@ -0,0 +1,51 @@
+import cli
+import latex_bib
+import os
+import json
+import sys
+import subprocess
+import unittest.mock
+
+# a wall clock budget fails at random on a busy machine,
+# so check that nothing slow to import is loaded instead
+HEAVY_MODULES = ["numpy", "pdfplumber", "ipdb", "IPython",
+                 "multiprocessing", "http.client"]
+
+
+def test_startup():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import sys\n" +
+              "import cli, latex_bib, sort_citations, next_papers\n" +
+              f"print([m for m in {HEAVY_MODULES} if m in sys.modules])\n")
+    output = subprocess.run([sys.executable, "-c", script], cwd=root,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_merge():
+    output = "temp_merged.bib"
+    assert cli.main(["merge", output, "test/sample.bib", "test/sample.bib"]) == 0
+    merged = latex_bib.Bibliography(output)
+    sample = latex_bib.Bibliography("test/sample.bib")
+    assert sorted(merged.keys()) == sorted(sample.keys())
+    os.remove(output)  # clean up
+
+
+def test_crawl_workers():
+    with unittest.mock.patch('next_papers.check_for_papers') as check:
+        assert cli.main(["crawl", "temp_", "--workers", "3"]) == 0
+    assert check.call_args.kwargs["workers"] == 3
+    with unittest.mock.patch('groups.check_for_groups') as check:
+        assert cli.main(["crawl", "temp_a_", "temp_b_", "--workers", "3"]) == 0
+    assert check.call_args.kwargs["workers"] == 3
+
+
+def test_reclassify_rules():
+    rules_file = "temp_rules.json"
+    with open(rules_file, 'w') as file_obj:
+        json.dump({"institutes": {"NExT": {"patterns": ["STFC"]}}}, file_obj)
+    with unittest.mock.patch('next_papers.reclassify') as reclassify:
+        assert cli.main(["reclassify", "temp_", "--rules", rules_file]) == 0
+    os.remove(rules_file)  # clean up
+    prefix, workers, rule_set = reclassify.call_args.args
+    assert rule_set.classify("We thank the STFC")["NExT"].is_member
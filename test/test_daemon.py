@@ -0,0 +1,115 @@
+import daemon
+import simulate
+import json
+import os
+import threading
+import urllib.request
+import unittest.mock
+from datetime import timedelta
+
+
+def test_Daemon():
+    authors, papers = simulate.make_graph(8, 30, next_fraction=0.5, seed=2)
+    # one author starts as known, papers by anyone else are never downloaded
+    seed_author = next(name for paper in papers if paper.is_next
+                       for name in paper.authors)
+    prefix = "temp_daemon_"
+    with open(prefix + "authors.txt", 'w') as authors_file:
+        authors_file.write(f"{seed_author} # yes\n")
+    start_date = min(paper.published for paper in papers) - timedelta(days=1)
+    with open(prefix + "last_run.txt", 'w') as date_file:
+        date_file.write(str(start_date.date()))
+    status_server = None
+    try:
+        with simulate.stand_in(papers) as server:
+            watcher = daemon.Daemon(prefix, categories=["hep-ph", "hep-ex"])
+            found = watcher.poll()
+            # cross listed papers are only looked at once
+            assert watcher.stats["listed"] == len(papers)
+            assert server.requests["pdf"] == watcher.stats["matched"]
+            assert server.requests["pdf"] < len(papers)
+            by_seed = [paper for paper in papers
+                       if paper.is_next and seed_author in paper.authors]
+            assert len(found) >= len(by_seed)
+            assert os.path.exists(prefix + "daemon_state.json")
+            # nothing new, so nothing is downloaded
+            pdf_requests = server.requests["pdf"]
+            assert watcher.poll() == []
+            assert server.requests["pdf"] == pdf_requests
+        # a restart carries on from the saved state
+        restarted = daemon.Daemon(prefix, categories=["hep-ph"])
+        assert restarted.last_seen == watcher.last_seen
+        assert len(restarted.known_papers.ids_is_next) == len(found)
+
+        status_server = daemon.StatusServer(watcher)
+        threading.Thread(target=status_server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{status_server.server_port}/status"
+        with urllib.request.urlopen(url) as response:
+            status = json.loads(response.read())
+        assert status["polls"] == 2
+        assert status["is_next"] == len(found)
+    finally:
+        if status_server is not None:
+            status_server.shutdown()
+            status_server.server_close()
+        for name in os.listdir("."):  # clean up
+            if name.startswith(prefix):
+                os.remove(name)
+
+
+def test_Daemon_truncated_listing():
+    authors, papers = simulate.make_graph(8, 30, next_fraction=0.5, seed=3)
+    prefix = "temp_daemon_cut_"
+    with open(prefix + "authors.txt", 'w') as authors_file:
+        authors_file.write(''.join(f"{name} # yes\n" for name in authors))
+    start_date = min(paper.published for paper in papers) - timedelta(days=1)
+    with open(prefix + "last_run.txt", 'w') as date_file:
+        date_file.write(str(start_date.date()))
+    try:
+        with simulate.stand_in(papers), \
+                unittest.mock.patch('daemon.LISTING_SIZE', 4), \
+                unittest.mock.patch('daemon.MAX_LISTING_PAGES', 2):
+            watcher = daemon.Daemon(prefix, categories=["hep-ph"])
+            found = watcher.poll()
+            # the listing was cut short, so it carries on from there
+            assert watcher.stats["listed"] == 8
+            for _ in range(10):
+                found += watcher.poll()
+        # every paper was listed in the end, and each is only found once
+        assert len(watcher.known_papers.ids_is_next) + \
+            len(watcher.known_papers.ids_not_next) == len(papers)
+        assert sorted(found) == sorted(set(found))
+        assert watcher.stats["found_next"] == len(found) == \
+            sum(paper.is_next for paper in papers)
+    finally:
+        for name in os.listdir("."):  # clean up
+            if name.startswith(prefix):
+                os.remove(name)
+
+
+def test_Daemon_late_announcement():
+    authors, papers = simulate.make_graph(8, 30, next_fraction=0.5, seed=4)
+    papers.sort(key=lambda paper: paper.published)
+    prefix = "temp_daemon_late_"
+    with open(prefix + "authors.txt", 'w') as authors_file:
+        authors_file.write(''.join(f"{name} # yes\n" for name in authors))
+    start_date = papers[0].published - timedelta(days=1)
+    with open(prefix + "last_run.txt", 'w') as date_file:
+        date_file.write(str(start_date.date()))
+    # submitted a day before the newest paper, but announced after it is seen
+    late = papers[-1]._replace(arxiv_id="2101.99999v1",
+                               published=papers[-1].published - timedelta(days=1))
+    try:
+        with simulate.stand_in(papers) as server:
+            watcher = daemon.Daemon(prefix, categories=["hep-ph"])
+            watcher.poll()
+            pdf_requests = server.requests["pdf"]
+            server.announce([late])
+            watcher.poll()
+            # only the late paper is downloaded
+            assert server.requests["pdf"] == pdf_requests + 1
+        assert watcher.known_papers.is_known("2101.99999")
+    finally:
+        for name in os.listdir("."):  # clean up
+            if name.startswith(prefix):
+                os.remove(name)
@@ -0,0 +1,101 @@
+import events
+import json
+import os
+import io
+import unittest.mock
+
+
+def test_EventLog():
+    file_path = "temp_events.jsonl"
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    log = events.EventLog()
+    log.emit("dropped")  # no file yet
+    log.open(file_path)
+    log.flush_every = 3
+    log.emit("run_start", frontier=2)
+    log.emit("author_start", author="A. Author")
+    assert not os.path.exists(file_path)  # still buffered
+    log.emit("author_end", author="A. Author")
+    records, position = events.read_events(file_path)
+    assert [r["event"] for r in records] == ["run_start", "author_start", "author_end"]
+    assert records[0]["frontier"] == 2
+    log.emit("run_end")
+    log.close()
+    log.emit("dropped")
+    records, _ = events.read_events(file_path, position)
+    assert [r["event"] for r in records] == ["run_end"]
+    # a half written line is left for next time
+    with open(file_path, 'a') as log_file:
+        log_file.write('{"time": 1')
+    records, end = events.read_events(file_path, position)
+    assert len(records) == 1
+    with open(file_path, 'r') as log_file:
+        assert len(log_file.read()) > end
+    os.remove(file_path)  # clean up
+
+
+def test_Progress():
+    stream = [{"time": 0, "event": "run_start", "frontier": 1},
+              {"time": 1, "event": "author_start", "author": "a", "frontier": 3},
+              {"time": 2, "event": "request", "wait": 20.},
+              {"time": 3, "event": "page_fetched", "author": "a", "page": 0},
+              {"time": 4, "event": "request_failed", "url": "x", "error": "y"},
+              {"time": 5, "event": "paper_classified", "is_next": True},
+              {"time": 6, "event": "paper_classified", "is_next": False},
+              {"time": 10, "event": "author_end", "author": "a"}]
+    progress = events.Progress()
+    for record in stream:
+        progress.update(record)
+    assert progress.elapsed == 10
+    assert progress.authors_done == 1
+    assert progress.frontier == 3
+    assert progress.requests == 2
+    assert progress.limiter_wait == 20.
+    assert progress.papers == 2
+    assert progress.next_papers == 1
+    assert progress.papers_per_hour() == 720
+    assert progress.eta() == 30
+    assert progress.author_time["a"] == 9
+    assert progress.author_requests["a"] == 2
+    assert "ETA" in progress.status()
+    assert not progress.finished
+    progress.update({"time": 11, "event": "run_end"})
+    assert progress.finished
+    # a new run starts the counts again
+    progress.update({"time": 20, "event": "run_start", "frontier": 5})
+    assert progress.papers == 0
+    assert progress.eta() is None
+
+
+def test_follow():
+    file_path = "temp_events.jsonl"
+    stream = [{"time": 0, "event": "run_start", "frontier": 1},
+              {"time": 5, "event": "run_end"}]
+    with open(file_path, 'w') as log_file:
+        log_file.write(''.join(json.dumps(r) + '\n' for r in stream))
+    out = io.StringIO()
+    progress = events.follow(file_path, interval=0, out=out)
+    assert progress.finished
+    assert "elapsed" in out.getvalue()
+    progress = events.summarise(file_path, out=out)
+    assert progress.elapsed == 5
+    os.remove(file_path)  # clean up
+
+
+def test_follow_before_run():
+    file_path = "temp_events_later.jsonl"
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+    def start_run(seconds):
+        # the run starts while follow is waiting
+        with open(file_path, 'w') as log_file:
+            log_file.write(json.dumps({"time": 0, "event": "run_end"}) + '\n')
+    out = io.StringIO()
+    with unittest.mock.patch('time.sleep', side_effect=start_run) as sleep:
+        progress = events.follow(file_path, interval=1, out=out)
+    assert progress.finished
+    assert sleep.call_count == 1
+    assert "Waiting" in out.getvalue()
+    os.remove(file_path)  # clean up
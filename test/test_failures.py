@@ -0,0 +1,57 @@
+import failures
+import latex_bib
+import urllib.error
+import email.message
+import os
+from datetime import datetime, timedelta
+
+
+def make_error(status, retry_after=None):
+    headers = email.message.Message()
+    if retry_after is not None:
+        headers["Retry-After"] = retry_after
+    return urllib.error.HTTPError("http://a.b", status, "", headers, None)
+
+
+def test_RetryQueue():
+    file_name = "temp_retry.json"
+    queue = failures.RetryQueue(file_name)
+    assert len(queue) == 0
+    entry = latex_bib.BibEntry({'author': "Samwise Gamgee",
+                                'year': "1341",
+                                'eprint': "1111.1111v1"},
+                               key="LOTR:1341ring")
+    assert queue.add("1111.1111", entry, make_error(503)) == 1
+    assert "1111.1111" in queue
+    # not due until the backoff is over
+    assert queue.due() == []
+    later = datetime.now() + timedelta(hours=1)
+    assert [arxiv_id for arxiv_id, _ in queue.due(later)] == ["1111.1111"]
+    assert queue.add("1111.1111", entry, make_error(503, "7200")) == 2
+    assert queue.due(later) == []
+    queue.save()
+
+    # we can read what we wrote
+    reread = failures.RetryQueue(file_name)
+    os.remove(file_name)  # clean up
+    arxiv_id, entry_string = reread.due(later + timedelta(hours=2))[0]
+    assert latex_bib.BibEntry(entry_string).key == "LOTR:1341ring"
+    reread.discard("1111.1111")
+    assert len(reread) == 0
+
+
+def test_NegativeCache():
+    file_name = "temp_failed.json"
+    cache = failures.NegativeCache(file_name)
+    cache.add("1111.1111", ValueError("Broken"))
+    assert "1111.1111" in cache
+    assert "1111.1112" not in cache
+    cache.save()
+    assert "1111.1111" in failures.NegativeCache(file_name)
+    # expired entries are dropped
+    cache = failures.NegativeCache(file_name, expiry=timedelta(seconds=-1))
+    cache.add("1111.1112", ValueError("Broken"))
+    assert "1111.1112" not in cache
+    cache.save()
+    assert len(failures.NegativeCache(file_name)) == 1
+    os.remove(file_name)  # clean up
@@ -0,0 +1,126 @@
+import groups
+import institutes
+import simulate
+import latex_bib
+import next_papers
+import json
+import os
+import unittest.mock
+from datetime import timedelta
+
+
+def test_combine_rules():
+    other = institutes.RuleSet({"NExT": {"patterns": ["Southampton"]}},
+                               anchors=["thank"])
+    combined, names = institutes.combine_rules([institutes.RuleSet(), other])
+    assert names == [["0:NExT"], ["1:NExT"]]
+    verdicts = combined.classify("Acknowledgements We thank Southampton")
+    assert not verdicts["0:NExT"].is_member
+    assert verdicts["1:NExT"].is_member
+
+
+def setup_group(prefix, seed_author, start_date, rules=None):
+    with open(prefix + "authors.txt", 'w') as authors_file:
+        authors_file.write(f"{seed_author} # yes\n")
+    with open(prefix + "last_run.txt", 'w') as date_file:
+        date_file.write(str(start_date.date()))
+    if rules is not None:
+        with open(prefix + "rules.json", 'w') as rules_file:
+            json.dump(rules, rules_file)
+
+
+def found_ids(prefix):
+    return {paper.fields["eprint"] for paper
+            in latex_bib.Bibliography(prefix + "is_NExT.bib").values()}
+
+
+def test_check_for_groups():
+    authors, papers = simulate.make_graph(8, 30, next_fraction=0.5, seed=3)
+    start_date = min(paper.updated for paper in papers) - timedelta(days=1)
+    next_seed = next(name for paper in papers if paper.is_next
+                     for name in paper.authors)
+    other_seed = next(name for paper in papers if not paper.is_next
+                      for name in paper.authors if name != next_seed)
+    # the stand in thanks "our referees" in papers that aren't NExT
+    referee_rules = {"institutes": {"Referees": {
+        "patterns": ["referees"], "compact_patterns": ["ourreferees"]}}}
+    try:
+        # the NExT group alone, to compare with
+        setup_group("temp_alone_", next_seed, start_date)
+        with simulate.stand_in(papers):
+            next_papers.check_for_papers("temp_alone_", record_metrics=False)
+        setup_group("temp_next_", next_seed, start_date)
+        setup_group("temp_other_", other_seed, start_date, referee_rules)
+        with simulate.stand_in(papers) as server:
+            groups.check_for_groups(["temp_next_", "temp_other_"],
+                                    record_metrics=False)
+        assert found_ids("temp_next_") == found_ids("temp_alone_")
+        by_id = {paper.arxiv_id: paper for paper in papers}
+        other_found = found_ids("temp_other_")
+        assert other_found
+        assert not any(by_id[arxiv_id].is_next for arxiv_id in other_found)
+        # each paper is downloaded once, whichever group it's for
+        judged = set()
+        for prefix in ["temp_next_", "temp_other_"]:
+            for name in ["is_NExT.bib", "not_NExT.bib"]:
+                judged.update(entry.fields["eprint"] for entry in
+                              latex_bib.Bibliography(prefix + name).values())
+        assert server.requests["pdf"] == len(judged)
+    finally:
+        for name in os.listdir("."):  # clean up
+            if name.startswith(("temp_alone_", "temp_next_", "temp_other_")):
+                os.remove(name)
+
+
+class FakePage:
+    def __init__(self, text="We thank the NExT Institute"):
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+    def close(self):
+        pass
+
+
+def test_SharedClassifier():
+    pdf_object = unittest.mock.MagicMock()
+    pdf_object.__enter__.return_value.pages = [FakePage()]
+    classifier = groups.SharedClassifier(institutes.RuleSet(), n_groups=2,
+                                         max_results=2)
+    first, second = classifier.for_group(["NExT"]), classifier.for_group([])
+    with unittest.mock.patch('next_papers.get_paper_pdf',
+                             return_value=pdf_object) as get_pdf:
+        assert first("1111.1111")[0]
+        assert len(classifier.results) == 1
+        assert not second("1111.1111")[0]
+        # both groups have it, so it is let go
+        assert len(classifier.results) == 0
+        assert get_pdf.call_count == 1
+        # papers only one group asks for are kept, up to max_results
+        for arxiv_id in ["2222.2222", "3333.3333", "4444.4444"]:
+            first(arxiv_id)
+        assert list(classifier.results) == [("3333.3333", None),
+                                            ("4444.4444", None)]
+
+
+def test_shared_ack_hash():
+    # the referee rules need every page, where NExT stops at the last
+    pages = [FakePage("Acknowledgements We thank our referees"),
+             FakePage("Acknowledgements We thank the NExT Institute")]
+    pdf_object = unittest.mock.MagicMock()
+    pdf_object.__enter__.return_value.pages = pages
+    other = institutes.RuleSet({"Referees": {"patterns": ["nobody"]}})
+    combined, names = institutes.combine_rules([institutes.RuleSet(), other])
+    classifier = groups.SharedClassifier(combined, n_groups=2)
+    with unittest.mock.patch('next_papers.get_paper_pdf',
+                             return_value=pdf_object):
+        is_next, solo_hash = next_papers.check_paper("1111.1111")
+        shared = classifier.for_group(names[0], institutes.RuleSet())
+        assert shared("1111.1111") == (is_next, solo_hash)
+
+
+def test_main_workers():
+    with unittest.mock.patch('groups.check_for_groups') as check:
+        assert groups.main(["temp_a_", "temp_b_", "--workers", "3"]) == 0
+    check.assert_called_once_with(["temp_a_", "temp_b_"], True, 3)
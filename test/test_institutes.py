@@ -0,0 +1,77 @@
+import institutes
+import json
+import os
+
+
+def test_Automaton():
+    automaton = institutes.Automaton(["he", "she", "his", "hers"])
+    found = sorted(automaton.find_all("ushers"))
+    assert found == [(1, "she"), (2, "he"), (2, "hers")]
+    assert list(institutes.Automaton([]).find_all("ushers")) == []
+
+
+def test_RuleSet_next():
+    rule_set = institutes.RuleSet()
+    # no mention at all
+    assert not rule_set.classify("We thank our friends")["NExT"].is_member
+    # mentioned in the acknowledgments
+    verdict = rule_set.classify("Intro Acknowledgements We thank NExT")["NExT"]
+    assert verdict.is_member
+    assert "NExT" in verdict.evidence
+    # mentioned before the acknowledgments only
+    text = "NExT is good Acknowledgements We thank our friends"
+    assert not rule_set.classify(text)["NExT"].is_member
+    # no acknowledgments, so the full name is needed, spacing is ignored
+    assert not rule_set.classify("NExT is good")["NExT"].is_member
+    assert rule_set.classify("the NExT Inst itute")["NExT"].is_member
+
+
+def test_RuleSet_many():
+    rules = {"NExT": {"patterns": ["NExT"],
+                      "compact_patterns": ["NExTInstitute"]},
+             "STFC": {"patterns": ["STFC", "ST FC"],
+                      "compact_patterns": ["Science and Technology Facilities"]}}
+    rule_set = institutes.RuleSet(rules)
+    text = "Acknowledgements We thank STFC and the NExT Institute"
+    verdicts = rule_set.classify(text)
+    assert verdicts["NExT"].is_member and verdicts["STFC"].is_member
+    text = "STFC Science and Technology Facilities"
+    verdicts = rule_set.classify(text)
+    assert not verdicts["NExT"].is_member
+    assert verdicts["STFC"].is_member
+
+    # read the same rules from a file
+    file_name = "temp_rules.json"
+    with open(file_name, 'w') as rules_file:
+        json.dump({"institutes": rules}, rules_file)
+    from_file = institutes.load_rules(file_name)
+    os.remove(file_name)  # clean up
+    assert from_file.classify(text) == verdicts
+
+
+def test_BackwardScanner():
+    rule_set = institutes.RuleSet()
+    scanner = rule_set.scanner()
+    scanner.prepend("stitute for the support")
+    assert not scanner.verdicts()["NExT"].is_member
+    # the full name runs over the join between pages
+    scanner.prepend("Intro we are from the NExT In")
+    assert scanner.verdicts()["NExT"].is_member
+    # now the acknowledgments start after the mention
+    scanner.prepend("Acknowledgments")
+    assert scanner.verdicts()["NExT"].is_member
+    scanner = rule_set.scanner()
+    scanner.prepend("we thank nobody")
+    scanner.prepend("NExT")
+    assert not scanner.verdicts()["NExT"].is_member
+
+
+def test_acknowledgements():
+    rule_set = institutes.RuleSet()
+    text = "We thank nobody in the intro Acknowledgements We thank NExT"
+    assert rule_set.acknowledgements(text) == "cknowledgements We thank NExT"
+    assert rule_set.acknowledgements("No gratitude here") == ""
+    scanner = rule_set.scanner()
+    scanner.prepend("Acknowledgements We thank")
+    scanner.prepend("Introduction")
+    assert scanner.acknowledgements() == "cknowledgements We thank "
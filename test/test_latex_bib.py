@@ -1,4 +1,5 @@
 import latex_bib, tools
+import unittest.mock
 import os
 
 
@@ -184,3 +185,102 @@ def test_BibEntry():
         assert "Frodo" in alt_string
         assert "Hobbit" in alt_string
 
+
+def test_balance_braces():
+    assert latex_bib.balance_braces("{a}") == ("{a}", 0)
+    assert latex_bib.balance_braces("{a") == ("{a }", 1)
+    assert latex_bib.balance_braces("a}}") == ("{{a}}", -2)
+    # braces are balanced once, as the file is read, not on each write
+    bibliography = latex_bib.Bibliography()
+    bibliography.add_file_string('@Book{LOTR:1341taters,\n title="{Po-tay-toes"\n}')
+    entry = bibliography["LOTR:1341taters"]
+    assert entry.fields["title"] == "{Po-tay-toes }"
+    with unittest.mock.patch('tools.check_braces_match') as check:
+        assert "{{Po-tay-toes }}" in str(entry)
+    check.assert_not_called()
+    # entries made from a dict are balanced too, so they can't spoil a file
+    file_name = "temp_balance.bib"
+    bibliography = latex_bib.Bibliography()
+    bibliography.add_entry(latex_bib.BibEntry({'title': "{Po-tay-toes",
+                                               'author': "Samwise Gamgee"},
+                                              key="LOTR:1341taters"))
+    bibliography.add_entry(latex_bib.BibEntry({'title': "Lembas}",
+                                               'author': "Frodo Baggins"},
+                                              key="LOTR:1342bread"))
+    with open(file_name, 'w') as bib_file:
+        bib_file.write(bibliography.to_string())
+    read_back = latex_bib.Bibliography(file_name)
+    os.remove(file_name)  # clean up
+    assert sorted(read_back.keys()) == ["LOTR:1341taters", "LOTR:1342bread"]
+    assert read_back["LOTR:1341taters"].fields["title"] == "{Po-tay-toes }"
+    assert read_back["LOTR:1342bread"].fields["title"] == "{Lembas}"
+    assert read_back["LOTR:1342bread"].fields["author"] == "Frodo Baggins"
+
+
+def test_normalise_authors():
+    assert latex_bib.normalise_name("Samwise  Gamgee") == "Gamgee, Samwise"
+    assert latex_bib.normalise_name("Gamgee, Samwise") == "Gamgee, Samwise"
+    assert latex_bib.normalise_name("{Fellowship Collaboration}") == \
+        "{Fellowship Collaboration}"
+    assert latex_bib.normalise_name("Samwise Gamgee", None) == "Samwise Gamgee"
+    authors = "Samwise Gamgee and\n Baggins, Frodo"
+    assert latex_bib.normalise_authors(authors) == \
+        "Gamgee, Samwise and Baggins, Frodo"
+
+
+def test_normalise_bibliography():
+    sample = latex_bib.Bibliography("test/sample.bib")
+    sample.add_entry(latex_bib.BibEntry({'author': "Samwise Gamgee",
+                                         'year': "1341",
+                                         'month': "Smeagol"},
+                                        key="LOTR:1341taters",
+                                        entry_type="Book"))
+    # a field changed after the entry was made
+    sample["LOTR:1341taters"].fields["title"] = "{Po-tay-toes"
+    report = latex_bib.normalise_bibliography(sample)
+    assert sample["Gallicchio_2010"].fields["month"] == "7"
+    assert sample["chakraborty2020revisiting"].fields["author"].startswith(
+        "Chakraborty, Amit and Dasmahapatra, Srinandan")
+    assert sample["LOTR:1341taters"].fields["title"] == "{Po-tay-toes }"
+    problems = set(zip(report["key"], report["field"], report["problem"]))
+    assert ("LOTR:1341taters", "month", "bad_month") in problems
+    assert ("LOTR:1341taters", "title", "missing_closing_braces") in problems
+    assert ("LOTR:1341taters", "publisher", "missing_field") in problems
+    assert ("Gallicchio_2010", "pages", "missing_field") in problems
+    # the same in parallel
+    sample = latex_bib.Bibliography("test/sample.bib")
+    parallel = latex_bib.normalise_bibliography(sample, workers=2, chunk_size=1)
+    assert set(zip(parallel["key"], parallel["problem"])) == \
+        {("Gallicchio_2010", "missing_field")}
+
+
+def test_add_file_parallel():
+    file_name = "temp_parallel.bib"
+    entries = []
+    for i in range(200):
+        # some keys are repeated, the later entry should win
+        key = f"Key{i % 150}"
+        entries.append(f"@article{{{key},\r\n  title={{Paper {i} by a@b.c}},\r\n" +
+                       "  author={Samwise Gamgee and Frodo Baggins},\r\n" +
+                       # a line starting with @ inside braces is not an entry
+                       "  abstract={Second breakfast\r\n@misc{elevenses}},\r\n" +
+                       f"  year={{20{i % 22:02d}}}\r\n}}")
+    with open(file_name, 'w', newline='') as bib_file:
+        bib_file.write("\r\n\r\n".join(entries))
+    chunks = latex_bib.bib_chunks(file_name, 8)
+    assert len(chunks) == 8
+    with open(file_name, 'rb') as bib_file:
+        data = bib_file.read()
+    assert all(data[start:start+1] == b"@" for start, _ in chunks)
+    assert not any(data[start:].startswith(b"@misc") for start, _ in chunks)
+    assert chunks[-1][1] == len(data)
+    serial = latex_bib.Bibliography(file_name)
+    with unittest.mock.patch('latex_bib.PARALLEL_MIN_BYTES', new=0):
+        parallel = latex_bib.Bibliography(file_name, workers=2)
+    os.remove(file_name)  # clean up
+    assert len(parallel) == 150
+    assert list(parallel.keys()) == list(serial.keys())
+    for key in serial:
+        assert parallel[key].fields == serial[key].fields
+        assert parallel[key].entry_type == serial[key].entry_type
+    assert parallel["Key0"].fields["title"] == "Paper 150 by a@b.c"
@@ -0,0 +1,44 @@
+import metrics
+import json
+import os
+
+
+def test_Metrics_disabled():
+    recorder = metrics.Metrics()
+    recorder.count("a")
+    with recorder.timer("b"):
+        pass
+    assert recorder.summary()["counters"] == {}
+    assert recorder.summary()["summaries"] == {}
+
+
+def test_Metrics():
+    recorder = metrics.Metrics(enabled=True)
+    recorder.count("requests")
+    recorder.count("requests", 2)
+    with recorder.timer("pdf download"):
+        pass
+
+    @recorder.timed("square")
+    def square(x):
+        return x*x
+    assert square(3) == 9
+    recorder.observe("pages", 4)
+    recorder.observe("pages", 2)
+    summary = recorder.summary()
+    assert summary["counters"] == {"requests": 3}
+    assert summary["summaries"]["pdf download_seconds"]["count"] == 1
+    assert summary["summaries"]["square_seconds"]["count"] == 1
+    assert summary["summaries"]["pages"]["mean"] == 3
+    assert summary["summaries"]["pages"]["max"] == 4
+    text = recorder.to_prometheus()
+    assert "next_papers_requests_total 3" in text
+    assert "next_papers_pdf_download_seconds_count 1" in text
+    assert "next_papers_pages_sum 6.000000" in text
+
+    prefix = "temp_"
+    recorder.write(prefix)
+    with open(prefix + "metrics.json", 'r') as json_file:
+        assert json.load(json_file)["counters"] == {"requests": 3}
+    os.remove(prefix + "metrics.json")  # clean up
+    os.remove(prefix + "metrics.prom")
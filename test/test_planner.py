@@ -0,0 +1,89 @@
+import planner
+import simulate
+import author_history
+import next_papers
+import json
+import os
+from datetime import datetime, timedelta
+
+
+def test_AuthorHistory():
+    file_name = "temp_author_history.json"
+    history = author_history.AuthorHistory(file_name)
+    start = datetime(2021, 1, 1)
+    history.record("S. Gamgee", 2, 4, 1, start, now=start + timedelta(days=10))
+    # only days since the last scan are counted again
+    history.record("S. Gamgee", 1, 0, 0, start, now=start + timedelta(days=12))
+    history.save()
+    reread = author_history.AuthorHistory(file_name)
+    os.remove(file_name)  # clean up
+    item = reread.get("S. Gamgee")
+    assert item["scans"] == 2 and item["pages"] == 3
+    assert item["new_papers"] == 4 and item["found_next"] == 1
+    assert item["days"] == 12
+    assert item["last_scan"] == "2021-01-13T00:00:00"
+
+
+def test_estimate():
+    file_name = "temp_author_history.json"
+    history = author_history.AuthorHistory(file_name)
+    start = datetime(2021, 1, 1)
+    now = start + timedelta(days=20)
+    history.record("S. Gamgee", 2, 10, 5, start, now=start + timedelta(days=10))
+    estimate = planner.estimate_author("S. Gamgee", history, start, now,
+                                       period=20)
+    assert estimate.api_requests == 2
+    # a paper a day, for the 10 days since the last scan
+    assert estimate.pdf_requests == 10
+    assert estimate.seconds == 20 * 12
+    # never searched, so the rates of everyone else
+    unseen = planner.estimate_author("F. Baggins", history, start, now,
+                                     period=20)
+    assert unseen.last_scan is None and unseen.pdf_requests == 20
+    chosen = planner.choose_authors([estimate, unseen], 20 * 13)
+    assert [e.author for e in chosen] == ["S. Gamgee"]
+    assert planner.choose_authors([estimate, unseen], 0) == []
+
+
+def test_history_from_crawl():
+    output_dir = "temp_plan"
+    os.mkdir(output_dir)
+    report = simulate.simulate(n_authors=8, n_papers=20, next_fraction=0.5,
+                               output_dir=output_dir)
+    prefix = os.path.join(output_dir, "sim_")
+    with open(prefix + "author_history.json") as file_obj:
+        items = json.load(file_obj)
+    # every request the crawl made is in the history
+    assert sum(item["pages"] for item in items.values()) == \
+        report["api_requests"]
+    assert sum(item["new_papers"] for item in items.values()) == \
+        report["pdf_requests"]
+    assert sum(item["found_next"] for item in items.values()) == \
+        report["papers_found"]
+    with open(os.devnull, 'w') as out:
+        estimates = planner.plan(prefix, out=out)
+    known_authors = next_papers.KnownAuthors(prefix + "authors.txt")
+    assert len(estimates) == len(known_authors.pottential_next)
+    # clean up
+    for file_name in os.listdir(output_dir):
+        os.remove(os.path.join(output_dir, file_name))
+    os.rmdir(output_dir)
+
+
+def test_crawl_unknown_authors():
+    prefix = "temp_unknown_"
+    with open(prefix + "authors.txt", 'w') as authors_file:
+        authors_file.write("Samwise Gamgee # yes\n")
+    try:
+        # a planned list that doesn't overlap the authors would crawl nothing
+        try:
+            next_papers.check_for_papers(prefix, record_metrics=False,
+                                         authors=["Frodo Baggins"])
+            assert False, "Should have raised ValueError"
+        except ValueError:
+            pass
+    finally:
+        # clean up
+        for file_name in os.listdir('.'):
+            if file_name.startswith(prefix):
+                os.remove(file_name)
@@ -0,0 +1,84 @@
+import revisions
+import next_papers
+import latex_bib
+import unittest.mock
+import os
+
+
+def test_RevisionQueue():
+    file_name = "temp_revisions.json"
+    queue = revisions.RevisionQueue(file_name, max_queued=2)
+    queue.add("1111.1111", 2)
+    queue.add("2222.2222", 2)
+    queue.add("1111.1111", 3)  # keeps its place
+    assert len(queue) == 2
+    queue.add("3333.3333", 1)  # the oldest is dropped
+    assert "1111.1111" not in queue
+    queue.save()
+    reread = revisions.RevisionQueue(file_name)
+    os.remove(file_name)  # clean up
+    assert reread.take(1) == [("2222.2222", 2)]
+    assert reread.take(5) == [("3333.3333", 1)]
+    assert len(reread) == 0
+
+
+def make_entry(version, last_update):
+    return latex_bib.BibEntry({"author": "Samwise Gamgee", "year": "2021",
+                               "eprint": f"1111.1111v{version}",
+                               "last_update": last_update},
+                              key="Gamgee:2021")
+
+
+def test_reclassify_revised():
+    prefix = "temp_revised_"
+    queue = revisions.RevisionQueue(prefix + "revision_queue.json")
+    known = next_papers.KnownPapers(prefix + "is_NExT.bib",
+                                    prefix + "not_NExT.bib",
+                                    revision_queue=queue)
+    with unittest.mock.patch('next_papers.check_paper',
+                             return_value=(False, "aaaa")):
+        assert not known.add_paper(make_entry(1, "2021-01-01T00:00:00"))
+    assert known.not_next["Gamgee:2021"].fields["ack_hash"] == "aaaa"
+    # a newer entry for the same version isn't checked again
+    known.add_paper(make_entry(1, "2021-01-02T00:00:00"))
+    assert len(queue) == 0
+    known.add_paper(make_entry(2, "2021-02-01T00:00:00"))
+    assert queue.take(5) == [("1111.1111", 2)]
+    known.add_paper(make_entry(3, "2021-03-01T00:00:00"))
+    # same acknowledgements, so no change
+    with unittest.mock.patch('next_papers.check_paper',
+                             return_value=(True, "aaaa")) as check:
+        assert known.reclassify_revised() == []
+    check.assert_called_once_with("1111.1111", None, 3)
+    assert "1111.1111" in known.ids_not_next
+    # the new version thanks NExT
+    known.add_paper(make_entry(4, "2021-04-01T00:00:00"))
+    with unittest.mock.patch('next_papers.check_paper',
+                             return_value=(True, "bbbb")):
+        assert known.reclassify_revised(budget=0) == []
+        assert known.reclassify_revised() == [("1111.1111", False, True)]
+    assert "1111.1111" in known.ids_is_next
+    assert "1111.1111" not in known.ids_not_next
+    entry = known.is_next["Gamgee:2021"]
+    assert entry.fields["eprint"] == "1111.1111v4"
+    assert entry.fields["ack_hash"] == "bbbb"
+    known.save()
+    assert len(latex_bib.Bibliography(prefix + "is_NExT.bib")) == 1
+    assert len(latex_bib.Bibliography(prefix + "not_NExT.bib")) == 0
+    for name in os.listdir("."):  # clean up
+        if name.startswith(prefix):
+            os.remove(name)
+
+
+def test_acknowledgement_hash():
+    hash_of = next_papers.acknowledgement_hash
+    # only the acknowledgments count, when they can be found
+    assert hash_of(["Acknowledgments We thank STFC", "Intro"]) == \
+        hash_of(["Acknowledgments We thank STFC", "A new intro"])
+    assert hash_of(["Acknowledgments We thank STFC", "Intro"]) != \
+        hash_of(["Acknowledgments We thank the NExT Institute", "Intro"])
+    # without them the compact patterns look at everything
+    assert hash_of(["Funded by STFC", "Intro"]) != \
+        hash_of(["Funded by the NExT Institute", "Intro"])
+    assert hash_of(["Funded by STFC", "Intro"]) == \
+        hash_of(["Funded  by STFC", "Intro"])
@@ -0,0 +1,84 @@
+import simulate
+import tools
+import metrics
+import next_papers
+import io
+import os
+import logging
+import unittest.mock
+
+
+def test_VirtualClock():
+    clock = simulate.VirtualClock()
+    start = clock.monotonic()
+    clock.sleep(100)
+    assert clock.monotonic() - start >= 100
+    limiter = tools.RateLimiter(default_period=20, clock=clock)
+    assert limiter.wait("a.b") == 0
+    assert limiter.wait("a.b") > 19
+    assert limiter.wait("c.d") == 0
+    # these share a limit
+    assert limiter.wait("arxiv.org") == 0
+    assert limiter.wait("export.arxiv.org") > 19
+
+
+def test_ArxivStandIn():
+    authors, papers = simulate.make_graph(5, 12, seed=1)
+    server = simulate.ArxivStandIn(papers)
+    _, _, body = server.respond("/api/query?search_query=au:Author0001,&B&start=0")
+    assert body.count(b"<entry>") == sum("B. Author0001" in paper.authors
+                                         for paper in papers)
+    status, _, body = server.respond(f"/pdf/{papers[0].arxiv_id}.pdf")
+    assert status == 200 and body.startswith(b"%PDF")
+    assert server.respond("/pdf/0000.00000.pdf")[0] == 404
+    server.server_close()
+
+
+def test_simulate():
+    handlers = list(logging.getLogger().handlers)
+    enabled = metrics.METRICS.enabled
+    report = simulate.simulate(n_authors=8, n_papers=20, next_fraction=0.5)
+    # the logging and metrics of this process are left as they were
+    assert logging.getLogger().handlers == handlers
+    assert metrics.METRICS.enabled == enabled
+    assert report["metrics"]
+    # everything is reachable from the seed authors in this graph
+    assert report["papers_found"] == report["next_papers_reachable"]
+    assert report["pdf_requests"] == 20
+    # each request waits 20 seconds
+    n_requests = report["api_requests"] + report["pdf_requests"]
+    assert report["rate_limit_sleep"] >= 20 * (n_requests - 1) - 1
+    assert report["real_time"] < report["rate_limit_sleep"]
+    # everything is put back
+    assert next_papers.ARXIV_API_URL.startswith("http://export.arxiv.org")
+    assert tools.RATE_LIMITER.clock is simulate.time
+
+
+def test_recording():
+    recorded_dir = "temp_recorded"
+    os.mkdir(recorded_dir)
+    responses = {"https://export.arxiv.org/api/query?search_query=au:Gamgee,&S":
+                 b"<feed>Samwise</feed>",
+                 "https://arxiv.org/pdf/2101.00001v1.pdf": b"%PDF potatoes"}
+
+    def fake_request(url, out_file=None, max_bytes=None, retries=None):
+        return responses[url]
+    try:
+        with unittest.mock.patch('tools.request_url', new=fake_request):
+            with simulate.recording(recorded_dir):
+                out_file = io.BytesIO()
+                tools.request_url("https://arxiv.org/pdf/2101.00001v1.pdf",
+                                  out_file)
+                assert out_file.getvalue() == b"%PDF potatoes"
+                tools.request_url("https://export.arxiv.org/api/query?" +
+                                  "search_query=au:Gamgee,&S")
+        # the stand in serves them back
+        with simulate.stand_in([], recorded_dir) as server:
+            for url, body in responses.items():
+                path = url.split(".org/", 1)[1]
+                assert tools.request_url(server.base_url + path) == body
+            assert server.requests == {"api": 1, "pdf": 1}
+    finally:
+        for name in os.listdir(recorded_dir):  # clean up
+            os.remove(os.path.join(recorded_dir, name))
+        os.rmdir(recorded_dir)
@@ -0,0 +1,167 @@
+import sort_citations
+import latex_bib
+import unittest.mock
+import os
+
+
+def mock_query(search_pattern, out_tags=None, records=None):
+    if "10.1103/physrevlett.105.022001" in search_pattern:
+        return [{"system_control_number": {"institute": "INSPIRETeX",
+                                           "value": "Gallicchio:2010sw"}}]
+    return []
+
+
+def test_get_inspire_key():
+    file_name = "temp_inspire.json"
+    try:
+        check_get_inspire_key(file_name)
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)  # clean up
+
+
+def check_get_inspire_key(file_name):
+    sample = latex_bib.Bibliography("test/sample.bib")
+    cache = sort_citations.InspireCache(file_name)
+    with unittest.mock.patch('sort_citations.query_inspire',
+                             new=mock_query):
+        found = sort_citations.resolve_inspire_keys(sample, cache, workers=2)
+    assert found["Gallicchio_2010"] == ("Gallicchio:2010sw", {})
+    assert isinstance(found["chakraborty2020revisiting"], ValueError)
+    # hits and misses are remembered
+    cache = sort_citations.InspireCache(file_name)
+    assert cache.get("doi:10.1103/physrevlett.105.022001")["key"] == \
+        "Gallicchio:2010sw"
+    assert cache.get("eprint:2008.02499")["key"] is None
+
+    def no_query(*args):
+        raise AssertionError("Shouldn't need to ask INSPIRE")
+    with unittest.mock.patch('sort_citations.query_inspire', new=no_query):
+        found = sort_citations.resolve_inspire_keys(sample, cache)
+        key, _ = sort_citations.get_inspire_key(sample["Gallicchio_2010"],
+                                                cache=cache)
+    assert key == "Gallicchio:2010sw"
+    assert isinstance(found["chakraborty2020revisiting"], ValueError)
+
+
+def test_batch_resolve():
+    sample = latex_bib.Bibliography("test/sample.bib")
+    searches = []
+
+    def batch_query(search_pattern, out_tags=None, records=None):
+        searches.append(search_pattern)
+        assert "primary_report_number" in out_tags
+        if " or " in search_pattern:
+            # enough records asked for to see every term
+            assert records >= search_pattern.count(" or ") + 1
+            return [{"system_control_number": [{"institute": "INSPIRETeX",
+                                                "value": "Chakraborty:2020hqs"}],
+                     "primary_report_number": "arXiv:2008.02499"},
+                    {"system_control_number": {"institute": "INSPIRETeX",
+                                               "value": "Gallicchio:2010sw"},
+                     "doi": ["10.1103/PhysRevLett.105.022001"]}]
+        return []
+    with unittest.mock.patch('sort_citations.query_inspire', new=batch_query):
+        found = sort_citations.batch_resolve(sample)
+    assert len(searches) == 1
+    assert found["Gallicchio_2010"][0] == "Gallicchio:2010sw"
+    assert found["chakraborty2020revisiting"][0] == "Chakraborty:2020hqs"
+
+    # a term the batch doesn't match is left to the single searches
+    cache = sort_citations.InspireCache()
+    searches.clear()
+    with unittest.mock.patch('sort_citations.query_inspire',
+                             new=mock_query_logged(searches)):
+        found = sort_citations.batch_resolve(sample, cache)
+    assert found["Gallicchio_2010"] == ("Gallicchio:2010sw", {})
+    assert any(" or " not in search and "doi" in search for search in searches)
+    assert cache.get("doi:10.1103/physrevlett.105.022001")["key"] == \
+        "Gallicchio:2010sw"
+
+
+def mock_query_logged(searches):
+    """Like mock_query, but the batch finds nothing"""
+    def query(search_pattern, out_tags=None, records=None):
+        searches.append(search_pattern)
+        if " or " in search_pattern:
+            return []
+        return mock_query(search_pattern, out_tags)
+    return query
+
+
+def test_get_ordered_citations():
+    os.makedirs("temp_project", exist_ok=True)
+    with open("temp_project/main.aux", 'w') as aux_file:
+        aux_file.write("\\abx@aux@cite{b}\n\\abx@aux@cite{0}{a}\n" +
+                       "\\@input{chapter.aux}\n\\abx@aux@cite{b}\n")
+    with open("temp_project/chapter.aux", 'w') as aux_file:
+        aux_file.write("\\citation{c,a}\n\\citation{d}\n")
+    found = sort_citations.get_ordered_citations("temp_project/main.aux")
+    assert found == ["b", "a", "c", "d"]
+    os.remove("temp_project/main.aux")  # clean up
+    os.remove("temp_project/chapter.aux")
+    os.rmdir("temp_project")
+
+
+def test_update_bib_keys_in_project():
+    os.makedirs("temp_project", exist_ok=True)
+    with open("temp_project/main.tex", 'w') as tex_file:
+        tex_file.write("See \\cite{a, b} and \\citep[p.~4]{c}.\n" +
+                       "\\input{chapter}\n\\autocite[see][]{a}\\nocite{*}\n" +
+                       "% \\input{old} \\cite{a}\n50\\% \\cites(see)()[p.~2]{a,b}{c}")
+    os.chmod("temp_project/main.tex", 0o644)
+    with open("temp_project/chapter.tex", 'w') as tex_file:
+        tex_file.write("\\textcite{b}\\citet*{d,a}\n" +
+                       "\\Cites[p.~1]{a}{b}\\Parencite{c}\\Cite{a}")
+    updated = {"a": "A:2020", "b": "B:2021", "c": "C:2019"}
+    done = sort_citations.update_bib_keys_in_project("temp_project/main.tex",
+                                                     updated, in_place=True)
+    assert len(done) == 2
+    with open("temp_project/main.tex", 'r') as tex_file:
+        text = tex_file.read()
+    assert text == ("See \\cite{A:2020, B:2021} and \\citep[p.~4]{C:2019}.\n" +
+                    "\\input{chapter}\n\\autocite[see][]{A:2020}\\nocite{*}\n" +
+                    "% \\input{old} \\cite{a}\n" +
+                    "50\\% \\cites(see)()[p.~2]{A:2020,B:2021}{C:2019}")
+    # rewriting in place keeps the permissions
+    assert os.stat("temp_project/main.tex").st_mode & 0o777 == 0o644
+    with open("temp_project/chapter.tex", 'r') as tex_file:
+        assert tex_file.read() == ("\\textcite{B:2021}\\citet*{d,A:2020}\n" +
+                                   "\\Cites[p.~1]{A:2020}{B:2021}" +
+                                   "\\Parencite{C:2019}\\Cite{A:2020}")
+    os.remove("temp_project/main.tex")  # clean up
+    os.remove("temp_project/chapter.tex")
+    os.rmdir("temp_project")
+
+
+def test_sort_project():
+    os.makedirs("temp_project", exist_ok=True)
+    with open("temp_project/main.tex", 'w') as tex_file:
+        tex_file.write("\\cite{chakraborty2020revisiting}\\cite{Gallicchio_2010}")
+    with open("temp_project/main.aux", 'w') as aux_file:
+        aux_file.write("\\citation{chakraborty2020revisiting}\n" +
+                       "\\citation{Gallicchio_2010}\n")
+    with open("test/sample.bib", 'r') as bib_file:
+        with open("temp_project/refs.bib", 'w') as new_bib_file:
+            new_bib_file.write(bib_file.read())
+
+    def batch_query(search_pattern, out_tags=None, records=None):
+        if "physrevlett.105.022001" in search_pattern.lower():
+            return [{"system_control_number": {"institute": "INSPIRETeX",
+                                               "value": "Gallicchio:2010sw"},
+                     "doi": ["10.1103/PhysRevLett.105.022001"]}]
+        return []
+    with unittest.mock.patch('sort_citations.query_inspire', new=batch_query):
+        done = sort_citations.sort_project("temp_project/main.tex",
+                                           "temp_project/refs.bib")
+    assert len(done) == 1
+    with open("temp_project/main.tex.sorted", 'r') as tex_file:
+        text = tex_file.read()
+    assert "\\cite{Gallicchio:2010sw}" in text
+    assert "chakraborty2020revisiting" not in text  # given a made up key
+    sorted_bib = latex_bib.Bibliography("temp_project/refs.bib.sorted")
+    assert "Gallicchio:2010sw" in sorted_bib.keys()
+    for name in ["main.tex", "main.tex.sorted", "main.aux",
+                 "refs.bib", "refs.bib.sorted"]:
+        os.remove("temp_project/" + name)  # clean up
+    os.rmdir("temp_project")
@@ -0,0 +1,136 @@
+import text_corpus
+import next_papers
+import institutes
+import latex_bib
+import simulate
+import mmap
+import unittest.mock
+import os
+
+
+def test_split_arxiv_version():
+    assert text_corpus.split_arxiv_version("2008.02499v2") == ("2008.02499", 2)
+    assert text_corpus.split_arxiv_version("2008.02499") == ("2008.02499", None)
+    assert text_corpus.split_arxiv_version("solv-int/9901001v1") == \
+        ("solv-int/9901001", 1)
+    assert text_corpus.split_arxiv_version("solv-int/9901001") == \
+        ("solv-int/9901001", None)
+
+
+def test_TextCorpus():
+    file_path = "temp_corpus"
+    corpus = text_corpus.TextCorpus(file_path)
+    assert len(corpus) == 0
+    corpus.add("1111.1111", ["last page", "first page"], 1)
+    corpus.add("1111.1112", ["only page"])
+    corpus.add("1111.1111", ["new last page", "first page"], 2)
+    assert "1111.1111" in corpus
+    assert "2222.2222" not in corpus
+    assert corpus.versions("1111.1111") == [1, 2]
+    assert corpus.get("1111.1111") == ["new last page", "first page"]
+    assert corpus.get("1111.1111", 1) == ["last page", "first page"]
+    assert corpus.get("1111.1112") == ["only page"]
+
+    # we can read what we wrote
+    reread = text_corpus.TextCorpus(file_path)
+    assert len(reread) == 3
+    records = reread.records()
+    assert [r[0] for r in records] == ["1111.1112", "1111.1111"]
+    data_path = reread.data_path
+    arxiv_id, version, offset, length = records[1]
+    assert version == 2
+    assert text_corpus.read_record(data_path, offset, length) == \
+        ["new last page", "first page"]
+
+    # a record without it's data is ignored
+    with open(corpus.index_path, 'a') as index_file:
+        index_file.write("3333.3333##100000#10\n")
+    reread = text_corpus.TextCorpus(file_path)
+    assert len(reread) == 3
+    os.remove(corpus.data_path)  # clean up
+    os.remove(corpus.index_path)
+
+
+def test_reclassify():
+    prefix = "temp_reclassify_"
+    known = next_papers.KnownPapers(prefix + "is_NExT.bib",
+                                    prefix + "not_NExT.bib")
+    corpus = text_corpus.TextCorpus(prefix + "text_corpus")
+    for arxiv_id, is_next, pages in [
+            ("1111.1111", True, ["We thank the NExT Institute", "Hello"]),
+            ("2222.2222", False, ["We thank STFC for grant ST/T000775/1",
+                                  "Hello"])]:
+        entry = latex_bib.BibEntry({"author": "Samwise Gamgee",
+                                    "year": "2021", "eprint": arxiv_id},
+                                   key=f"Gamgee:{arxiv_id}")
+        with unittest.mock.patch('next_papers.check_paper',
+                                 return_value=(is_next, "aaaa")):
+            known.add_paper(entry)
+        corpus.add(arxiv_id, pages)
+    known.save()
+    assert next_papers.reclassify(prefix, workers=1) == []
+    # a new rule, that only the second paper matches
+    stfc_rules = institutes.RuleSet(
+        {"NExT": {"patterns": ["STFC"], "compact_patterns": []}})
+    changes = next_papers.reclassify(prefix, workers=1, rule_set=stfc_rules)
+    assert sorted(changes) == [("1111.1111", True, False),
+                               ("2222.2222", False, True)]
+    for name in os.listdir("."):  # clean up
+        if name.startswith(prefix):
+            os.remove(name)
+    # pages are kept as extracted, so rules can use the grant numbers
+    scanned_pages = []
+    next_papers.check_pages_for_next(["for grant ST/T000775/1"], scanned_pages)
+    assert scanned_pages == ["for grant ST/T000775/1"]
+
+
+class FakePage:
+    def __init__(self, text):
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+    def close(self):
+        pass
+
+
+def test_check_paper_keeps_every_page():
+    file_path = "temp_paper_corpus"
+    corpus = text_corpus.TextCorpus(file_path)
+    pdf_object = unittest.mock.MagicMock()
+    pdf_object.__enter__.return_value.pages = [
+        FakePage("Introduction, 1 2 3"), FakePage("Method"),
+        FakePage("We thank the NExT Institute")]
+    with unittest.mock.patch('next_papers.get_paper_pdf',
+                             return_value=pdf_object):
+        is_next, _ = next_papers.check_paper("1111.1111", corpus)
+    assert is_next
+    # the scan stopped on the last page, but the whole paper is saved
+    assert corpus.get("1111.1111") == ["We thank the NExT Institute",
+                                       "Method", "Introduction, 1 2 3"]
+    os.remove(corpus.data_path)  # clean up
+    os.remove(corpus.index_path)
+
+
+def test_get_paper_pdf():
+    pdf_bytes = simulate.make_pdf(["Introduction", "Method",
+                                   "We thank the NExT Institute"])
+
+    def fake_request(url, out_file, max_bytes):
+        out_file.write(pdf_bytes)
+        return len(pdf_bytes)
+    # small PDFs are read from memory, large ones mapped from disk
+    for spool_bytes, mapped in [(len(pdf_bytes) + 1, False),
+                                (len(pdf_bytes) // 2, True)]:
+        with unittest.mock.patch('tools.request_url', new=fake_request), \
+                unittest.mock.patch('next_papers.PDF_SPOOL_BYTES', new=spool_bytes), \
+                unittest.mock.patch('mmap.mmap', wraps=mmap.mmap) as map_file:
+            with next_papers.get_paper_pdf("1111.1111") as pdf_object:
+                texts = list(next_papers.iter_page_texts(pdf_object))
+                # the page budget counts from the back
+                assert list(next_papers.iter_page_texts(pdf_object, 2)) == \
+                    texts[:2]
+        assert map_file.called == mapped
+        assert texts == ["We thank the NExT Institute", "Method",
+                         "Introduction"]
@@ -2,6 +2,12 @@ import tools
 import os
 import datetime
 import unittest.mock
+import io
+import gzip
+import threading
+import http.server
+import urllib.error
+import email.message
 
 
 class PretendReadable:
@@ -11,15 +17,17 @@ class PretendReadable:
         return text
 
 
-def mock_open(url):
-    return PretendReadable()
+def mock_fetch(url, out_file, max_bytes=None):
+    data = PretendReadable().read()
+    out_file.write(data)
+    return tools.Response(url, 200, {}, len(data), tools.Timings(0, 0, 0))
 
 
 def test_requesturl():
     # while nice in theory this url is too unrelyable to use in a unti test
     time_url = "http://worldtimeapi.org/api/timezone/Europe/London.txt"
     # the key thing is that if we spam the url link twice it should wait 20s between calls
-    with unittest.mock.patch('urllib.request.urlopen', new=mock_open):
+    with unittest.mock.patch('tools.HTTP_POOL.fetch', new=mock_fetch):
         data1 = tools.request_url(time_url).decode()
         data2 = tools.request_url(time_url).decode()
     line_start = "datetime: "
@@ -102,3 +110,125 @@ def test_check_braces_match():
     assert tools.check_braces_match("\\{}") == -1
     assert tools.check_braces_match("{{}") == 1
 
+
+class GzipHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep alive
+    data = b"0123456789" * 1000
+
+    def do_GET(self):
+        if self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "/data")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.data
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_ConnectionPool():
+    server = http.server.HTTPServer(("127.0.0.1", 0), GzipHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    pool = tools.ConnectionPool(timeout=5)
+    try:
+        out_file = io.BytesIO()
+        response = pool.fetch(url + "data", out_file)
+        assert out_file.getvalue() == GzipHandler.data
+        assert response.size == len(GzipHandler.data)
+        assert response.timings.connect >= 0
+        # the connection is kept for the next request
+        assert len(pool._idle[("http", f"127.0.0.1:{server.server_port}")]) == 1
+        out_file = io.BytesIO()
+        response = pool.fetch(url + "moved", out_file)
+        assert response.url == url + "data"
+        assert out_file.getvalue() == GzipHandler.data
+        try:
+            pool.fetch(url + "data", io.BytesIO(), max_bytes=100)
+            assert False, "Should have raised ValueError"
+        except ValueError:
+            pass
+    finally:
+        pool.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_is_transient():
+    headers = email.message.Message()
+    error = urllib.error.HTTPError("http://a.b", 503, "", headers, None)
+    assert tools.is_transient(error)
+    error = urllib.error.HTTPError("http://a.b", 404, "", headers, None)
+    assert not tools.is_transient(error)
+    assert tools.is_transient(ConnectionResetError())
+    assert not tools.is_transient(ValueError())
+
+
+def test_backoff_delay():
+    headers = email.message.Message()
+    error = urllib.error.HTTPError("http://a.b", 503, "", headers, None)
+    assert tools.backoff_delay(error, 0) == tools.BACKOFF_BASE
+    assert tools.backoff_delay(error, 1) == 2 * tools.BACKOFF_BASE
+    assert tools.backoff_delay(error, 100) == tools.BACKOFF_CAP
+    headers["Retry-After"] = "1000"
+    assert tools.backoff_delay(error, 0) == 1000
+    assert tools.retry_after(error) == 1000
+    headers.replace_header("Retry-After", "Wed, 21 Oct 2015 07:28:00 GMT")
+    assert tools.retry_after(error) == 0
+
+
+def test_ResponseCache():
+    cache = tools.ResponseCache(max_items=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")  # b is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == b"3"
+    assert cache.hits == 2
+    fetched = []
+
+    def counting_fetch(url, out_file, max_bytes=None):
+        fetched.append(url)
+        return mock_fetch(url, out_file, max_bytes)
+    with unittest.mock.patch('tools.HTTP_POOL.fetch', new=counting_fetch), \
+            unittest.mock.patch('tools.RATE_LIMITER',
+                                new=tools.RateLimiter(default_period=0)), \
+            unittest.mock.patch('tools.RESPONSE_CACHE', new=cache):
+        first = tools.request_url("http://a.b/page")
+        assert tools.request_url("http://a.b/page") == first
+        # streamed responses aren't kept
+        tools.request_url("http://a.b/page.pdf", out_file=io.BytesIO())
+        tools.request_url("http://a.b/page.pdf", out_file=io.BytesIO())
+    assert fetched == ["http://a.b/page"] + ["http://a.b/page.pdf"]*2
+
+
+class StoppedClock:
+    """Time only moves when something sleeps"""
+    def __init__(self):
+        self.now = 0.
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_RateLimiter():
+    limiter = tools.RateLimiter(default_period=20, clock=StoppedClock())
+    assert limiter.wait("inspirehep.net") == 0
+    assert limiter.wait("inspirehep.net") == 1
+    # the api and the pdfs are both arXiv, so share one slot
+    assert limiter.wait("arxiv.org") == 0
+    assert limiter.wait("export.arxiv.org") == 20
@@ -0,0 +1,117 @@
+import os
+import zlib
+import logging
+from tools import LOGLEVEL
+
+
+def split_arxiv_version(eprint):
+    """Split an eprint like 2008.02499v2 into ("2008.02499", 2).
+    The version is None if the eprint doesn't have one."""
+    eprint = eprint.strip()
+    arxiv_id, sep, version = eprint.rpartition('v')
+    if sep and version.isdigit() and arxiv_id:
+        return arxiv_id, int(version)
+    return eprint, None
+
+
+class TextCorpus:
+    """Append only store of the text extracted from each paper,
+    so papers can be classified again without downloading them.
+
+    Each record is the zlib compressed text of every page, as extracted
+    from the PDF (up to next_papers.MAX_PDF_PAGES), in the order they were
+    scanned (back to front), joined by page_sep.
+    The records live in one data file, and an index file gives
+    the offset and length of each record."""
+    field_sep = "#"
+    page_sep = "\f"
+
+    def __init__(self, file_path):
+        self.data_path = file_path + ".dat"
+        self.index_path = file_path + ".idx"
+        # key is (arxiv_id, version), value is (offset, length)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            self.__parse_index()
+
+    def __parse_index(self):
+        """Read the offsets of the existing records"""
+        data_size = os.path.getsize(self.data_path) \
+            if os.path.exists(self.data_path) else 0
+        with open(self.index_path, 'r') as index_file:
+            for line in index_file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                parts = line.split(self.field_sep)
+                if len(parts) != 4:
+                    logging.warning(f"Ignoring corrupt line in {self.index_path}; {line}")
+                    continue
+                arxiv_id, version, offset, length = parts
+                version = int(version) if version else None
+                offset, length = int(offset), int(length)
+                if offset + length > data_size:
+                    # the data for this record was never finished
+                    logging.warning(f"Ignoring truncated record for {arxiv_id}")
+                    continue
+                self.index[(arxiv_id, version)] = (offset, length)
+        logging.log(LOGLEVEL, f"In {self.index_path} found {len(self.index)} texts")
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, arxiv_id):
+        return any(key[0] == arxiv_id for key in self.index)
+
+    def versions(self, arxiv_id):
+        """The versions stored for an arxiv_id, oldest first"""
+        found = [version for (a_id, version) in self.index if a_id == arxiv_id]
+        return sorted(found, key=lambda v: -1 if v is None else v)
+
+    def add(self, arxiv_id, pages, version=None):
+        """Append the pages of text for a paper.
+        pages should be in the order they were scanned."""
+        text = self.page_sep.join(page.replace(self.page_sep, ' ')
+                                  for page in pages)
+        data = zlib.compress(text.encode(), 6)
+        with open(self.data_path, 'ab') as data_file:
+            offset = data_file.tell()
+            data_file.write(data)
+        # only index the record once the data is safely written
+        version_str = "" if version is None else str(version)
+        line = self.field_sep.join([arxiv_id, version_str,
+                                    str(offset), str(len(data))])
+        with open(self.index_path, 'a') as index_file:
+            index_file.write(line + "\n")
+        self.index[(arxiv_id, version)] = (offset, len(data))
+
+    def get(self, arxiv_id, version=None):
+        """Get the pages for a paper, by default the latest version"""
+        if version is None:
+            known = self.versions(arxiv_id)
+            if not known:
+                raise KeyError(arxiv_id)
+            version = known[-1]
+        offset, length = self.index[(arxiv_id, version)]
+        return read_record(self.data_path, offset, length)
+
+    def records(self):
+        """Tuples of (arxiv_id, version, offset, length) for the
+        latest version of every paper, in the order they were added"""
+        latest = {}
+        for (arxiv_id, version), (offset, length) in self.index.items():
+            previous = latest.get(arxiv_id)
+            if previous is None or (version or 0) >= (previous[1] or 0):
+                latest[arxiv_id] = (arxiv_id, version, offset, length)
+        return sorted(latest.values(), key=lambda record: record[2])
+
+
+def read_record(data_path, offset, length):
+    """Read the pages of one record directly from the data file"""
+    with open(data_path, 'rb') as data_file:
+        data_file.seek(offset)
+        data = data_file.read(length)
+    text = zlib.decompress(data).decode()
+    if not text:
+        return []
+    return text.split(TextCorpus.page_sep)
@@ -1,26 +1,355 @@
-import urllib
-import ratelimit
+import io
+import functools
+import os
+import tempfile
+import time
+import zlib
+import threading
+import collections
+import urllib.error
+import urllib.parse
 import datetime
+import socket
+from metrics import METRICS
+from events import EVENTS
 import unicodedata
 import logging
-import ratelimit
 
 # make it possible to just see meessages from this module
 LOGLEVEL = logging.INFO + 1
+# bytes read at a time when streaming a response to a file
+CHUNK_SIZE = 64 * 1024
+
+# how long to wait on a connection before giving up, in seconds
+TIMEOUT = 60
+MAX_REDIRECTS = 5
+
+
+Timings = collections.namedtuple("Timings", ["connect", "ttfb", "transfer"])
+Response = collections.namedtuple("Response", ["url", "status", "headers",
+                                               "size", "timings"])
+
+
+class ConnectionPool:
+    """Keep alive connections, reused for each host.
+    Responses are requested gzip compressed and decompressed
+    as they are streamed in"""
+    def __init__(self, timeout=TIMEOUT, max_redirects=MAX_REDIRECTS):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        # key is (scheme, host, port), value is list of idle connections
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _acquire(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle[(scheme, netloc)]
+            if idle:
+                return idle.pop(), True
+        import http.client  # slow to import, so only loaded for requests
+        connection_class = http.client.HTTPSConnection if scheme == "https" \
+            else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def _release(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle[(scheme, netloc)].append(connection)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle.clear()
+
+    def fetch(self, url, out_file, max_bytes=None):
+        """Stream the body of url into out_file, following redirects.
+        Raises urllib.error.HTTPError for error statuses,
+        and ValueError if the body is longer than max_bytes"""
+        for _ in range(self.max_redirects + 1):
+            response = self._fetch_once(url, out_file, max_bytes)
+            if response.status in (301, 302, 303, 307, 308):
+                url = urllib.parse.urljoin(url, response.headers["Location"])
+                continue
+            if response.status >= 400:
+                raise urllib.error.HTTPError(url, response.status,
+                                             f"Status {response.status}",
+                                             response.headers, None)
+            return response
+        raise urllib.error.URLError(f"Too many redirects from {url}")
+
+    def _fetch_once(self, url, out_file, max_bytes):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        import http.client  # slow to import, so only loaded for requests
+        headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        connection, reused = self._acquire(parts.scheme, parts.netloc)
+        start = time.perf_counter()
+        try:
+            if connection.sock is None:
+                connection.connect()
+            connected = time.perf_counter()
+            connection.request("GET", path, headers=headers)
+            http_response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            connection.close()
+            if not reused:
+                raise
+            # the server dropped an idle connection, try a fresh one
+            return self._fetch_once(url, out_file, max_bytes)
+        except Exception:
+            connection.close()
+            raise
+        first_byte = time.perf_counter()
+        try:
+            if http_response.status >= 300:
+                http_response.read()  # discard the body
+                size = 0
+            else:
+                size = self._read_body(url, http_response, out_file, max_bytes)
+        except Exception:
+            connection.close()
+            raise
+        done = time.perf_counter()
+        if http_response.will_close:
+            connection.close()
+        else:
+            self._release(parts.scheme, parts.netloc, connection)
+        timings = Timings(connected - start, first_byte - connected,
+                          done - first_byte)
+        return Response(url, http_response.status, http_response.headers,
+                        size, timings)
+
+    @staticmethod
+    def _read_body(url, http_response, out_file, max_bytes):
+        encoding = http_response.getheader("Content-Encoding", "").lower()
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) \
+            if encoding == "gzip" else None
+        written = 0
+        chunk = http_response.read(CHUNK_SIZE)
+        while chunk:
+            if decompressor is not None:
+                # cap the output, so a small download can't fill the memory
+                # (0 means no cap)
+                max_length = 0 if max_bytes is None else max_bytes + 1 - written
+                chunk = decompressor.decompress(chunk, max_length)
+            written += len(chunk)
+            if max_bytes is not None and written > max_bytes:
+                raise ValueError(f"Response from {url} is over {max_bytes} bytes")
+            out_file.write(chunk)
+            chunk = http_response.read(CHUNK_SIZE)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            written += len(chunk)
+            if max_bytes is not None and written > max_bytes:
+                raise ValueError(f"Response from {url} is over {max_bytes} bytes")
+            out_file.write(chunk)
+        return written
+
+
+# statuses that are worth asking again for
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# first wait before retrying, doubled for each attempt, in seconds
+BACKOFF_BASE = 20
+BACKOFF_CAP = 600
+# failed requests are retried this many times before giving up,
+# longer waits are left to the caller
+RETRIES = 3
+MAX_RETRY_WAIT = 300
+
+
+def is_transient(error):
+    """Could asking again reasonably be expected to work?"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in TRANSIENT_STATUSES
+    import http.client  # slow to import, so only loaded for requests
+    transient_types = (urllib.error.URLError, http.client.HTTPException,
+                       ConnectionError, socket.timeout, TimeoutError)
+    return isinstance(error, transient_types)
+
+
+def retry_after(error):
+    """Seconds asked for in a Retry-After header, or None"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        return None
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    import email.utils  # slow to import, and only needed here
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((when - now).total_seconds(), 0)
+
+
+def backoff_delay(error, attempt):
+    """How long to wait before attempt number attempt+1.
+    The server's Retry-After wins if it asks for longer"""
+    delay = min(BACKOFF_BASE * 2**attempt, BACKOFF_CAP)
+    asked = retry_after(error)
+    if asked is not None:
+        delay = max(delay, asked)
+    return delay
+
+
+HTTP_POOL = ConnectionPool()
+
 
 # 20 seconds is a bit over cautious
 # arxiv.org/robots.txt calls for 15
 # then again, getting stfc servers banned
 # from making arXiv api calls would be embarising for NExT
-@ratelimit.sleep_and_retry
-@ratelimit.limits(calls=1, period=20)
-def request_url(url):
-    """To ratelimit requests """
+DEFAULT_PERIOD = 20
+# seconds between requests for hosts that allow more,
+# INSPIRE asks for no more than 15 requests in 5 seconds
+HOST_PERIODS = {"old.inspirehep.net": 1,
+                "inspirehep.net": 1}
+# hosts that share the limit of another host
+SHARED_HOSTS = {"export.arxiv.org": "arxiv.org"}
+
+
+class RateLimiter:
+    """Space out the requests made to each host.
+    Each caller reserves the next free slot, then sleeps until it,
+    so it is safe to share between threads"""
+    def __init__(self, default_period=DEFAULT_PERIOD, host_periods=None,
+                 clock=time):
+        self.default_period = default_period
+        # anything with monotonic() and sleep(seconds), like the time module
+        self.clock = clock
+        self.host_periods = HOST_PERIODS if host_periods is None \
+            else host_periods
+        # key is host, value is time the next request can go
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def period(self, host):
+        return self.host_periods.get(host, self.default_period)
+
+    def wait(self, host):
+        """Block until a request can be made to host,
+        returns the time waited"""
+        host = SHARED_HOSTS.get(host, host)
+        with self._lock:
+            now = self.clock.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.period(host)
+        delay = slot - now
+        if delay > 0:
+            self.clock.sleep(delay)
+        return delay
+
+
+RATE_LIMITER = RateLimiter()
+
+
+def _limited_request(url, out_file=None, max_bytes=None):
+    host = urllib.parse.urlsplit(url).hostname
+    waited = RATE_LIMITER.wait(host)
+    METRICS.add_time("request_limiter_wait", waited)
+    logging.log(LOGLEVEL, f"Fetching {url}")
+    METRICS.count("requests")
+    if out_file is None:
+        buffer = io.BytesIO()
+        response = HTTP_POOL.fetch(url, buffer, max_bytes)
+    else:
+        response = HTTP_POOL.fetch(url, out_file, max_bytes)
+    connect, ttfb, transfer = response.timings
+    METRICS.add_time("request_connect", connect)
+    METRICS.add_time("request_ttfb", ttfb)
+    METRICS.add_time("request_transfer", transfer)
+    METRICS.count("request_bytes", response.size)
+    EVENTS.emit("request", host=host, wait=round(waited, 3),
+                status=response.status, bytes=response.size)
+    logging.log(LOGLEVEL, f"Got {response.size} bytes, connect={connect:.3f}s, " +
+                f"ttfb={ttfb:.3f}s, transfer={transfer:.3f}s")
+    if out_file is None:
+        return buffer.getvalue()
+    return response.size
+
+
+class ResponseCache:
+    """Bodies of responses kept in memory, so a URL asked for more than
+    once, by any of several crawls in one process, is only fetched once.
+    The least recently used are dropped after max_items"""
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self.hits = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            data = self._items.get(url)
+            if data is not None:
+                self._items.move_to_end(url)
+                self.hits += 1
+            return data
+
+    def put(self, url, data):
+        with self._lock:
+            self._items[url] = data
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+# set to a ResponseCache to share responses that aren't streamed to a file
+RESPONSE_CACHE = None
+
+
+def request_url(url, out_file=None, max_bytes=None, retries=None):
+    """To ratelimit requests.
+    If out_file is given the response is streamed into it,
+    and the number of bytes written is returned, otherwise the data is returned.
+    Responses longer than max_bytes raise a ValueError.
+    Transient failures are retried, waiting longer each time,
+    and every attempt waits its turn in the rate limit.
+    If RESPONSE_CACHE is set, a response that isn't streamed
+    to a file is taken from it when it can be"""
+    if retries is None:
+        retries = RETRIES
     # need to remove and extended ascii
     url = unicodedata.normalize("NFKD", url).encode("ascii", "ignore").decode()
-    logging.log(LOGLEVEL, f"Fetching {url}")
-    data = urllib.request.urlopen(url).read()
-    return data
+    cache = RESPONSE_CACHE if out_file is None else None
+    if cache is not None:
+        data = cache.get(url)
+        if data is not None:
+            METRICS.count("requests_cached")
+            return data
+    attempt = 0
+    while True:
+        try:
+            data = _limited_request(url, out_file, max_bytes)
+            if cache is not None:
+                cache.put(url, data)
+            return data
+        except Exception as error:
+            METRICS.count("request_failures")
+            EVENTS.emit("request_failed", url=url, error=f"{error}")
+            if attempt >= retries or not is_transient(error):
+                raise
+            delay = backoff_delay(error, attempt)
+            if delay > MAX_RETRY_WAIT:
+                raise  # leave it for the retry queue
+            logging.warning(f"Failed to fetch {url}, {error}, " +
+                            f"trying again in {delay}s")
+            RATE_LIMITER.clock.sleep(delay)
+            attempt += 1
+            if out_file is not None:
+                # start the response again
+                out_file.seek(0)
+                out_file.truncate()
 
 
 def alpha_only(text):
@@ -64,6 +393,7 @@ def locate_closing_brace(string, opening_location, closing_brace="}"):
     return -1
 
 
+@functools.lru_cache(maxsize=None)
 def month_to_numeric(month):
     if isinstance(month, int):
         return str(month)
@@ -89,3 +419,35 @@ def check_braces_match(latex_str):
     closing = latex_str.count("}") - latex_str.count("\\}")
     return opening - closing
 
+
+def write_atomic(file_path, text):
+    """Write text to a file, so that the file is either
+    completely old or completely new, even if we crash.
+    An existing file keeps its permissions"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    try:
+        mode = os.stat(file_path).st_mode
+    except FileNotFoundError:
+        # as open would make it, temporary files are only readable by us
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False,
+                                     suffix=".tmp") as temp_file:
+        temp_file.write(text)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+        temp_name = temp_file.name
+    try:
+        os.chmod(temp_name, mode & 0o7777)
+        os.replace(temp_name, file_path)
+    except Exception:
+        os.remove(temp_name)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # so the rename itself survives a crash
+        directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)